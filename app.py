@@ -1,8 +1,17 @@
-import openjij as oj
+import os
 import random
 
+import numpy as np
 
-def run_ikebana_qa_3d(
+from model_cache import ModelCache, catalog_key
+from qubo_model import QuboModel
+from solvers import SQASolver
+
+# Compiled base models, keyed by vase size, catalog, forced flower and front angles
+model_cache = ModelCache(maxsize=int(os.environ.get("IKEBANA_MODEL_CACHE_SIZE", 64)))
+
+
+def build_ikebana_qubo(
     W,
     H,
     flower_lengths,
@@ -10,7 +19,15 @@ def run_ikebana_qa_3d(
     forced_flower=None,
     front_azimuth=0,
     front_elevation=0,
+    sign_pref_m1=1,
 ):
+    """
+    Build the QUBO for run_ikebana_qa_3d as a QuboModel.
+
+    Every penalty term is a NumPy block broadcast over the candidate
+    length/angle arrays; `sign_pref_m1` fixes the left/right preference
+    of middle1 (middle2 gets the opposite sign).
+    """
     # Parameters & Limits
     LIM = 2 * (W + H)
 
@@ -27,317 +44,214 @@ def run_ikebana_qa_3d(
     flower_list = list(flower_lengths.keys())
 
     # Build Domain for Flower Length Choices
-    def build_domain():
-        domain = []
-        for flower in flower_list:
-            lengths = candidate_lengths[flower]
-            for cand_idx, length_val in enumerate(lengths):
-                domain.append((flower, cand_idx, length_val))
-        return domain
-
-    domain_main = build_domain()
-    domain_guest = build_domain()
-    domain_middle1 = build_domain()
-    domain_middle2 = build_domain()
-
-    n_ext_main = len(domain_main)
-    n_ext_guest = len(domain_guest)
-    n_ext_middle1 = len(domain_middle1)
-    n_ext_middle2 = len(domain_middle2)
-
-    # Initialize QUBO Matrix
-    Q = {}
-
-    def add_q(i, j, val):
-        if i > j:
-            i, j = j, i
-        Q[(i, j)] = Q.get((i, j), 0.0) + val
-
-    # Compute Variable Offsets
-    offset = 0
-    offset_main_az = offset
-    n_main_az = len(main_azimuth_candidates)
-    offset += n_main_az
-    offset_main_el = offset
-    n_main_el = len(main_elevation_candidates)
-    offset += n_main_el
-    offset_guest_az = offset
-    n_guest_az = len(guest_azimuth_candidates)
-    offset += n_guest_az
-    offset_guest_el = offset
-    n_guest_el = len(guest_elevation_candidates)
-    offset += n_guest_el
-
-    offset_middle1_az = offset
-    n_middle1_az = len(middle_azimuth_candidates)
-    offset += n_middle1_az
-    offset_middle1_el = offset
-    n_middle1_el = len(middle_elevation_candidates)
-    offset += n_middle1_el
-
-    offset_middle2_az = offset
-    n_middle2_az = len(middle_azimuth_candidates)
-    offset += n_middle2_az
-    offset_middle2_el = offset
-    n_middle2_el = len(middle_elevation_candidates)
-    offset += n_middle2_el
-
-    offset_ext_main = offset
-    offset += n_ext_main
-    offset_ext_guest = offset
-    offset += n_ext_guest
-    offset_ext_middle1 = offset
-    offset += n_ext_middle1
-    offset_ext_middle2 = offset
-    offset += n_ext_middle2
+    domain = []
+    for flower in flower_list:
+        lengths = candidate_lengths[flower]
+        for cand_idx, length_val in enumerate(lengths):
+            domain.append((flower, cand_idx, length_val))
+
+    dom_flowers = np.array([f for f, _, _ in domain], dtype=object)
+    dom_len = np.array([length for _, _, length in domain], dtype=float)
+    main_az = np.array(main_azimuth_candidates, dtype=float)
+    main_el = np.array(main_elevation_candidates, dtype=float)
+    mid_az = np.array(middle_azimuth_candidates, dtype=float)
+    mid_el = np.array(middle_elevation_candidates, dtype=float)
+
+    # Variable groups (offsets follow registration order)
+    model = QuboModel()
+    model.add_group("main_az", main_azimuth_candidates)
+    model.add_group("main_el", main_elevation_candidates)
+    model.add_group("guest_az", guest_azimuth_candidates)
+    model.add_group("guest_el", guest_elevation_candidates)
+    model.add_group("middle1_az", middle_azimuth_candidates)
+    model.add_group("middle1_el", middle_elevation_candidates)
+    model.add_group("middle2_az", middle_azimuth_candidates)
+    model.add_group("middle2_el", middle_elevation_candidates)
+    model.add_group("main", domain)
+    model.add_group("guest", domain)
+    model.add_group("middle1", domain)
+    model.add_group("middle2", domain)
 
     # One‐Hot Constraints
-    def add_strict_one_hot(offset, n, A=100.0):
-        for i in range(n):
-            idx_i = offset + i
-            add_q(idx_i, idx_i, A)  # ここで A を追加
-            # -2A * x_i を加える
-            add_q(idx_i, idx_i, -2 * A)
-            # 以下、ペアごとに 2A を加える
-            for j in range(i + 1, n):
-                idx_j = offset + j
-                add_q(idx_i, idx_j, 2 * A)
-
-    add_strict_one_hot(offset_main_az, n_main_az, 60)
-    add_strict_one_hot(offset_main_el, n_main_el, 60)
-    add_strict_one_hot(offset_guest_az, n_guest_az, 50)
-    add_strict_one_hot(offset_guest_el, n_guest_el, 50)
-    add_strict_one_hot(offset_middle1_az, n_middle1_az, 50)
-    add_strict_one_hot(offset_middle1_el, n_middle1_el, 50)
-    add_strict_one_hot(offset_middle2_az, n_middle2_az, 50)
-    add_strict_one_hot(offset_middle2_el, n_middle2_el, 50)
-    add_strict_one_hot(offset_ext_main, n_ext_main, 50)
-    add_strict_one_hot(offset_ext_guest, n_ext_guest, 50)
-    add_strict_one_hot(offset_ext_middle1, n_ext_middle1, 50)
-    add_strict_one_hot(offset_ext_middle2, n_ext_middle2, 50)
+    model.add_one_hot("main_az", 60)
+    model.add_one_hot("main_el", 60)
+    for name in (
+        "guest_az",
+        "guest_el",
+        "middle1_az",
+        "middle1_el",
+        "middle2_az",
+        "middle2_el",
+        "main",
+        "guest",
+        "middle1",
+        "middle2",
+    ):
+        model.add_one_hot(name, 50)
 
     # No‐Duplicate‐Flower Constraints
     penalty_same_flower = 50
-    for i, (f1, _, _) in enumerate(domain_main):
-        for j, (f2, _, _) in enumerate(domain_guest):
-            if f1 == f2:
-                add_q(
-                    offset_ext_main + i, offset_ext_guest + j, 2 * penalty_same_flower
-                )
-        for j, (f2, _, _) in enumerate(domain_middle1):
-            if f1 == f2:
-                add_q(
-                    offset_ext_main + i, offset_ext_middle1 + j, 2 * penalty_same_flower
-                )
-
-    for i, (f1, _, _) in enumerate(domain_guest):
-        for j, (f2, _, _) in enumerate(domain_middle1):
-            if f1 == f2:
-                add_q(
-                    offset_ext_guest + i,
-                    offset_ext_middle1 + j,
-                    2 * penalty_same_flower,
-                )
+    same_flower = (dom_flowers[:, None] == dom_flowers[None, :]).astype(float)
+    for b1, b2 in (("main", "guest"), ("main", "middle1"), ("guest", "middle1")):
+        model.add_quadratic(b1, b2, same_flower * 2 * penalty_same_flower)
 
     # Forced‐Flower Constraint
     if forced_flower is not None and forced_flower in flower_list:
         A_forced = 50
-        for i, (f, _, _) in enumerate(domain_main):
-            if f == forced_flower:
-                add_q(offset_ext_main + i, offset_ext_main + i, -A_forced)
-        for i, (f, _, _) in enumerate(domain_guest):
-            if f == forced_flower:
-                add_q(offset_ext_guest + i, offset_ext_guest + i, -A_forced)
-        for i, (f, _, _) in enumerate(domain_middle1):
-            if f == forced_flower:
-                add_q(offset_ext_middle1 + i, offset_ext_middle1 + i, -A_forced)
-        for i, (f, _, _) in enumerate(domain_middle2):
-            if f == forced_flower:
-                add_q(offset_ext_middle2 + i, offset_ext_middle2 + i, -A_forced)
+        forced = (dom_flowers == forced_flower) * -A_forced
+        for name in ("main", "guest", "middle1", "middle2"):
+            model.add_linear(name, forced)
 
     # Main branch length limit
     lambda_main_len = 1.0
-    for i, (f, cand_idx, length_val) in enumerate(domain_main):
-        if length_val > LIM:
-            cost = (length_val - LIM) ** 2
-            add_q(offset_ext_main + i, offset_ext_main + i, cost * lambda_main_len)
+    over = np.where(dom_len > LIM, (dom_len - LIM) ** 2, 0.0)
+    model.add_linear("main", over * lambda_main_len)
 
     # Guest branch proportional length
     lambda_guest_len = 1.0
-    for i, (_, _, length_m) in enumerate(domain_main):
-        for j, (_, _, length_g) in enumerate(domain_guest):
-            cost = (length_g - (length_m / 3.0)) ** 2
-            add_q(offset_ext_main + i, offset_ext_guest + j, cost * lambda_guest_len)
+    cost = (dom_len[None, :] - dom_len[:, None] / 3.0) ** 2
+    model.add_quadratic("main", "guest", cost * lambda_guest_len)
 
     # Main branch angle cost
     penalty_main_angle = 0.5
-    for i, az in enumerate(main_azimuth_candidates):
-        idx = offset_main_az + i
-        cost = (az) ** 2
-        add_q(idx, idx, cost * penalty_main_angle)
-    for i, el in enumerate(main_elevation_candidates):
-        idx = offset_main_el + i
-        cost = (el) ** 2
-        add_q(idx, idx, cost * penalty_main_angle)
+    model.add_linear("main_az", main_az**2 * penalty_main_angle)
+    model.add_linear("main_el", main_el**2 * penalty_main_angle)
 
     # Triangle‐shape angle constraint
     lambda_triangle = 10.0
     allowed_threshold = 45.0
-    for i, main_az in enumerate(main_azimuth_candidates):
-        for j, mid_az in enumerate(middle_azimuth_candidates):
-            diff = abs(mid_az - main_az)
-            if diff > allowed_threshold:
-                cost = (diff - allowed_threshold) ** 2
-                # 適用を両方の中間枝へ
-                add_q(offset_main_az + i, offset_middle1_az + j, cost * lambda_triangle)
-                add_q(offset_main_az + i, offset_middle2_az + j, cost * lambda_triangle)
+    diff = np.abs(mid_az[None, :] - main_az[:, None])
+    cost = np.where(diff > allowed_threshold, (diff - allowed_threshold) ** 2, 0.0)
+    # 適用を両方の中間枝へ
+    model.add_quadratic("main_az", "middle1_az", cost * lambda_triangle)
+    model.add_quadratic("main_az", "middle2_az", cost * lambda_triangle)
 
     lambda_side = 10.0
-    for j, middle_el in enumerate(middle_elevation_candidates):
-        if middle_el < -45:
-            cost = (-45 - middle_el) ** 2
-            add_q(offset_middle1_el + j, offset_middle1_el + j, cost * lambda_side)
-            add_q(offset_middle2_el + j, offset_middle2_el + j, cost * lambda_side)
-        elif middle_el > 45:
-            cost = (middle_el - 45) ** 2
-            add_q(offset_middle1_el + j, offset_middle1_el + j, cost * lambda_side)
-            add_q(offset_middle2_el + j, offset_middle2_el + j, cost * lambda_side)
+    cost = np.where(
+        mid_el < -45,
+        (-45 - mid_el) ** 2,
+        np.where(mid_el > 45, (mid_el - 45) ** 2, 0.0),
+    )
+    model.add_linear("middle1_el", cost * lambda_side)
+    model.add_linear("middle2_el", cost * lambda_side)
 
     # Middle branch shorter than main
     lambda_mid = 10.0
-    for i, (fM, cand_idx_m, length_m) in enumerate(domain_main):
-        for j, (fC, cand_idx_c, length_c) in enumerate(domain_middle1):
-            if length_c >= length_m:
-                penalty = (length_c - length_m) ** 2
-                add_q(offset_ext_main + i, offset_ext_middle1 + j, penalty * lambda_mid)
-        for j, (fC, cand_idx_c, length_c) in enumerate(domain_middle2):
-            if length_c >= length_m:
-                penalty = (length_c - length_m) ** 2
-                add_q(offset_ext_main + i, offset_ext_middle2 + j, penalty * lambda_mid)
+    diff = dom_len[None, :] - dom_len[:, None]
+    penalty = np.where(diff >= 0, diff**2, 0.0)
+    model.add_quadratic("main", "middle1", penalty * lambda_mid)
+    model.add_quadratic("main", "middle2", penalty * lambda_mid)
 
     # Reward for main branch near LIM
     lambda_main_reward = 0.01
-    for i, (f, cand_idx, length_val) in enumerate(domain_main):
-        if length_val <= LIM:
-            add_q(
-                offset_ext_main + i,
-                offset_ext_main + i,
-                (LIM - length_val) ** 2 * lambda_main_reward,
-            )
+    under = np.where(dom_len <= LIM, (LIM - dom_len) ** 2, 0.0)
+    model.add_linear("main", under * lambda_main_reward)
 
     # Encourage middle1 to go left/right and middle2 to go in the opposite direction
-    sign_pref_m1 = random.choice([-1, +1])
     sign_pref_m2 = -sign_pref_m1
 
     lam_sign = 45.0
-    for i, az in enumerate(middle_azimuth_candidates):
-        if sign_pref_m1 * az > 0:
-            add_q(offset_middle1_az + i, offset_middle1_az + i, -lam_sign)
-
-    for i, az in enumerate(middle_azimuth_candidates):
-        if sign_pref_m2 * az > 0:
-            add_q(offset_middle2_az + i, offset_middle2_az + i, -lam_sign)
+    model.add_linear("middle1_az", (sign_pref_m1 * mid_az > 0) * -lam_sign)
+    model.add_linear("middle2_az", (sign_pref_m2 * mid_az > 0) * -lam_sign)
 
     # Add penalties when any two branches have equal length
     penalty_equal_length = 45
-    branches = [
-        ("main", offset_ext_main, domain_main),
-        ("guest", offset_ext_guest, domain_guest),
-        ("middle1", offset_ext_middle1, domain_middle1),
-        ("middle2", offset_ext_middle2, domain_middle2),
-    ]
-
+    equal_length = (dom_len[:, None] == dom_len[None, :]) * penalty_equal_length
+    branches = ["main", "guest", "middle1", "middle2"]
     for b1_idx in range(len(branches)):
-        name1, off1, domain1 = branches[b1_idx]
         for b2_idx in range(b1_idx + 1, len(branches)):
-            name2, off2, domain2 = branches[b2_idx]
-            for i, cand1 in enumerate(domain1):
-                for j, cand2 in enumerate(domain2):
-                    length1 = cand1[2]
-                    length2 = cand2[2]
-                    if length1 == length2:
-                        add_q(off1 + i, off2 + j, penalty_equal_length)
+            model.add_quadratic(branches[b1_idx], branches[b2_idx], equal_length)
 
     #  Silver‐ratio penalty between middle1 & middle2
     lambda_silver = 5.0
     silver_ratio = 1.414
 
-    for i, (_, _, L_middle1) in enumerate(domain_middle1):
-        for j, (_, _, L_middle2) in enumerate(domain_middle2):
-            diff = L_middle2 - silver_ratio * L_middle1
-            penalty = lambda_silver * (diff) ** 2
-            add_q(offset_ext_middle1 + i, offset_ext_middle2 + j, penalty)
+    diff = dom_len[None, :] - silver_ratio * dom_len[:, None]
+    model.add_quadratic("middle1", "middle2", lambda_silver * diff**2)
 
-    #  Solve QUBO & Extract Solution
-    sampler = oj.SQASampler()
-    result = sampler.sample_qubo(Q, num_reads=20)
-    best = result.first
-    energy = best.energy
-    solution = best.sample
-
-    def get_choice(sol, off, n):
-        for i in range(n):
-            if sol.get(off + i, 0) == 1:
-                return i
-        return None
-
-    i_main_az = get_choice(solution, offset_main_az, n_main_az)
-    i_main_el = get_choice(solution, offset_main_el, n_main_el)
-    chosen_main_az = (
-        main_azimuth_candidates[i_main_az] if i_main_az is not None else None
-    )
-    chosen_main_el = (
-        main_elevation_candidates[i_main_el] if i_main_el is not None else None
-    )
+    return model
 
-    i_guest_az = get_choice(solution, offset_guest_az, n_guest_az)
-    i_guest_el = get_choice(solution, offset_guest_el, n_guest_el)
-    chosen_guest_az = (
-        guest_azimuth_candidates[i_guest_az] if i_guest_az is not None else None
-    )
-    chosen_guest_el = (
-        guest_elevation_candidates[i_guest_el] if i_guest_el is not None else None
-    )
 
-    i_middle1_az = get_choice(solution, offset_middle1_az, n_middle1_az)
-    i_middle1_el = get_choice(solution, offset_middle1_el, n_middle1_el)
-    chosen_middle1_az = (
-        middle_azimuth_candidates[i_middle1_az] if i_middle1_az is not None else None
-    )
-    chosen_middle1_el = (
-        middle_elevation_candidates[i_middle1_el] if i_middle1_el is not None else None
+def model_key(
+    W,
+    H,
+    flower_lengths,
+    candidate_lengths,
+    forced_flower=None,
+    front_azimuth=0,
+    front_elevation=0,
+):
+    """Cache key identifying every input of build_ikebana_qubo except the sign."""
+    return (
+        W,
+        H,
+        catalog_key(flower_lengths, candidate_lengths),
+        forced_flower,
+        front_azimuth,
+        front_elevation,
     )
 
-    i_middle2_az = get_choice(solution, offset_middle2_az, n_middle2_az)
-    i_middle2_el = get_choice(solution, offset_middle2_el, n_middle2_el)
-    chosen_middle2_az = (
-        middle_azimuth_candidates[i_middle2_az] if i_middle2_az is not None else None
-    )
-    chosen_middle2_el = (
-        middle_elevation_candidates[i_middle2_el] if i_middle2_el is not None else None
+
+def get_ikebana_models(
+    W,
+    H,
+    flower_lengths,
+    candidate_lengths,
+    forced_flower=None,
+    front_azimuth=0,
+    front_elevation=0,
+):
+    """
+    Return the compiled models for both middle1 sign preferences as a
+    dict {-1: model, +1: model}, building them only on a cache miss.
+    """
+    key = model_key(
+        W,
+        H,
+        flower_lengths,
+        candidate_lengths,
+        forced_flower,
+        front_azimuth,
+        front_elevation,
     )
 
-    i_ext_main = get_choice(solution, offset_ext_main, n_ext_main)
-    i_ext_guest = get_choice(solution, offset_ext_guest, n_ext_guest)
-    i_ext_middle1 = get_choice(solution, offset_ext_middle1, n_ext_middle1)
-    i_ext_middle2 = get_choice(solution, offset_ext_middle2, n_ext_middle2)
+    def build():
+        models = {}
+        for sign in (-1, +1):
+            model = build_ikebana_qubo(
+                W,
+                H,
+                flower_lengths,
+                candidate_lengths,
+                forced_flower=forced_flower,
+                front_azimuth=front_azimuth,
+                front_elevation=front_elevation,
+                sign_pref_m1=sign,
+            )
+            # Compile eagerly so cached models are ready for sampling
+            model.dense()
+            model.to_dict()
+            models[sign] = model
+        return models
 
-    chosen_main_flower, _, chosen_mainLen = (
-        domain_main[i_ext_main] if i_ext_main is not None else (None, None, None)
-    )
-    chosen_guest_flower, _, chosen_guestLen = (
-        domain_guest[i_ext_guest] if i_ext_guest is not None else (None, None, None)
-    )
-    chosen_middle1_flower, _, chosen_middle1Len = (
-        domain_middle1[i_ext_middle1]
-        if i_ext_middle1 is not None
-        else (None, None, None)
-    )
-    chosen_middle2_flower, _, chosen_middle2Len = (
-        domain_middle2[i_ext_middle2]
-        if i_ext_middle2 is not None
-        else (None, None, None)
-    )
+    return model_cache.get_or_build(key, build)
+
+
+def decode_ikebana_solution(model, solution, energy, flower_lengths):
+    """Turn a 0/1 sample vector of a base model into the /optimize payload."""
+
+    def chosen(name):
+        i = model.choice(solution, name)
+        return model.candidates(name)[i] if i is not None else None
+
+    def chosen_branch(name):
+        i = model.choice(solution, name)
+        return model.candidates(name)[i] if i is not None else (None, None, None)
+
+    chosen_main_flower, _, chosen_mainLen = chosen_branch("main")
+    chosen_guest_flower, _, chosen_guestLen = chosen_branch("guest")
+    chosen_middle1_flower, _, chosen_middle1Len = chosen_branch("middle1")
+    chosen_middle2_flower, _, chosen_middle2Len = chosen_branch("middle2")
 
     return {
         "energy": energy,
@@ -351,19 +265,129 @@ def run_ikebana_qa_3d(
         "guestLen": chosen_guestLen,
         "middle1Len": chosen_middle1Len,
         "middle2Len": chosen_middle2Len,
-        "mainAzimuth": chosen_main_az,
-        "mainElevation": chosen_main_el,
-        "guestAzimuth": chosen_guest_az,
-        "guestElevation": chosen_guest_el,
-        "middle1Azimuth": chosen_middle1_az,
-        "middle1Elevation": chosen_middle1_el,
-        "middle2Azimuth": chosen_middle2_az,
-        "middle2Elevation": chosen_middle2_el,
+        "mainAzimuth": chosen("main_az"),
+        "mainElevation": chosen("main_el"),
+        "guestAzimuth": chosen("guest_az"),
+        "guestElevation": chosen("guest_el"),
+        "middle1Azimuth": chosen("middle1_az"),
+        "middle1Elevation": chosen("middle1_el"),
+        "middle2Azimuth": chosen("middle2_az"),
+        "middle2Elevation": chosen("middle2_el"),
         "flowers": flower_lengths,
-        "Q": {str(k): v for k, v in Q.items()},
+        "Q": model.to_dict(),
     }
 
 
+def sample_ikebana_solutions(
+    W,
+    H,
+    flower_lengths,
+    candidate_lengths,
+    forced_flower=None,
+    front_azimuth=0,
+    front_elevation=0,
+    solver=None,
+):
+    """
+    Sample both sign variants and return the distinct arrangements that
+    satisfy every one-hot constraint, sorted by energy.
+    """
+    solver = solver or SQASolver()
+    models = get_ikebana_models(
+        W,
+        H,
+        flower_lengths,
+        candidate_lengths,
+        forced_flower=forced_flower,
+        front_azimuth=front_azimuth,
+        front_elevation=front_elevation,
+    )
+    solutions = []
+    seen = set()
+    for model in models.values():
+        samples, energies = solver.sample(model)
+        choices, _ = model.decode_samples(samples)
+        for r in model.distinct_solutions(samples, energies):
+            # Both sign variants share groups, so choices are comparable
+            if tuple(choices[r]) in seen:
+                continue
+            seen.add(tuple(choices[r]))
+            solutions.append(
+                decode_ikebana_solution(
+                    model, samples[r], float(energies[r]), flower_lengths
+                )
+            )
+    solutions.sort(key=lambda r: r["energy"])
+    return solutions
+
+
+def run_ikebana_qa_3d_top_k(
+    W,
+    H,
+    flower_lengths,
+    candidate_lengths,
+    forced_flower=None,
+    front_azimuth=0,
+    front_elevation=0,
+    k=5,
+    solver=None,
+):
+    """
+    Run the sampler once and return up to k distinct feasible arrangements
+    from its reads, best first. Each payload carries its own energy.
+    """
+    solver = solver or SQASolver()
+    models = get_ikebana_models(
+        W,
+        H,
+        flower_lengths,
+        candidate_lengths,
+        forced_flower=forced_flower,
+        front_azimuth=front_azimuth,
+        front_elevation=front_elevation,
+    )
+    model = models[random.choice([-1, +1])]
+
+    samples, energies = solver.sample(model)
+    return [
+        decode_ikebana_solution(model, samples[r], float(energies[r]), flower_lengths)
+        for r in model.distinct_solutions(samples, energies)[:k]
+    ]
+
+
+def run_ikebana_qa_3d(
+    W,
+    H,
+    flower_lengths,
+    candidate_lengths,
+    forced_flower=None,
+    front_azimuth=0,
+    front_elevation=0,
+    solver=None,
+):
+    """
+    Solve the base arrangement with `solver` (default: SQASolver with 20
+    reads) and return the payload for the lowest-energy read.
+    """
+    solver = solver or SQASolver()
+    models = get_ikebana_models(
+        W,
+        H,
+        flower_lengths,
+        candidate_lengths,
+        forced_flower=forced_flower,
+        front_azimuth=front_azimuth,
+        front_elevation=front_elevation,
+    )
+    model = models[random.choice([-1, +1])]
+
+    #  Solve QUBO & Extract Solution
+    samples, energies = solver.sample(model)
+    return decode_ikebana_solution(
+        model, samples[0], float(energies[0]), flower_lengths
+    )
+
+
 if __name__ == "__main__":
     flower_lengths = {
         "桜": 0.4,
@@ -2,160 +2,258 @@
 run_ikebana_extend_optimization:
   Extend an existing ikebana arrangement by optimizing two additional branches
   using QUBO via OpenJij.
+
+run_ikebana_full_optimization:
+  Solve the base arrangement and the two additional branches together in
+  one joint QUBO.
 """
 
-import openjij as oj
 import random
 
+import numpy as np
 
-def run_ikebana_extend_optimization(
-    base_assignments: dict,
+import app
+from qubo_model import QuboModel
+from solvers import SQASolver
+
+candidate_lengths = {
+    '紅梅': [40, 35, 30],
+    '啓扇桜':   [40, 35, 20],
+    "リアトリス": [40, 35, 30],
+    # "ディル": [40, 35, 20],
+}
+
+# Build domain (flower, idx, length)
+domain = []
+for flower, lengths in candidate_lengths.items():
+    for idx, length in enumerate(lengths):
+        domain.append((flower, idx, length))
+
+az_cands = [-70,-60,-50,50,60,70]
+el_cands = [15, 20, 21]
+
+base_keys = ['main', 'guest', 'middle1', 'middle2']
+
+lambda_len = 10.0
+lambda_ang = 1.0
+
+
+def length_cost(max_lengths) -> np.ndarray:
+    """cost[i, j]: penalty for domain length j when the main branch is max_lengths[i]."""
+    dom_len = np.array([length for _, _, length in domain], dtype=float)
+    max_len = np.asarray(max_lengths, dtype=float)[:, None]
+    return np.where(dom_len > max_len, (dom_len - max_len)**2, 0.0) * lambda_len
+
+
+def angle_cost(cands, base, threshold) -> np.ndarray:
+    """cost[i, j]: penalty for candidate j lying within `threshold` of base angle i."""
+    diff = np.abs(np.asarray(cands, dtype=float)[None, :] - np.asarray(base, dtype=float)[:, None])
+    return np.where(diff < threshold, (threshold-diff)**2, 0.0) * lambda_ang
+
+
+def add_extend_terms(model: QuboModel, sign_pref_m3: int) -> None:
+    """Add the middle3/middle4 groups and every term that does not depend on the base."""
+    dom_len = np.array([length for _, _, length in domain], dtype=float)
+    az = np.array(az_cands, dtype=float)
+
+    for role in ('middle3', 'middle4'):
+        model.add_group(f'{role}_az', az_cands)
+        model.add_group(f'{role}_el', el_cands)
+        model.add_group(role, domain)
+
+    # One-hot constraint: ensure exactly one selection per variable group
+    for role in ('middle3', 'middle4'):
+        for name in (f'{role}_az', f'{role}_el', role):
+            model.add_one_hot(name, 300.0)
+
+    # Sign preference bias: encourage middle3 and middle4 to point on opposite sides
+    sign_pref_m4 = -sign_pref_m3
+
+    lam_sign = 50.0
+    model.add_linear('middle3_az', (sign_pref_m3 * az > 0) * -lam_sign)
+    model.add_linear('middle4_az', (sign_pref_m4 * az > 0) * -lam_sign)
+
+    # Non-overlap penalty: prevent middle3 and middle4 from having the same angle
+    penalty_same = 100.0
+    model.add_quadratic('middle3_az', 'middle4_az', np.eye(len(az_cands)) * penalty_same)
+    model.add_quadratic('middle3_el', 'middle4_el', np.eye(len(el_cands)) * penalty_same)
+
+    # Equal-length penalty between middle3 and middle4
+    penalty_len_same = 80.0
+    same = (dom_len[:, None] == dom_len[None, :]) * penalty_len_same
+    model.add_quadratic('middle3', 'middle4', same)
+
+
+def build_extend_qubo(
     base_lengths: dict,
-    base_angles: dict
-) -> dict:
+    base_angles: dict,
+    sign_pref_m3: int = 1
+) -> QuboModel:
 
     """
     Args:
-        base_assignments: dict of selected flowers for main/guest/middle1/middle2
-        base_lengths: dict of their lengths
+        base_lengths: dict of the base branch lengths
         base_angles: dict of their azimuth/elevation angles
+        sign_pref_m3: side preferred by middle3 (middle4 gets the opposite)
 
     Returns:
-        dict with assignments, lengths, and angles for middle3 & middle4
+        QuboModel with groups middle3_az/_el, middle3, middle4_az/_el, middle4
     """
-    candidate_lengths = {
-        '紅梅': [40, 35, 30],
-        '啓扇桜':   [40, 35, 20],
-        "リアトリス": [40, 35, 30],
-        # "ディル": [40, 35, 20],
-    }
-
-    max_length = base_lengths['main']
+    model = QuboModel()
+    add_extend_terms(model, sign_pref_m3)
 
-    # Build domain (flower, idx, length)
-    domain = []
-    for flower, lengths in candidate_lengths.items():
-        for idx, length in enumerate(lengths):
-            domain.append((flower, idx, length))
-    n_dom = len(domain)
-
-    az_cands = [-70,-60,-50,50,60,70]
-    el_cands = [15, 20, 21]
-    n_az = len(az_cands)
-    n_el = len(el_cands)
+    # Penalty to prevent lengths from exceeding the main branch length
+    cost = length_cost([base_lengths['main']])[0]
+    model.add_linear('middle3', cost)
+    model.add_linear('middle4', cost)
 
-    off = 0
-    off3_az = off; off += n_az
-    off3_el = off; off += n_el
-    off3_dom = off; off += n_dom
-    off4_az = off; off += n_az
-    off4_el = off; off += n_el
-    off4_dom = off; off += n_dom
+    # Angle deviation penalty: discourage new branches too close to existing ones
+    az_cost = angle_cost(az_cands, [base_angles[f'{b}Azimuth'] for b in base_keys], 30).sum(axis=0)
+    el_cost = angle_cost(el_cands, [base_angles[f'{b}Elevation'] for b in base_keys], 15).sum(axis=0)
+    for role in ('middle3', 'middle4'):
+        model.add_linear(f'{role}_az', az_cost)
+        model.add_linear(f'{role}_el', el_cost)
 
-    # Construct QUBO matrix Q
-    Q = {}
+    return model
 
-    def add_q(i, j, v):
-        if i > j:
-            i, j = j, i
-        Q[(i, j)] = Q.get((i, j), 0.0) + v
 
-    # One-hot constraint: ensure exactly one selection per variable group
-    def one_hot(offset, count, A=300.0):
-        for i in range(count):
-            idx = offset + i
-            add_q(idx, idx, A)   
-            add_q(idx, idx, -2*A) 
-            for j in range(i+1, count):
-                add_q(idx, offset+j, 2*A)
-
-    one_hot(off3_az, n_az)
-    one_hot(off3_el, n_el)
-    one_hot(off3_dom, n_dom)
-    one_hot(off4_az, n_az)
-    one_hot(off4_el, n_el)
-    one_hot(off4_dom, n_dom)
+def build_joint_qubo(base_model: QuboModel, sign_pref_m3: int = 1) -> QuboModel:
+    """
+    Copy a base model from app.build_ikebana_qubo and add middle3/middle4.
+    The base-dependent penalties become couplings to the base groups, so
+    the base choice and the extension are optimized together.
+    """
+    model = base_model.copy()
+    add_extend_terms(model, sign_pref_m3)
 
     # Penalty to prevent lengths from exceeding the main branch length
-    lambda_len = 10.0
-    for i, (_, _, length) in enumerate(domain):
-        if length > max_length:
-            cost = (length - max_length)**2
-            add_q(off3_dom + i, off3_dom + i, cost * lambda_len)
-            add_q(off4_dom + i, off4_dom + i, cost * lambda_len)
-
-    # Angle deviation penalty: discourage new branches too close to existing ones 
-    lambda_ang = 1.0
-    base_keys = ['main', 'guest', 'middle1', 'middle2']
-    for i, az in enumerate(az_cands):
-        for b in base_keys:
-            base_az = base_angles[f'{b}Azimuth']
-            diff = abs(az - base_az)
-            if diff < 30:
-                add_q(off3_az + i, off3_az + i, (30-diff)**2 * lambda_ang)
-                add_q(off4_az + i, off4_az + i, (30-diff)**2 * lambda_ang)
-    for i, el in enumerate(el_cands):
-        for b in base_keys:
-            base_el = base_angles[f'{b}Elevation']
-            diff = abs(el - base_el)
-            if diff < 15:
-                add_q(off3_el + i, off3_el + i, (15-diff)**2 * lambda_ang)
-                add_q(off4_el + i, off4_el + i, (15-diff)**2 * lambda_ang)
+    main_len = [length for _, _, length in model.candidates('main')]
+    cost = length_cost(main_len)
+    model.add_quadratic('main', 'middle3', cost)
+    model.add_quadratic('main', 'middle4', cost)
 
-    # Sign preference bias: encourage middle3 and middle4 to point on opposite sides
-    sign_pref_m3 = random.choice([-1, +1])
-    sign_pref_m4 = -sign_pref_m3
+    # Angle deviation penalty against whichever base angles get chosen
+    for b in base_keys:
+        az_cost = angle_cost(az_cands, model.candidates(f'{b}_az'), 30)
+        el_cost = angle_cost(el_cands, model.candidates(f'{b}_el'), 15)
+        for role in ('middle3', 'middle4'):
+            model.add_quadratic(f'{b}_az', f'{role}_az', az_cost)
+            model.add_quadratic(f'{b}_el', f'{role}_el', el_cost)
 
-    lam_sign = 50.0
-    for i, az in enumerate(az_cands):
-        if sign_pref_m3 * az > 0:
-            add_q(off3_az + i, off3_az + i, -lam_sign)
+    return model
 
-    for i, az in enumerate(az_cands):
-        if sign_pref_m4 * az > 0:
-            add_q(off4_az + i, off4_az + i, -lam_sign)
 
-    # Non-overlap penalty: prevent middle3 and middle4 from having the same angle 
-    penalty_same = 100.0
-    for i in range(n_az):
-        add_q(off3_az + i, off4_az + i, penalty_same)
+def get_joint_models(*base_inputs) -> dict:
+    """
+    Compiled joint models for every (sign_pref_m1, sign_pref_m3) pair,
+    cached next to the base models. `base_inputs` are the arguments of
+    app.get_ikebana_models.
+    """
+    def build():
+        models = {}
+        for sign_m1, base_model in app.get_ikebana_models(*base_inputs).items():
+            for sign_m3 in (-1, +1):
+                model = build_joint_qubo(base_model, sign_m3)
+                model.dense()
+                models[(sign_m1, sign_m3)] = model
+        return models
 
-    for i in range(n_el):
-        add_q(off3_el + i, off4_el + i, penalty_same)
+    return app.model_cache.get_or_build(('joint',) + app.model_key(*base_inputs), build)
 
-    # Solve the QUBO and extract the solution
-    sampler = oj.SQASampler()
-    result = sampler.sample_qubo(Q, num_reads=20)
-    best = result.first.sample
 
-    def extract_choice(offset, count):
-        for i in range(count):
-            if best.get(offset + i, 0) == 1:
-                return i
-        return None
+def decode_extend_solution(model: QuboModel, solution) -> dict:
+    """Turn a 0/1 sample vector of an extend model into the /optimize_extend payload."""
 
-    penalty_len_same = 80.0
-    for i, (_, _, length_i) in enumerate(domain):
-        for j, (_, _, length_j) in enumerate(domain):
-            if length_i == length_j:
-                add_q(off3_dom + i, off4_dom + j, penalty_len_same)
-
-    i3_az = extract_choice(off3_az, n_az)
-    i3_el = extract_choice(off3_el, n_el)
-    i3_dom = extract_choice(off3_dom, n_dom)
-    i4_az = extract_choice(off4_az, n_az)
-    i4_el = extract_choice(off4_el, n_el)
-    i4_dom = extract_choice(off4_dom, n_dom)
-
-    flower3, _, length3 = domain[i3_dom] if i3_dom is not None else (None, None, None)
-    flower4, _, length4 = domain[i4_dom] if i4_dom is not None else (None, None, None)
+    def chosen(name):
+        i = model.choice(solution, name)
+        return model.candidates(name)[i] if i is not None else None
+
+    flower3, _, length3 = chosen('middle3') or (None, None, None)
+    flower4, _, length4 = chosen('middle4') or (None, None, None)
     return {
         'assignments': {'middle3': flower3, 'middle4': flower4},
         'lengths':     {'middle3': length3, 'middle4': length4},
         'angles': {
-            'middle3Azimuth': az_cands[i3_az] if i3_az is not None else None,
-            'middle3Elevation': el_cands[i3_el] if i3_el is not None else None,
-            'middle4Azimuth': az_cands[i4_az] if i4_az is not None else None,
-            'middle4Elevation': el_cands[i4_el] if i4_el is not None else None
+            'middle3Azimuth': chosen('middle3_az'),
+            'middle3Elevation': chosen('middle3_el'),
+            'middle4Azimuth': chosen('middle4_az'),
+            'middle4Elevation': chosen('middle4_el')
         }
     }
+
+
+def run_ikebana_extend_optimization(
+    base_assignments: dict,
+    base_lengths: dict,
+    base_angles: dict,
+    solver=None
+) -> dict:
+
+    """
+    Args:
+        base_assignments: dict of selected flowers for main/guest/middle1/middle2
+        base_lengths: dict of their lengths
+        base_angles: dict of their azimuth/elevation angles
+        solver: backend from solvers.py (default: SQASolver with 20 reads)
+
+    Returns:
+        dict with assignments, lengths, and angles for middle3 & middle4
+    """
+    solver = solver or SQASolver()
+    model = build_extend_qubo(
+        base_lengths,
+        base_angles,
+        sign_pref_m3=random.choice([-1, +1])
+    )
+
+    # Solve the QUBO and extract the solution
+    samples, _ = solver.sample(model)
+    return decode_extend_solution(model, samples[0])
+
+
+def run_ikebana_full_optimization(
+    W,
+    H,
+    flower_lengths: dict,
+    candidate_lengths: dict,
+    forced_flower=None,
+    front_azimuth=0,
+    front_elevation=0,
+    joint: bool = True,
+    solver=None
+) -> dict:
+
+    """
+    Args:
+        W, H ... front_elevation: same as app.run_ikebana_qa_3d
+        joint: solve base and extension in one joint model; otherwise
+            run the two stages one after the other
+        solver: backend from solvers.py (default: SQASolver with 20 reads)
+
+    Returns:
+        the /optimize payload with the /optimize_extend payload under "extension"
+    """
+    solver = solver or SQASolver()
+    base_inputs = (
+        W, H, flower_lengths, candidate_lengths,
+        forced_flower, front_azimuth, front_elevation,
+    )
+    if not joint:
+        result = app.run_ikebana_qa_3d(*base_inputs, solver=solver)
+        result['extension'] = run_ikebana_extend_optimization(
+            result['assignments'],
+            {b: result[f'{b}Len'] for b in base_keys},
+            {k: result[k] for b in base_keys for k in (f'{b}Azimuth', f'{b}Elevation')},
+            solver=solver
+        )
+        return result
+
+    models = get_joint_models(*base_inputs)
+    model = models[(random.choice([-1, +1]), random.choice([-1, +1]))]
+    samples, energies = solver.sample(model)
+    # Prefer the best read that satisfies every one-hot constraint
+    feasible = model.distinct_solutions(samples, energies)
+    r = feasible[0] if feasible.size else 0
+    result = app.decode_ikebana_solution(model, samples[r], float(energies[r]), flower_lengths)
+    result['extension'] = decode_extend_solution(model, samples[r])
+    return result
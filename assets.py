@@ -0,0 +1,228 @@
+"""
+AssetManifest:
+  Content-hashed serving of the viewer's GLB models.
+
+  Every model under static/3d gets an immutable URL with its content hash
+  in the name (/assets/keisakura.<hash>.glb), so browsers can cache it
+  forever and a changed model simply gets a new URL. Compressed variants
+  (gzip, plus brotli when the `brotli` package is installed) are written
+  next to the manifest once per content hash and picked per request from
+  Accept-Encoding.
+
+  Levels of detail written by build_lods.py (<build_dir>/lod/<name>.lod<k>.glb)
+  are hashed and served the same way and listed under each model's "lods".
+
+    python assets.py          # build the manifest and variants ahead of time
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import re
+import threading
+
+try:
+    import brotli
+except ImportError:  # optional: gzip variants only
+    brotli = None
+
+SOURCE_DIR = os.path.join("static", "3d")
+BUILD_DIR = os.environ.get("IKEBANA_ASSET_DIR", "asset_build")
+URL_PREFIX = "/assets/"
+EXTENSIONS = (".glb",)
+HASH_LENGTH = 16
+
+LOD_NAME = re.compile(r"^(?P<stem>.+)\.lod(?P<level>[1-9][0-9]*)(?P<ext>\.[^.]+)$")
+
+# Content-Encoding -> file suffix, in order of preference
+ENCODINGS = [("br", ".br"), ("gzip", ".gz")]
+
+
+def file_hash(path, chunk_size=1 << 20):
+    h = hashlib.blake2b(digest_size=HASH_LENGTH // 2)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _compress(encoding, data):
+    if encoding == "gzip":
+        # mtime=0 keeps the output (and its ETag) reproducible
+        return gzip.compress(data, compresslevel=9, mtime=0)
+    return brotli.compress(data, quality=11)
+
+
+class AssetManifest:
+    """
+    Args:
+        source_dir: directory with the original models
+        build_dir: where manifest.json and compressed variants are written
+    """
+
+    def __init__(self, source_dir=SOURCE_DIR, build_dir=BUILD_DIR):
+        self.source_dir = source_dir
+        self.build_dir = build_dir
+        self.assets = {}  # hashed name -> entry
+        self.by_path = {}  # original URL -> hashed URL
+        self.lods = {}  # original URL -> {level: hashed URL}
+        self._lock = threading.Lock()
+
+    def scan(self):
+        """Hash every model and rebuild the URL mapping; cheap, run at startup."""
+        assets, by_path, lods = {}, {}, {}
+
+        def add(path, stem, ext):
+            digest = file_hash(path)
+            hashed = f"{stem}.{digest}{ext}"
+            assets[hashed] = {
+                "source": path,
+                "hash": digest,
+                "size": os.path.getsize(path),
+                "variants": {},  # encoding -> (path, size)
+            }
+            return URL_PREFIX + hashed
+
+        for name in sorted(os.listdir(self.source_dir)):
+            stem, ext = os.path.splitext(name)
+            if ext.lower() in EXTENSIONS:
+                by_path[f"/static/3d/{name}"] = add(os.path.join(self.source_dir, name), stem, ext)
+        lod_dir = os.path.join(self.build_dir, "lod")
+        for name in sorted(os.listdir(lod_dir)) if os.path.isdir(lod_dir) else []:
+            match = LOD_NAME.match(name)
+            if match is None or match["ext"].lower() not in EXTENSIONS:
+                continue
+            original = f"/static/3d/{match['stem']}{match['ext']}"
+            # LODs of models that are no longer shipped are ignored
+            if original in by_path:
+                lods.setdefault(original, {})[int(match["level"])] = add(
+                    os.path.join(lod_dir, name), f"{match['stem']}.lod{match['level']}", match["ext"]
+                )
+        with self._lock:
+            self.assets, self.by_path, self.lods = assets, by_path, lods
+        for hashed in assets:
+            self._find_variants(hashed)
+        return self
+
+    def _variant_path(self, hashed, suffix):
+        return os.path.join(self.build_dir, hashed + suffix)
+
+    def _find_variants(self, hashed):
+        entry = self.assets[hashed]
+        for encoding, suffix in ENCODINGS:
+            path = self._variant_path(hashed, suffix)
+            if os.path.exists(path):
+                size = os.path.getsize(path)
+                # A variant that is not smaller is never worth sending
+                if size < entry["size"]:
+                    entry["variants"][encoding] = (path, size)
+
+    def build(self):
+        """Write missing compressed variants and manifest.json; returns self."""
+        os.makedirs(self.build_dir, exist_ok=True)
+        for hashed, entry in self.assets.items():
+            data = None
+            for encoding, suffix in ENCODINGS:
+                path = self._variant_path(hashed, suffix)
+                if os.path.exists(path) or (encoding == "br" and brotli is None):
+                    continue
+                if data is None:
+                    with open(entry["source"], "rb") as f:
+                        data = f.read()
+                tmp_path = f"{path}.part"
+                with open(tmp_path, "wb") as f:
+                    f.write(_compress(encoding, data))
+                os.replace(tmp_path, path)
+            self._find_variants(hashed)
+        tmp_path = os.path.join(self.build_dir, "manifest.json.part")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.manifest(), f, indent=2)
+        os.replace(tmp_path, os.path.join(self.build_dir, "manifest.json"))
+        return self
+
+    def build_in_background(self):
+        """Run build() in a daemon thread; requests get identity bytes meanwhile."""
+
+        def run():
+            try:
+                self.build()
+            except OSError as e:
+                print(f"[WARN] asset build failed: {e}", flush=True)
+
+        thread = threading.Thread(target=run, name="asset-build", daemon=True)
+        thread.start()
+        return thread
+
+    def _describe(self, url):
+        entry = self.assets[url[len(URL_PREFIX):]]
+        return {
+            "url": url,
+            "hash": entry["hash"],
+            "size": entry["size"],
+            "encodings": {enc: size for enc, (_, size) in list(entry["variants"].items())},
+        }
+
+    def manifest(self, lod=0):
+        """
+        {original URL: {url, hash, size, encodings: {encoding: size}, lod, lods}}
+
+        "url" is the requested level of detail, or the most detailed one
+        below it when a model has no such level; "lods" lists them all.
+        """
+        with self._lock:
+            by_path, lods = dict(self.by_path), dict(self.lods)
+        result = {}
+        for path, url in by_path.items():
+            levels = {0: url, **lods.get(path, {})}
+            level = max(k for k in levels if k <= lod)
+            result[path] = {
+                **self._describe(levels[level]),
+                "lod": level,
+                "lods": {k: self._describe(u) for k, u in sorted(levels.items())},
+            }
+        return result
+
+    def url(self, path, lod=0):
+        """Hashed URL for an original /static/3d/... URL (unchanged if unknown)."""
+        levels = {0: self.by_path.get(path, path), **self.lods.get(path, {})}
+        return levels[max(k for k in levels if k <= lod)]
+
+    def rewrite(self, text, lod=0):
+        """Replace every known original model URL in `text` with its hashed URL."""
+        for path in self.by_path:
+            text = text.replace(path, self.url(path, lod))
+        return text
+
+    def resolve(self, hashed, accept_encoding=""):
+        """
+        (file path, Content-Encoding or None, ETag) for a hashed asset name,
+        or None if unknown. Brotli is preferred over gzip when both are accepted.
+        """
+        entry = self.assets.get(hashed)
+        if entry is None:
+            return None
+        accepted = {e.split(";")[0].strip() for e in accept_encoding.split(",")}
+        for encoding, _ in ENCODINGS:
+            variant = entry["variants"].get(encoding)
+            if variant is not None and encoding in accepted:
+                return variant[0], encoding, f"{entry['hash']}-{encoding}"
+        return entry["source"], None, entry["hash"]
+
+    def stats(self):
+        return {
+            "assets": len(self.assets),
+            "bytes": sum(e["size"] for e in self.assets.values()),
+            "lods": sum(len(levels) for levels in self.lods.values()),
+            "compressed": {
+                encoding: sum(1 for e in self.assets.values() if encoding in e["variants"])
+                for encoding, _ in ENCODINGS
+            },
+        }
+
+
+if __name__ == "__main__":
+    manifest = AssetManifest().scan().build()
+    for path, entry in manifest.manifest().items():
+        sizes = ", ".join(f"{enc} {size}" for enc, size in entry["encodings"].items())
+        print(f"[assets] {path} -> {entry['url']} ({entry['size']} bytes; {sizes or 'identity only'})")
@@ -0,0 +1,184 @@
+"""
+Offline backfill of point-cloud and image features.
+
+    python backfill.py --pcds pcds --images images --workers 4
+
+Walks the point-cloud directory (files referenced by the pointclouds
+table) and an image directory (<arr_id>.png/.jpg: spatial_features and
+color_features via extract_image_features), extracts features over a
+process pool with chunked task submission, and bulk-upserts the results
+in batches.
+
+Every committed batch is appended to a checkpoint file, so an interrupted
+run resumes where it stopped; pass --restart to recompute everything
+(e.g. after a feature-definition change).
+"""
+
+import argparse
+import os
+import time
+
+import database
+import pointcloud_io
+import worker_processes
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp")
+
+
+def _pointcloud_task(task):
+    path, mode = task
+    import feature_utils
+
+    try:
+        return path, feature_utils.extract_pointcloud_features(path, mode=mode), None
+    except Exception as e:
+        return path, None, f"{type(e).__name__}: {e}"
+
+
+def _image_task(task):
+    path, _ = task
+    import feature_utils
+
+    try:
+        return path, feature_utils.extract_image_features(path), None
+    except Exception as e:
+        return path, None, f"{type(e).__name__}: {e}"
+
+
+class Checkpoint:
+    """Append-only list of finished "<kind>:<path>" keys."""
+
+    def __init__(self, path, restart=False):
+        self.path = path
+        if restart and os.path.exists(path):
+            os.remove(path)
+        self.done = set()
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self.done = {line.rstrip("\n") for line in f if line.strip()}
+
+    def add(self, keys):
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.writelines(f"{key}\n" for key in keys)
+            f.flush()
+            os.fsync(f.fileno())
+        self.done.update(keys)
+
+
+def pointcloud_tasks(pcds_dir, conn):
+    """(path, db_file_path) for stored clouds under pcds_dir referenced by pointclouds."""
+    referenced = {os.path.normpath(p): p for p in database.list_pointcloud_paths(conn)}
+    tasks, skipped = [], 0
+    for name in sorted(os.listdir(pcds_dir)):
+        if not name.endswith((".ply", pointcloud_io.POINTS_EXT)):
+            continue
+        path = os.path.normpath(os.path.join(pcds_dir, name))
+        if path in referenced:
+            tasks.append((path, referenced[path]))
+        else:
+            skipped += 1
+    if skipped:
+        print(f"[backfill] skipping {skipped} point-cloud files not referenced by pointclouds")
+    return tasks
+
+
+def image_tasks(image_dir):
+    """(path, arr_id) for <arr_id>.<ext> images under image_dir."""
+    tasks = []
+    for name in sorted(os.listdir(image_dir)):
+        stem, ext = os.path.splitext(name)
+        if ext.lower() in IMAGE_EXTENSIONS and stem.isdigit():
+            tasks.append((os.path.join(image_dir, name), int(stem)))
+    return tasks
+
+
+def run(kind, tasks, worker, save, executor, checkpoint, args):
+    """Fan `tasks` out over `executor`, committing `save(conn, results)` per batch."""
+    todo = [t for t in tasks if f"{kind}:{t[0]}" not in checkpoint.done]
+    print(f"[backfill] {kind}: {len(todo)} to do, {len(tasks) - len(todo)} already done")
+    if not todo:
+        return 0, 0
+    keys = dict(todo)
+    conn = database.get_conn()
+    t0 = time.perf_counter()
+    ok = failed = 0
+    batch = []
+
+    def commit():
+        with conn:
+            save(conn, [(keys[path], result) for path, result in batch])
+        checkpoint.add([f"{kind}:{path}" for path, _ in batch])
+        batch.clear()
+        elapsed = time.perf_counter() - t0
+        print(f"[backfill] {kind}: {ok + failed}/{len(todo)} files, {(ok + failed) / elapsed:.1f} files/s")
+
+    results = executor.map(worker, [(path, args.mode) for path, _ in todo], chunksize=args.chunksize)
+    for path, result, error in results:
+        if error is not None:
+            # Failures are not checkpointed, so the next run retries them
+            print(f"[WARN] {kind} {path}: {error}")
+            failed += 1
+            continue
+        ok += 1
+        batch.append((path, result))
+        if len(batch) >= args.batch:
+            commit()
+    if batch:
+        commit()
+    elapsed = time.perf_counter() - t0
+    print(
+        f"[backfill] {kind}: {ok} done, {failed} failed in {elapsed:.1f}s"
+        f" ({(ok + failed) / elapsed:.1f} files/s)"
+    )
+    return ok, failed
+
+
+def save_pointclouds(conn, results):
+    database.update_pointcloud_features_by_path(conn, results)
+
+
+def save_images(conn, results):
+    database.upsert_spatial_features(
+        conn,
+        [(arr_id, f["centroid_x"], f["centroid_y"], f["balance_score"]) for arr_id, f in results],
+    )
+    database.upsert_color_features(
+        conn, [(arr_id, f["avg_r"], f["avg_g"], f["avg_b"]) for arr_id, f in results]
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--pcds", help="point-cloud directory (e.g. pcds)")
+    parser.add_argument("--images", help="image directory with <arr_id>.<ext> files")
+    parser.add_argument("--db", default=database.DB_PATH, help="SQLite database")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunksize", type=int, default=8, help="tasks sent to a worker at once")
+    parser.add_argument("--batch", type=int, default=200, help="results per upsert transaction")
+    parser.add_argument("--mode", default="exact", help="point-cloud feature mode")
+    parser.add_argument("--checkpoint", default="backfill.ckpt")
+    parser.add_argument("--restart", action="store_true", help="ignore the checkpoint")
+    args = parser.parse_args(argv)
+    if not args.pcds and not args.images:
+        parser.error("nothing to do: pass --pcds and/or --images")
+
+    database.DB_PATH = args.db
+    checkpoint = Checkpoint(args.checkpoint, restart=args.restart)
+    t0 = time.perf_counter()
+    total = 0
+    preload = (["open3d"] if args.pcds else []) + (["cv2"] if args.images else [])
+    with worker_processes.new_executor(args.workers, preload) as executor:
+        if args.pcds:
+            tasks = pointcloud_tasks(args.pcds, database.get_conn())
+            total += sum(
+                run("pointcloud", tasks, _pointcloud_task, save_pointclouds, executor, checkpoint, args)
+            )
+        if args.images:
+            tasks = image_tasks(args.images)
+            total += sum(run("image", tasks, _image_task, save_images, executor, checkpoint, args))
+    elapsed = time.perf_counter() - t0
+    print(f"[backfill] {total} files in {elapsed:.1f}s ({total / max(elapsed, 1e-9):.1f} files/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Measure speed and accuracy of the extract_pointcloud_features modes
+against "exact" on a reference set of point clouds built from the GLB
+models in static/3d (mesh vertices at the scales the viewer uses).
+
+    python bench_feature_modes.py
+
+Prints per-mode timings and the worst-case error of each feature; the
+bounds in feature_utils.FEATURE_MODE_ERRORS come from this output.
+"""
+
+import glob
+import time
+
+import numpy as np
+import open3d as o3d
+
+import feature_utils
+
+# Model scales: raw GLB units and a typical branch length from the catalog
+SCALES = [1.0, 30.0]
+
+
+def reference_clouds():
+    for path in sorted(glob.glob("static/3d/*.glb")):
+        mesh = o3d.io.read_triangle_mesh(path)
+        for scale in SCALES:
+            yield f"{path}@{scale:g}", np.asarray(mesh.vertices) * scale
+
+
+def feature_errors(exact, approx):
+    """Relative errors (scalars) and absolute errors (unit vectors, curvature)."""
+    diag = float(np.linalg.norm(exact["bbox"]))
+    return {
+        "hull_volume": abs(approx["hull_volume"] / exact["hull_volume"] - 1),
+        "hull_area": abs(approx["hull_area"] / exact["hull_area"] - 1),
+        "centroid": float(np.linalg.norm(approx["centroid"] - exact["centroid"])) / diag,
+        "avg_normal": float(np.linalg.norm(approx["avg_normal"] - exact["avg_normal"])),
+        "curvature_mean": abs(approx["curvature_mean"] - exact["curvature_mean"]),
+        "curvature_std": abs(approx["curvature_std"] - exact["curvature_std"]),
+    }
+
+
+def main():
+    times = {mode: [] for mode in feature_utils.FEATURE_MODES}
+    worst = {mode: {} for mode in feature_utils.FEATURE_MODES if mode != "exact"}
+    for name, pts in reference_clouds():
+        results = {}
+        for mode in feature_utils.FEATURE_MODES:
+            t0 = time.perf_counter()
+            results[mode] = feature_utils.extract_pointcloud_features(None, points=pts, mode=mode)
+            times[mode].append(time.perf_counter() - t0)
+        line = [f"{name:32s} n={len(pts):6d}"]
+        for mode in worst:
+            errors = feature_errors(results["exact"], results[mode])
+            for key, err in errors.items():
+                worst[mode][key] = max(worst[mode].get(key, 0.0), err)
+            line.append(f"{mode}: {results[mode]['effective_points']} pts")
+        print("  ".join(line))
+
+    print()
+    for mode, ts in times.items():
+        print(f"{mode:8s} total {sum(ts):7.2f}s")
+    for mode, errors in worst.items():
+        print(f"{mode:8s} max error " + ", ".join(f"{k}={v:.4f}" for k, v in errors.items()))
+
+
+if __name__ == "__main__":
+    main()
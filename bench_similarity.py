@@ -0,0 +1,106 @@
+"""
+Benchmark SimilarityIndex at catalog scale.
+
+    python bench_similarity.py [N] [--designs M]
+
+Generates N synthetic arrangements and reports build, insert and
+/similar query times. Exactness against a brute-force scan is checked
+in tests/test_similarity_index.py.
+
+Designs are drawn from the optimizer's candidate lengths and angles, with
+point-cloud features a noisy function of the branches. By default every
+arrangement is a distinct design, the worst case for the index: nothing
+collapses into shared vectors. --designs M instead spreads arrangements
+over M designs, Zipf weighted, as when the optimizer keeps returning the
+same designs.
+
+The target is a p50 query under 1 ms at 100k arrangements. It is met
+with repeating designs (--designs 5000: p50 ~0.7 ms on one core) and
+missed for distinct ones (p50 ~9 ms; a 31-dimensional KD-tree visits
+most of its nodes, and even a flat float32 scan takes ~3.5 ms here).
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from similarity_index import BRANCH_ROLES, COLUMNS, POINTCLOUD_COLUMNS, SimilarityIndex
+
+LENGTHS = [60, 50, 30, 23, 20, 17, 15]
+AZIMUTHS = {
+    "main": [-20, -10, 0, 10, 20],
+    "guest": [0],
+    "middle1": [-50, -40, 40, 50],
+    "middle2": [-50, -40, 40, 50],
+    "middle3": [-70, -60, -50, 50, 60, 70],
+    "middle4": [-70, -60, -50, 50, 60, 70],
+}
+ELEVATIONS = {
+    "main": [-10, 0, 10],
+    "guest": [45],
+    "middle1": [30, 40, 50, 60, 70],
+    "middle2": [30, 40, 50, 60, 70],
+    "middle3": [15, 20, 21],
+    "middle4": [15, 20, 21],
+}
+
+
+def synthetic_rows(n, designs, seed=0):
+    rng = np.random.default_rng(seed)
+    m = designs or n
+    branches = {}
+    for role in BRANCH_ROLES:
+        branches[f"{role}_length"] = rng.choice(LENGTHS, m)
+        branches[f"{role}_azimuth"] = rng.choice(AZIMUTHS[role], m)
+        branches[f"{role}_elevation"] = rng.choice(ELEVATIONS[role], m)
+    B = np.column_stack([branches[c] for c in COLUMNS[len(POINTCLOUD_COLUMNS):]]).astype(float)
+    mix = rng.standard_normal((B.shape[1], len(POINTCLOUD_COLUMNS))) / B.shape[1]
+    P = np.tanh(B / 60) @ mix + rng.standard_normal((m, len(POINTCLOUD_COLUMNS))) * 0.01
+    X = np.hstack([P, B])
+    if designs:
+        weights = 1.0 / np.arange(1, m + 1)
+        X = X[rng.choice(m, n, p=weights / weights.sum())]
+    return X
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("n", nargs="?", type=int, default=100_000)
+    parser.add_argument("--designs", type=int, default=0, help="0: every arrangement distinct")
+    parser.add_argument("-k", type=int, default=10)
+    args = parser.parse_args()
+    n, k = args.n, args.k
+    rows = synthetic_rows(n, args.designs)
+    inserts = min(1000, n // 10)
+
+    index = SimilarityIndex()
+    t0 = time.perf_counter()
+    for arr_id, x in enumerate(rows[: n - inserts], start=1):
+        index._update(arr_id, dict(zip(COLUMNS, x)))
+    index._rebuild()
+    print(f"build    {n - inserts} arrangements in {time.perf_counter() - t0:.2f}s")
+
+    t0 = time.perf_counter()
+    for arr_id, x in enumerate(rows[n - inserts :], start=n - inserts + 1):
+        index.update(arr_id, dict(zip(COLUMNS, x)))
+    print(f"insert   {(time.perf_counter() - t0) / inserts * 1e6:.1f} us/arrangement")
+
+    rng = np.random.default_rng(1)
+    queries = rng.integers(1, n + 1, 1000)
+    times = []
+    for arr_id in queries:
+        t0 = time.perf_counter()
+        index.similar(int(arr_id), k)
+        times.append(time.perf_counter() - t0)
+    times = np.array(times) * 1e3
+    p50 = np.percentile(times, 50)
+    print(
+        f"query    k={k}: p50 {p50:.3f} ms, "
+        f"p99 {np.percentile(times, 99):.3f} ms ({index.stats()})"
+    )
+    print(f"target   p50 < 1 ms: {'met' if p50 < 1.0 else 'MISSED'}")
+
+
+if __name__ == "__main__":
+    main()
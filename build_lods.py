@@ -0,0 +1,280 @@
+"""
+Build step: levels of detail for the viewer's GLB models.
+
+    python build_lods.py              # static/3d/*.glb -> asset_build/lod/
+    python assets.py                  # then hash + precompress everything
+
+Level 0 is the authoring asset, served unchanged. Each further level is a
+copy with
+  - the triangle count reduced by quadric decimation (open3d); UVs and
+    normals are carried over from the nearest original vertex of the same
+    connected part, so texture seams stay on their own side
+  - vertex attributes quantized (KHR_mesh_quantization): int16 positions
+    with a dequantizing node transform, int8 normals, uint16 UVs and
+    16-bit indices where they fit
+  - textures downscaled, which is where most of the bytes are (every
+    model ships three 4096x4096 maps)
+
+Only POSITION, NORMAL and TEXCOORD_0 are kept; the models have nothing
+else. A report with bytes, triangles and load time per level is printed
+and written to <out>/report.json.
+"""
+
+import argparse
+import copy
+import gzip
+import json
+import os
+import time
+
+import cv2
+import numpy as np
+import open3d as o3d
+from scipy.spatial import cKDTree
+
+import glb_io
+
+# level -> (fraction of triangles kept, maximum texture size)
+LEVELS = {
+    1: (1.0, 2048),
+    2: (0.5, 1024),
+    3: (0.2, 512),
+}
+LOD_DIR = os.path.join("asset_build", "lod")
+
+
+def lod_name(name, level):
+    stem, ext = os.path.splitext(name)
+    return f"{stem}.lod{level}{ext}"
+
+
+def _vertex_parts(triangles, n_vertices, clusters):
+    parts = np.full(n_vertices, -1, dtype=np.int64)
+    parts[triangles.ravel()] = np.repeat(clusters, 3)
+    return parts
+
+
+def decimate(geometry, ratio):
+    """geometry (see glb_io.mesh_geometry) with about `ratio` of its triangles."""
+    if ratio >= 1.0:
+        return geometry
+    positions, triangles = geometry["positions"], geometry["triangles"]
+    mesh = o3d.geometry.TriangleMesh(
+        o3d.utility.Vector3dVector(positions), o3d.utility.Vector3iVector(triangles)
+    )
+    clusters = np.asarray(mesh.cluster_connected_triangles()[0])
+    target = max(4, int(len(triangles) * ratio))
+    # A high boundary weight keeps the UV seams (open edges) in place
+    simple = mesh.simplify_quadric_decimation(target, boundary_weight=100.0)
+    simple.remove_unreferenced_vertices()
+    new_positions = np.asarray(simple.vertices)
+    new_triangles = np.asarray(simple.triangles)
+    new_clusters = np.asarray(simple.cluster_connected_triangles()[0])
+
+    # Each decimated part maps to the original part most of its vertices
+    # are nearest to; attributes then come from the nearest vertex of it
+    parts = _vertex_parts(triangles, len(positions), clusters)
+    new_parts = _vertex_parts(new_triangles, len(new_positions), new_clusters)
+    k = min(8, len(positions))
+    _, nearest = cKDTree(positions).query(new_positions, k=k)
+    nearest = nearest.reshape(len(new_positions), k)
+    votes = {}
+    for new_part, part in zip(new_parts, parts[nearest[:, 0]]):
+        votes.setdefault(new_part, {}).setdefault(part, 0)
+        votes[new_part][part] += 1
+    wanted = np.array([
+        max(votes[p], key=votes[p].get) if p in votes else -1 for p in new_parts
+    ])
+    match = parts[nearest] == wanted[:, None]
+    pick = np.where(match.any(axis=1), match.argmax(axis=1), 0)
+    source = nearest[np.arange(len(new_positions)), pick]
+
+    return {
+        **geometry,
+        "positions": new_positions,
+        "normals": None if geometry["normals"] is None else geometry["normals"][source],
+        "uvs": None if geometry["uvs"] is None else geometry["uvs"][source],
+        "triangles": new_triangles,
+    }
+
+
+def quantize_mesh(writer, geometries, bits):
+    """
+    Append quantized primitives for one mesh; returns (primitives,
+    translation, scale) where translation/scale dequantize the positions.
+    """
+    positions = np.concatenate([g["positions"] for g in geometries])
+    lo, hi = positions.min(axis=0), positions.max(axis=0)
+    center = (lo + hi) / 2
+    half = float((hi - lo).max()) / 2 or 1.0
+    step = half / (2 ** (bits - 1) - 1)
+
+    primitives = []
+    for g in geometries:
+        primitive = {
+            k: v for k, v in g["primitive"].items()
+            if k not in ("attributes", "indices", "targets")
+        }
+        q = np.round((g["positions"] - center) / step).astype(np.int16)
+        attributes = {
+            "POSITION": writer.add_accessor(q, "VEC3", bounds=True, pad_to=4),
+        }
+        if g["normals"] is not None:
+            n = g["normals"] / np.maximum(np.linalg.norm(g["normals"], axis=1, keepdims=True), 1e-12)
+            attributes["NORMAL"] = writer.add_accessor(
+                np.round(n * 127).astype(np.int8), "VEC3", normalized=True, pad_to=4
+            )
+        if g["uvs"] is not None:
+            uvs = g["uvs"]
+            if uvs.min() >= 0.0 and uvs.max() <= 1.0:
+                attributes["TEXCOORD_0"] = writer.add_accessor(
+                    np.round(uvs * 65535).astype(np.uint16), "VEC2", normalized=True
+                )
+            else:
+                # Wrapping UVs do not fit a normalized integer
+                attributes["TEXCOORD_0"] = writer.add_accessor(uvs.astype(np.float32), "VEC2")
+        primitive["attributes"] = attributes
+        index_type = np.uint16 if len(g["positions"]) < 65536 else np.uint32
+        primitive["indices"] = writer.add_accessor(
+            g["triangles"].ravel().astype(index_type), "SCALAR",
+            target=glb_io.ELEMENT_ARRAY_BUFFER,
+        )
+        primitives.append(primitive)
+    return primitives, [float(c) for c in center], [step] * 3
+
+
+def resize_image(data, mime_type, max_size, jpeg_quality):
+    """Re-encoded image bytes no larger than max_size on either side."""
+    image = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_UNCHANGED)
+    if image is None or max(image.shape[:2]) <= max_size:
+        return data
+    scale = max_size / max(image.shape[:2])
+    size = (max(1, round(image.shape[1] * scale)), max(1, round(image.shape[0] * scale)))
+    image = cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+    if mime_type == "image/png":
+        ok, buf = cv2.imencode(".png", image)
+    else:
+        ok, buf = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality])
+    return buf.tobytes() if ok else data
+
+
+def build_lod(src_path, out_path, ratio, texture_size, bits=14, jpeg_quality=85):
+    gltf, bin_chunk = glb_io.read_glb(src_path)
+    meshes = {
+        i: [decimate(g, ratio) for g in glb_io.mesh_geometry(gltf, bin_chunk, i)]
+        for i in range(len(gltf.get("meshes", [])))
+    }
+    images = [
+        glb_io.buffer_view_bytes(gltf, bin_chunk, image["bufferView"])
+        if "bufferView" in image else None
+        for image in gltf.get("images", [])
+    ]
+
+    out = copy.deepcopy(gltf)
+    writer = glb_io.GlbWriter(out)
+    dequantize = {}
+    for i, geometries in meshes.items():
+        primitives, translation, scale = quantize_mesh(writer, geometries, bits)
+        out["meshes"][i]["primitives"] = primitives
+        dequantize[i] = (translation, scale)
+    for image, data in zip(out.get("images", []), images):
+        if data is not None:
+            image["bufferView"] = writer.add_view(
+                resize_image(data, image.get("mimeType"), texture_size, jpeg_quality)
+            )
+
+    # The dequantizing transform goes on a new child so the original node
+    # keeps its own transform and name
+    for node in list(out.get("nodes", [])):
+        if "mesh" in node:
+            translation, scale = dequantize[node["mesh"]]
+            out["nodes"].append({"mesh": node.pop("mesh"), "translation": translation, "scale": scale})
+            node.setdefault("children", []).append(len(out["nodes"]) - 1)
+    for key in ("extensionsUsed", "extensionsRequired"):
+        out[key] = sorted(set(out.get(key, [])) | {"KHR_mesh_quantization"})
+    return writer.write(out_path)
+
+
+def load_seconds(path, repeat=3):
+    """Best-of-`repeat` time to parse a .glb, read its accessors and decode its textures."""
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        gltf, bin_chunk = glb_io.read_glb(path)
+        for i in range(len(gltf.get("accessors", []))):
+            glb_io.read_accessor(gltf, bin_chunk, i)
+        for image in gltf.get("images", []):
+            if "bufferView" in image:
+                data = glb_io.buffer_view_bytes(gltf, bin_chunk, image["bufferView"])
+                cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_UNCHANGED)
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def describe(path, mbps):
+    gltf, bin_chunk = glb_io.read_glb(path)
+    triangles = vertices = 0
+    for i in range(len(gltf.get("meshes", []))):
+        for g in glb_io.mesh_geometry(gltf, bin_chunk, i):
+            triangles += len(g["triangles"])
+            vertices += len(g["positions"])
+    with open(path, "rb") as f:
+        data = f.read()
+    gzip_size = len(gzip.compress(data, compresslevel=9, mtime=0))
+    return {
+        "bytes": len(data),
+        "gzip_bytes": gzip_size,
+        "triangles": triangles,
+        "vertices": vertices,
+        "load_ms": round(load_seconds(path) * 1000, 1),
+        "transfer_ms": round(gzip_size * 8 / (mbps * 1e6) * 1000, 1),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--source", default=os.path.join("static", "3d"))
+    parser.add_argument("--out", default=LOD_DIR)
+    parser.add_argument("--position-bits", type=int, default=14, help="2..16")
+    parser.add_argument("--jpeg-quality", type=int, default=85)
+    parser.add_argument("--mbps", type=float, default=20.0, help="bandwidth for transfer_ms")
+    args = parser.parse_args(argv)
+    if not 2 <= args.position_bits <= 16:
+        parser.error("--position-bits must be between 2 and 16")
+
+    os.makedirs(args.out, exist_ok=True)
+    report = {}
+    for name in sorted(os.listdir(args.source)):
+        if not name.endswith(".glb"):
+            continue
+        src_path = os.path.join(args.source, name)
+        report[name] = {0: describe(src_path, args.mbps)}
+        for level, (ratio, texture_size) in LEVELS.items():
+            out_path = os.path.join(args.out, lod_name(name, level))
+            t0 = time.perf_counter()
+            build_lod(
+                src_path, out_path, ratio, texture_size,
+                bits=args.position_bits, jpeg_quality=args.jpeg_quality,
+            )
+            report[name][level] = {
+                **describe(out_path, args.mbps),
+                "build_s": round(time.perf_counter() - t0, 2),
+            }
+        for level, row in report[name].items():
+            print(
+                f"[lod] {name} lod{level}: {row['bytes']:>9} bytes ({row['gzip_bytes']:>9} gzip),"
+                f" {row['triangles']:>6} triangles, load {row['load_ms']:>6.1f} ms,"
+                f" transfer {row['transfer_ms']:>7.1f} ms @ {args.mbps:g} Mbps"
+            )
+
+    with open(os.path.join(args.out, "report.json"), "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    totals = {
+        level: sum(r[level]["gzip_bytes"] for r in report.values())
+        for level in [0, *LEVELS]
+    }
+    print("[lod] total gzip bytes per level: " + ", ".join(f"lod{k} {v}" for k, v in totals.items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Convert stored PLY point clouds to the compact point format (.pcb).
+
+    python convert_pointclouds.py --pcds pcds
+    python convert_pointclouds.py --dtype int16 --compression gzip --keep
+
+Every pcds/*.ply file is rewritten as <same name>.pcb (see
+pointcloud_io.write_points), read back and compared with the original,
+and the pointclouds rows that reference it are pointed at the new file.
+The PLY file is then deleted unless --keep is given. Run it while the
+server is stopped, so no extraction still holds an old path.
+
+A report of bytes on disk and reload time (best of --repeat) before and
+after is printed per file and in total.
+"""
+
+import argparse
+import os
+import time
+
+import numpy as np
+
+import database
+import pointcloud_io
+
+
+def load_seconds(load, path, repeat):
+    """Best-of-`repeat` time to load a cloud into a float64 array and touch every point."""
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        float(load(path).sum())
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def check_round_trip(points, path, dtype):
+    """Raise ValueError if `path` does not hold `points` within the dtype's precision."""
+    back = pointcloud_io.load_points(path)
+    if back.shape != points.shape:
+        raise ValueError(f"read back {back.shape}, expected {points.shape}")
+    if dtype == "int16":
+        # Half a quantization step per axis, plus float rounding
+        tolerance = np.ptp(points, axis=0) / 65534 * 0.5 + 1e-9 if len(points) else 0
+        if np.any(np.abs(back - points) > tolerance):
+            raise ValueError("quantization error above half a step")
+    elif not np.array_equal(back, points.astype(np.float32)):
+        raise ValueError("float32 values differ")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--db", default=database.DB_PATH, help="SQLite database")
+    parser.add_argument("--pcds", default="pcds", help="point-cloud directory")
+    parser.add_argument("--dtype", default=pointcloud_io.DEFAULT_POINT_FORMAT["dtype"],
+                        choices=list(pointcloud_io.POINT_DTYPES))
+    parser.add_argument("--compression", default="none", choices=["none", "gzip", "zstd"],
+                        help="compressed files are decompressed on read instead of memory-mapped")
+    parser.add_argument("--keep", action="store_true", help="keep the PLY files")
+    parser.add_argument("--repeat", type=int, default=3, help="loads timed per file")
+    args = parser.parse_args(argv)
+    compression = None if args.compression == "none" else args.compression
+    if compression == "zstd" and pointcloud_io.zstandard is None:
+        parser.error("zstd compression needs the zstandard package")
+
+    database.DB_PATH = args.db
+    conn = database.get_conn()
+    referenced = {os.path.normpath(p): p for p in database.list_pointcloud_paths(conn)}
+
+    totals = {"files": 0, "failed": 0, "rows": 0, "bytes": [0, 0], "load_s": [0.0, 0.0]}
+    for name in sorted(os.listdir(args.pcds)):
+        if not name.endswith(".ply"):
+            continue
+        path = os.path.join(args.pcds, name)
+        new_path = os.path.splitext(path)[0] + pointcloud_io.POINTS_EXT
+        try:
+            points = pointcloud_io.read_ply_points(path)
+            pointcloud_io.write_points(new_path, points, dtype=args.dtype, compression=compression)
+            check_round_trip(points, new_path, args.dtype)
+        except (OSError, ValueError) as e:
+            print(f"[WARN] {path}: {e}")
+            if os.path.exists(new_path):
+                os.remove(new_path)
+            totals["failed"] += 1
+            continue
+
+        sizes = [os.path.getsize(path), os.path.getsize(new_path)]
+        seconds = [
+            load_seconds(pointcloud_io.read_ply_points, path, args.repeat),
+            load_seconds(pointcloud_io.load_points, new_path, args.repeat),
+        ]
+        old_db_path = referenced.get(os.path.normpath(path))
+        rows = 0
+        if old_db_path is not None:
+            with conn:
+                rows = database.rename_pointcloud_path(
+                    conn, old_db_path, os.path.splitext(old_db_path)[0] + pointcloud_io.POINTS_EXT
+                )
+        if not args.keep:
+            os.remove(path)
+
+        totals["files"] += 1
+        totals["rows"] += rows
+        for i in range(2):
+            totals["bytes"][i] += sizes[i]
+            totals["load_s"][i] += seconds[i]
+        print(
+            f"[convert] {name}: {len(points)} points, {sizes[0]} -> {sizes[1]} bytes,"
+            f" load {seconds[0] * 1000:.1f} -> {seconds[1] * 1000:.1f} ms, {rows} rows"
+        )
+
+    (old_bytes, new_bytes), (old_s, new_s) = totals["bytes"], totals["load_s"]
+    print(
+        f"[convert] {totals['files']} files converted, {totals['failed']} failed,"
+        f" {totals['rows']} pointclouds rows updated"
+    )
+    if totals["files"]:
+        print(
+            f"[convert] {old_bytes} -> {new_bytes} bytes ({old_bytes / max(new_bytes, 1):.1f}x smaller),"
+            f" load {old_s * 1000:.1f} -> {new_s * 1000:.1f} ms ({old_s / max(new_s, 1e-9):.1f}x faster)"
+        )
+
+
+if __name__ == "__main__":
+    main()
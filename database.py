@@ -1,10 +1,24 @@
 import sqlite3
+import threading
+from contextlib import contextmanager
 
 DB_PATH = "ikebana.db"
 
+# One connection per thread, reused across requests
+_local = threading.local()
+
+
+def _connect():
+    conn = sqlite3.connect(DB_PATH, timeout=30)
+    # WAL lets readers run alongside the writer; NORMAL syncs at checkpoints
+    # instead of on every commit
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
 
 def init_db():
-    conn = sqlite3.connect(DB_PATH)
+    conn = _connect()
     cur  = conn.cursor()
 
     cur.executescript("""
@@ -29,6 +43,7 @@ def init_db():
       length    REAL    NOT NULL,
       azimuth   REAL    NOT NULL,
       elevation REAL    NOT NULL,
+      flower    TEXT,
       FOREIGN KEY(arr_id) REFERENCES arrangements(id)
     );
 
@@ -65,8 +80,23 @@ def init_db():
       avg_normal_z   REAL,
       curvature_mean REAL,
       curvature_std  REAL,
+      feature_mode   TEXT,
+      status         TEXT    NOT NULL DEFAULT 'pending',
+      error          TEXT,
+      attempts       INTEGER NOT NULL DEFAULT 0,
+      content_hash   TEXT,
+      feature_state  BLOB,
+      merged         INTEGER NOT NULL DEFAULT 0,  -- 差分マージで求めた近似値なら 1
       FOREIGN KEY(arr_id) REFERENCES arrangements(id)
     );
+
+    CREATE INDEX idx_pointclouds_content_hash ON pointclouds(content_hash);
+
+    -- 読み出し API 用（絞り込み列 + id でキーセットページングできるようにする）
+    CREATE INDEX idx_branches_arr_id ON branches(arr_id);
+    CREATE INDEX idx_arrangements_vase ON arrangements(vase_width, vase_height, id);
+    CREATE INDEX idx_arrangements_artist ON arrangements(artist, id);
+    CREATE INDEX idx_arrangements_created_at ON arrangements(created_at, id);
     """)
 
     conn.commit()
@@ -74,37 +104,491 @@ def init_db():
 
 
 def get_conn():
-    """データベース接続を返す"""
-    return sqlite3.connect(DB_PATH)
+    """
+    このスレッド用のデータベース接続を返す（close しないこと）
+    DB_PATH が変わった場合は新しく接続し直す
+    """
+    conn = getattr(_local, "conn", None)
+    if conn is None or _local.path != DB_PATH:
+        conn = _connect()
+        _local.conn = conn
+        _local.path = DB_PATH
+    return conn
 
 
-def save_arrangement_metadata(conn, artist, comment, vase_width=None, vase_height=None):
+@contextmanager
+def transaction():
+    """
+    with ブロック全体を 1 トランザクションとして実行する
+    正常終了で commit、例外時は rollback
+    """
+    conn = get_conn()
+    with conn:
+        yield conn
+
+
+def save_arrangement_metadata(conn, artist, comment, vase_width=None, vase_height=None, arr_id=None):
     """
     arrangements テーブルにレコードを挿入し、arr_id を返却する
     - artist: 作成者名
     - comment: コメント
     - vase_width: 使用した花器の幅
     - vase_height: 使用した花器の高さ
+    - arr_id: reserve_arrangement_ids で予約済みの ID（省略時は自動採番）
     """
     cur = conn.cursor()
     cur.execute(
-      "INSERT INTO arrangements(artist, comment, vase_width, vase_height) VALUES (?, ?, ?, ?)",
-      (artist, comment, vase_width, vase_height)
+      "INSERT INTO arrangements(id, artist, comment, vase_width, vase_height) VALUES (?, ?, ?, ?, ?)",
+      (arr_id, artist, comment, vase_width, vase_height)
     )
     return cur.lastrowid
 
 
-def save_branch(conn, arr_id, role, length, az, el):
+def reserve_arrangement_ids(count):
+    """
+    arrangements.id を count 個まとめて予約し、(先頭, 末尾+1) を返却する
+    AUTOINCREMENT の採番カウンタ (sqlite_sequence) を進めるので、
+    通常の INSERT や他プロセスと ID が重複しない
+    """
+    conn = get_conn()
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        row = conn.execute(
+            "SELECT seq FROM sqlite_sequence WHERE name = 'arrangements'"
+        ).fetchone()
+        start = (row[0] if row else 0) + 1
+        if row:
+            conn.execute(
+                "UPDATE sqlite_sequence SET seq = ? WHERE name = 'arrangements'",
+                (start + count - 1,),
+            )
+        else:
+            conn.execute(
+                "INSERT INTO sqlite_sequence(name, seq) VALUES ('arrangements', ?)",
+                (start + count - 1,),
+            )
+    return start, start + count
+
+
+def save_branch(conn, arr_id, role, length, az, el, flower=None):
     """
-    branches テーブルに枝情報を追加する
+    branches テーブルに枝情報を追加する（commit は呼び出し側）
     - arr_id: arrangements.id
     - role: "main"/"guest"/"middle1"/"middle2" 等
     - length: 枝の長さ
     - az: 水平角度
     - el: 垂直角度
+    - flower: 花材名（点群の合成に使う、不明なら None）
     """
     conn.execute(
-      "INSERT INTO branches(arr_id, role, length, azimuth, elevation) VALUES (?, ?, ?, ?, ?)",
-      (arr_id, role, length, az, el)
+      "INSERT INTO branches(arr_id, role, length, azimuth, elevation, flower) VALUES (?, ?, ?, ?, ?, ?)",
+      (arr_id, role, length, az, el, flower)
     )
-    conn.commit()
+
+
+def save_branches(conn, arr_id, branches):
+    """
+    branches テーブルに複数の枝情報をまとめて追加する（commit は呼び出し側）
+    - arr_id: arrangements.id
+    - branches: {role: (length, az, el)} または {role: (length, az, el, flower)} の dict
+    """
+    conn.executemany(
+      "INSERT INTO branches(arr_id, role, length, azimuth, elevation, flower) VALUES (?, ?, ?, ?, ?, ?)",
+      [(arr_id, role, *params[:3], params[3] if len(params) > 3 else None)
+       for role, params in branches.items()]
+    )
+
+
+def save_arrangement(arr, branches):
+    """
+    arrangements と branches を 1 トランザクションで保存し、arr_id を返却する
+    - arr: {"artist", "comment", "vase_width", "vase_height"} の dict
+    - branches: {role: (length, az, el)} の dict
+    """
+    with transaction() as conn:
+        arr_id = write_arrangement(conn, None, arr, branches)
+    return arr_id
+
+
+def write_arrangement(conn, arr_id, arr, branches):
+    """
+    save_arrangement の本体（commit は呼び出し側）
+    - arr_id: 予約済みの ID、None なら自動採番
+    """
+    arr_id = save_arrangement_metadata(
+        conn,
+        arr.get("artist", "unknown"),
+        arr.get("comment", ""),
+        arr.get("vase_width"),
+        arr.get("vase_height"),
+        arr_id=arr_id,
+    )
+    save_branches(conn, arr_id, branches)
+    return arr_id
+
+
+def save_pointcloud(arr_id, file_path, feats=None, content_hash=None):
+    """
+    pointclouds テーブルに点群ファイルと特徴量を保存する（1 トランザクション）
+    - feats: extract_pointcloud_features の戻り値。None ならファイルパスのみ
+      （feature_mode 列に計算時のモードを記録する）
+    - content_hash: 頂点バッファのハッシュ（pointcloud_io.points_hash）
+    """
+    with transaction() as conn:
+        write_pointcloud(conn, arr_id, file_path, feats, content_hash)
+
+
+def write_pointcloud(conn, arr_id, file_path, feats=None, content_hash=None):
+    """
+    save_pointcloud の本体（commit は呼び出し側）
+    - feats が None なら特徴量抽出待ち (status='pending') の行を作り直す
+    - feats があれば特徴量を書き込み status='done' にする（attempts は保持）
+      feats["state"]（マージ可能な特徴量の状態）があれば feature_state 列に保存する
+      feats["merged"] が真なら merged=1（差分マージの近似値、ハッシュ再利用の対象外）
+    - content_hash が None なら既存の値を保持する
+    """
+    if feats is None:
+        conn.execute(
+            "INSERT OR REPLACE INTO pointclouds(arr_id, file_path, status, content_hash)"
+            " VALUES (?,?,'pending',?)",
+            (arr_id, file_path, content_hash),
+        )
+        return
+    conn.execute(
+        """
+      INSERT INTO pointclouds (
+        arr_id, file_path, num_points,
+        centroid_x, centroid_y, centroid_z,
+        bbox_x, bbox_y, bbox_z,
+        hull_volume, hull_area,
+        avg_normal_x, avg_normal_y, avg_normal_z,
+        curvature_mean, curvature_std, feature_mode, content_hash, feature_state, merged, status
+      ) VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,'done')
+      ON CONFLICT(arr_id) DO UPDATE SET
+        file_path=excluded.file_path, num_points=excluded.num_points,
+        centroid_x=excluded.centroid_x, centroid_y=excluded.centroid_y,
+        centroid_z=excluded.centroid_z,
+        bbox_x=excluded.bbox_x, bbox_y=excluded.bbox_y, bbox_z=excluded.bbox_z,
+        hull_volume=excluded.hull_volume, hull_area=excluded.hull_area,
+        avg_normal_x=excluded.avg_normal_x, avg_normal_y=excluded.avg_normal_y,
+        avg_normal_z=excluded.avg_normal_z,
+        curvature_mean=excluded.curvature_mean, curvature_std=excluded.curvature_std,
+        feature_mode=excluded.feature_mode,
+        content_hash=COALESCE(excluded.content_hash, content_hash),
+        feature_state=excluded.feature_state, merged=excluded.merged,
+        status='done', error=NULL
+    """,
+        (
+            arr_id,
+            file_path,
+            feats["num_points"],
+            *feats["centroid"],
+            *feats["bbox"],
+            feats["hull_volume"],
+            feats["hull_area"],
+            *feats["avg_normal"],
+            feats["curvature_mean"],
+            feats["curvature_std"],
+            feats.get("mode", "exact"),
+            content_hash,
+            feats.get("state"),
+            int(feats.get("merged", False)),
+        ),
+    )
+
+
+def find_features_by_hash(conn, content_hash, modes):
+    """
+    同じ頂点バッファ (content_hash) について計算済みの特徴量を探し、
+    extract_pointcloud_features と同じ形の dict で返却する（無ければ None）
+    - modes: 使ってよい feature_mode を優先順に並べたもの
+    - 差分マージで求めた行 (merged=1) は全点からの抽出と値が一致しないため使わない
+    """
+    placeholders = ",".join("?" * len(modes))
+    rows = conn.execute(
+        f"""
+      SELECT feature_mode, num_points,
+        centroid_x, centroid_y, centroid_z,
+        bbox_x, bbox_y, bbox_z,
+        hull_volume, hull_area,
+        avg_normal_x, avg_normal_y, avg_normal_z,
+        curvature_mean, curvature_std, feature_state
+      FROM pointclouds
+      WHERE content_hash = ? AND status = 'done' AND merged = 0
+        AND feature_mode IN ({placeholders})
+    """,
+        (content_hash, *modes),
+    ).fetchall()
+    if not rows:
+        return None
+    row = min(rows, key=lambda r: modes.index(r[0]))
+    return {
+        "num_points": row[1],
+        "centroid": row[2:5],
+        "bbox": row[5:8],
+        "hull_volume": row[8],
+        "hull_area": row[9],
+        "avg_normal": row[10:13],
+        "curvature_mean": row[13],
+        "curvature_std": row[14],
+        "mode": row[0],
+        "state": row[15],
+    }
+
+
+def write_pointcloud_error(conn, arr_id, error):
+    """
+    特徴量抽出の失敗を記録する（commit は呼び出し側）
+    status='failed' にしてエラー内容を保存し、attempts（失敗回数）を 1 増やす
+    """
+    conn.execute(
+        "UPDATE pointclouds SET status = 'failed', error = ?, attempts = attempts + 1"
+        " WHERE arr_id = ?",
+        (error, arr_id),
+    )
+
+
+def get_pointcloud(conn, arr_id):
+    """
+    pointclouds の 1 行を列名つきの dict で返却する（無ければ None）
+    feature_state（バイナリ）は含めない
+    """
+    cur = conn.execute("SELECT * FROM pointclouds WHERE arr_id = ?", (arr_id,))
+    row = cur.fetchone()
+    if row is None:
+        return None
+    row = dict(zip([c[0] for c in cur.description], row))
+    del row["feature_state"]
+    return row
+
+
+def get_pointcloud_state(conn, arr_id):
+    """
+    特徴量の差分更新に使う (status, feature_mode, content_hash, feature_state) を
+    返却する（行が無ければ None）
+    """
+    return conn.execute(
+        "SELECT status, feature_mode, content_hash, feature_state FROM pointclouds WHERE arr_id = ?",
+        (arr_id,),
+    ).fetchone()
+
+
+def list_pointclouds_to_recompute(conn):
+    """
+    exact 以外のモードまたは差分マージで計算した点群と、特徴量抽出に失敗した点群の
+    (arr_id, file_path, content_hash) 一覧を返却する
+    """
+    return conn.execute(
+        "SELECT arr_id, file_path, content_hash FROM pointclouds"
+        " WHERE status = 'failed' OR (status = 'done' AND (feature_mode != 'exact' OR merged = 1))"
+        " ORDER BY arr_id"
+    ).fetchall()
+
+
+def update_pointcloud_features_by_path(conn, rows):
+    """
+    file_path が一致する pointclouds の行すべてに特徴量をまとめて書き込む
+    （commit は呼び出し側、重複排除で 1 ファイルを複数行が参照する場合も 1 回で済む）
+    - rows: (file_path, feats) のリスト
+    """
+    conn.executemany(
+        """
+      UPDATE pointclouds SET
+        num_points = ?,
+        centroid_x = ?, centroid_y = ?, centroid_z = ?,
+        bbox_x = ?, bbox_y = ?, bbox_z = ?,
+        hull_volume = ?, hull_area = ?,
+        avg_normal_x = ?, avg_normal_y = ?, avg_normal_z = ?,
+        curvature_mean = ?, curvature_std = ?, feature_mode = ?,
+        feature_state = ?, merged = ?, status = 'done', error = NULL
+      WHERE file_path = ?
+    """,
+        [
+            (
+                feats["num_points"],
+                *map(float, feats["centroid"]),
+                *map(float, feats["bbox"]),
+                feats["hull_volume"],
+                feats["hull_area"],
+                *map(float, feats["avg_normal"]),
+                feats["curvature_mean"],
+                feats["curvature_std"],
+                feats.get("mode", "exact"),
+                feats.get("state"),
+                int(feats.get("merged", False)),
+                file_path,
+            )
+            for file_path, feats in rows
+        ],
+    )
+
+
+def upsert_spatial_features(conn, rows):
+    """
+    spatial_features テーブルにまとめて書き込む（既存の arr_id は上書き、commit は呼び出し側）
+    - rows: (arr_id, centroid_x, centroid_y, balance_score) のリスト
+    """
+    conn.executemany(
+        """
+      INSERT INTO spatial_features(arr_id, centroid_x, centroid_y, balance_score)
+      VALUES (?,?,?,?)
+      ON CONFLICT(arr_id) DO UPDATE SET
+        centroid_x=excluded.centroid_x, centroid_y=excluded.centroid_y,
+        balance_score=excluded.balance_score
+    """,
+        rows,
+    )
+
+
+def upsert_color_features(conn, rows):
+    """
+    color_features テーブルにまとめて書き込む（既存の arr_id は上書き、commit は呼び出し側）
+    - rows: (arr_id, avg_r, avg_g, avg_b) のリスト
+    """
+    conn.executemany(
+        """
+      INSERT INTO color_features(arr_id, avg_r, avg_g, avg_b)
+      VALUES (?,?,?,?)
+      ON CONFLICT(arr_id) DO UPDATE SET
+        avg_r=excluded.avg_r, avg_g=excluded.avg_g, avg_b=excluded.avg_b
+    """,
+        rows,
+    )
+
+
+def write_image_features(conn, arr_id, feats):
+    """
+    画像特徴量を spatial_features / color_features に書き込む（commit は呼び出し側）
+    - feats: extract_image_features の戻り値
+    """
+    upsert_spatial_features(
+        conn, [(arr_id, feats["centroid_x"], feats["centroid_y"], feats["balance_score"])]
+    )
+    upsert_color_features(conn, [(arr_id, feats["avg_r"], feats["avg_g"], feats["avg_b"])])
+
+
+def get_branches(conn, arr_id):
+    """arrangement の枝を {role: (length, az, el, flower)} の dict で返却する"""
+    return {
+        role: (length, az, el, flower)
+        for role, length, az, el, flower in conn.execute(
+            "SELECT role, length, azimuth, elevation, flower FROM branches WHERE arr_id = ?",
+            (arr_id,),
+        )
+    }
+
+
+def list_branches_without_pointcloud(conn):
+    """
+    pointclouds に行が無い arrangement の枝を
+    {arr_id: {role: (length, az, el, flower)}} の dict で返却する（arr_id 昇順）
+    """
+    result = {}
+    for arr_id, role, length, az, el, flower in conn.execute(
+        """
+      SELECT b.arr_id, b.role, b.length, b.azimuth, b.elevation, b.flower
+      FROM branches b
+      WHERE NOT EXISTS (SELECT 1 FROM pointclouds p WHERE p.arr_id = b.arr_id)
+      ORDER BY b.arr_id
+    """
+    ):
+        result.setdefault(arr_id, {})[role] = (length, az, el, flower)
+    return result
+
+
+def list_pointcloud_paths(conn):
+    """pointclouds から参照されているファイルパスの集合を返却する"""
+    return {row[0] for row in conn.execute("SELECT DISTINCT file_path FROM pointclouds")}
+
+
+def rename_pointcloud_path(conn, old_path, new_path):
+    """
+    file_path が old_path の pointclouds の行をすべて new_path に付け替える
+    （ファイル形式の変換用）。更新した行数を返却する
+    """
+    return conn.execute(
+        "UPDATE pointclouds SET file_path = ? WHERE file_path = ?", (new_path, old_path)
+    ).rowcount
+
+
+ARRANGEMENT_COLUMNS = ["id", "artist", "comment", "vase_width", "vase_height", "created_at"]
+
+
+def iter_arrangements(conn, after_id=0, limit=50, vase_width=None, vase_height=None,
+                      artist=None, created_from=None, created_to=None):
+    """
+    arrangements を id 昇順に最大 limit 件、dict で 1 件ずつ返すジェネレータ
+    （キーセットページング: 次のページは最後の id を after_id に渡す）
+    - vase_width / vase_height / artist: 一致で絞り込み
+    - created_from / created_to: created_at の範囲（"YYYY-MM-DD HH:MM:SS" 形式、両端を含む）
+    """
+    where, params = ["id > ?"], [after_id]
+    for column, value in (("vase_width", vase_width), ("vase_height", vase_height), ("artist", artist)):
+        if value is not None:
+            where.append(f"{column} = ?")
+            params.append(value)
+    if created_from is not None:
+        where.append("created_at >= ?")
+        params.append(created_from)
+    if created_to is not None:
+        where.append("created_at <= ?")
+        params.append(created_to)
+    cur = conn.execute(
+        f"SELECT {', '.join(ARRANGEMENT_COLUMNS)} FROM arrangements"
+        f" WHERE {' AND '.join(where)} ORDER BY id LIMIT ?",
+        (*params, limit),
+    )
+    for row in cur:
+        yield dict(zip(ARRANGEMENT_COLUMNS, row))
+
+
+POINTCLOUD_FEATURE_COLUMNS = [
+    "file_path", "num_points",
+    "centroid_x", "centroid_y", "centroid_z",
+    "bbox_x", "bbox_y", "bbox_z",
+    "hull_volume", "hull_area",
+    "avg_normal_x", "avg_normal_y", "avg_normal_z",
+    "curvature_mean", "curvature_std", "feature_mode", "status",
+]
+
+
+def get_arrangement_detail(conn, arr_id):
+    """
+    arrangement と枝・特徴量を 1 回のクエリで読み出して dict で返却する（無ければ None）
+    - branches: {role: {"length", "azimuth", "elevation", "flower"}}
+    - features: {"pointcloud", "spatial", "color"}（未登録のものは None）
+    """
+    pc_cols = ", ".join(f"p.{c}" for c in POINTCLOUD_FEATURE_COLUMNS)
+    rows = conn.execute(
+        f"""
+      SELECT {', '.join(f"a.{c}" for c in ARRANGEMENT_COLUMNS)},
+        b.role, b.length, b.azimuth, b.elevation, b.flower,
+        s.arr_id, s.centroid_x, s.centroid_y, s.balance_score,
+        c.arr_id, c.avg_r, c.avg_g, c.avg_b,
+        p.arr_id, {pc_cols}
+      FROM arrangements a
+      LEFT JOIN branches b ON b.arr_id = a.id
+      LEFT JOIN spatial_features s ON s.arr_id = a.id
+      LEFT JOIN color_features c ON c.arr_id = a.id
+      LEFT JOIN pointclouds p ON p.arr_id = a.id
+      WHERE a.id = ?
+    """,
+        (arr_id,),
+    ).fetchall()
+    if not rows:
+        return None
+    first = rows[0]
+    n = len(ARRANGEMENT_COLUMNS)
+    detail = dict(zip(ARRANGEMENT_COLUMNS, first[:n]))
+    detail["branches"] = {
+        row[n]: {"length": row[n + 1], "azimuth": row[n + 2], "elevation": row[n + 3], "flower": row[n + 4]}
+        for row in rows
+        if row[n] is not None
+    }
+    s, c, p = first[n + 5 : n + 9], first[n + 9 : n + 13], first[n + 13 :]
+    detail["features"] = {
+        "spatial": None if s[0] is None else dict(zip(("centroid_x", "centroid_y", "balance_score"), s[1:])),
+        "color": None if c[0] is None else dict(zip(("avg_r", "avg_g", "avg_b"), c[1:])),
+        "pointcloud": None if p[0] is None else dict(zip(POINTCLOUD_FEATURE_COLUMNS, p[1:])),
+    }
+    return detail
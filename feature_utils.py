@@ -1,5 +1,15 @@
-import cv2, numpy as np
-import open3d as o3d
+import itertools
+import json
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+import pointcloud_io
+from lazy_import import lazy_module
+
+# Heavy imports are deferred to the first call that needs them
+cv2 = lazy_module("cv2")
+o3d = lazy_module("open3d")
 
 
 # 2D Spatial Features (Monochrome Images)
@@ -11,7 +21,8 @@ def extract_spatial_features(mask_img_path):
     M = cv2.moments(cnt)
     h, w = m.shape
     cx, cy = (M["m10"] / M["m00"]) / w, (M["m01"] / M["m00"]) / h
-    left, right = m[:, : w // 2].sum(), m[:, w // 2 :].sum()
+    # Python ints: the uint64 sums of the mask would wrap around in left - right
+    left, right = int(m[:, : w // 2].sum()), int(m[:, w // 2 :].sum())
     bal = abs(left - right) / (left + right)
     return cx, cy, bal
 
@@ -24,51 +35,297 @@ def extract_avg_color(img_path):
     return float(avg[0]), float(avg[1]), float(avg[2])
 
 
+# Decode flags for extract_image_features(reduce=N)
+IMREAD_REDUCED = {1: "IMREAD_COLOR", 2: "IMREAD_REDUCED_COLOR_2", 4: "IMREAD_REDUCED_COLOR_4", 8: "IMREAD_REDUCED_COLOR_8"}
+
+
+# 2D Spatial + Color Features from a single decode
+# Reads the file (or encoded `data` bytes) once, optionally at 1/reduce
+# resolution. The centroid is the moments centroid of every foreground
+# pixel (gray <= 240, the threshold of extract_spatial_features) rather
+# than of the largest contour's outline.
+def extract_image_features(img_path=None, data=None, reduce=1):
+    flags = getattr(cv2, IMREAD_REDUCED[reduce])
+    if data is not None:
+        img = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), flags)
+    else:
+        img = cv2.imread(img_path, flags)
+    if img is None:
+        raise ValueError("could not decode image")
+    h, w = img.shape[:2]
+
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    m = gray <= 240
+    cols = np.count_nonzero(m, axis=0)
+    total = int(cols.sum())
+    if total == 0:
+        raise ValueError("image has no foreground pixels")
+    rows = np.count_nonzero(m, axis=1)
+    cx = float(cols @ np.arange(w)) / total / w
+    cy = float(rows @ np.arange(h)) / total / h
+    left = int(cols[: w // 2].sum())
+    bal = abs(left - (total - left)) / total
+
+    b, g, r = cv2.mean(img)[:3]
+    return {
+        "centroid_x": cx,
+        "centroid_y": cy,
+        "balance_score": bal,
+        "avg_r": r,
+        "avg_g": g,
+        "avg_b": b,
+    }
+
+
+# Point budgets of the accuracy/speed tiers of extract_pointcloud_features
+# (None = use every point)
+FEATURE_MODES = {"exact": None, "fast": 20000, "preview": 5000}
+
+# Worst-case deviation from "exact" over the GLB reference set
+# (bench_feature_modes.py): absolute for avg_normal (vector distance) and
+# curvature; every other feature is computed exactly in all modes
+FEATURE_MODE_ERRORS = {
+    "exact": {},
+    "fast": {"avg_normal": 0.05, "curvature_mean": 0.002, "curvature_std": 0.004},
+    "preview": {"avg_normal": 0.4, "curvature_mean": 0.002, "curvature_std": 0.004},
+}
+
+
 # 3D Point Cloud Features
-def extract_pointcloud_features(ply_path):
-    pcd = o3d.io.read_point_cloud(ply_path)
+# ply_path is a stored cloud in either format (pointcloud_io.load_points:
+# .pcb files are memory-mapped, .ply files parsed); `points` (an (N, 3)
+# array already in memory) skips reading it.
+# In "fast"/"preview" mode normals come from a voxel-downsampled copy and
+# curvature from a random sample of points, both capped at the mode's point
+# budget; the other features always use every point.
+# The result carries "state", the encoded pointcloud_feature_state it was
+# derived from, so features can later be extended with more points.
+def extract_pointcloud_features(ply_path, points=None, mode="exact"):
+    if points is None:
+        points = pointcloud_io.load_points(ply_path)
+    state = pointcloud_feature_state(points, mode)
+    feats = features_from_state(state)
+    feats["state"] = encode_feature_state(state)
+    return feats
+
+
+def pointcloud_feature_state(points, mode="exact"):
+    """
+    Mergeable summary of a point cloud: point count, coordinate sums and
+    min/max, convex hull vertices / volume / area, normal sums and
+    curvature count / sum / sum of squares. Merge two with merge_feature_states and turn the result
+    into features with features_from_state.
+    """
+    if mode not in FEATURE_MODES:
+        raise ValueError(f"unknown feature mode: {mode}")
+    pcd = o3d.geometry.PointCloud()
+    pcd.points = o3d.utility.Vector3dVector(np.asarray(points, dtype=np.float64))
     pts = np.asarray(pcd.points)
     num_pts = pts.shape[0]
-    centroid = pts.mean(axis=0)
 
-    aabb = pcd.get_axis_aligned_bounding_box()
-    bbox = aabb.get_extent()
+    hull = convex_hull(pcd)
+
+    budget = FEATURE_MODES[mode]
+    down = downsample_pointcloud(pcd, budget)
+    down.estimate_normals(o3d.geometry.KDTreeSearchParamKNN(knn=30))
+    normals = np.asarray(down.normals)
+
+    # Curvature statistics from a fixed random sample of points, each with
+    # its full-resolution neighbourhood
+    queries = None
+    if budget is not None and num_pts > budget:
+        queries = np.random.default_rng(0).choice(num_pts, budget, replace=False)
+    curvatures = estimate_curvatures(pts, radius=0.01, queries=queries)
 
+    return {
+        "num_points": num_pts,
+        "sum": pts.sum(axis=0),
+        "min": pts.min(axis=0),
+        "max": pts.max(axis=0),
+        **hull,
+        "normal_sum": normals.sum(axis=0),
+        "normal_count": len(normals),
+        "curvature_count": len(curvatures),
+        "curvature_sum": float(curvatures.sum()),
+        "curvature_sumsq": float((curvatures ** 2).sum()),
+        "mode": mode,
+        "merged": False,
+    }
+
+
+def convex_hull(pcd):
+    """{hull_vertices, hull_volume, hull_area} of an Open3D point cloud's convex hull."""
     hull, _ = pcd.compute_convex_hull()
-    hull_volume = hull.get_volume()
-    hull_area = hull.get_surface_area()
-
-    pcd.estimate_normals(o3d.geometry.KDTreeSearchParamKNN(knn=30))
-    normals = np.asarray(pcd.normals)
-    avg_normal = normals.mean(axis=0)
-
-    pcd_tree = o3d.geometry.KDTreeFlann(pcd)
-    curvatures = []
-    for i in range(num_pts):
-        _, idx, _ = pcd_tree.search_radius_vector_3d(pcd.points[i], 0.01)
-        neigh = pts[idx, :]
-        if neigh.shape[0] < 3:
-            continue
-        cov = np.cov(neigh.T) + np.eye(3) * 1e-6
-        eigs = np.linalg.eigvalsh(cov)
-        if np.any(np.isnan(eigs)) or np.any(eigs < 0):
-            continue
-        curvature = eigs[0] / eigs.sum()
-        curvatures.append(curvature)
-
-    if len(curvatures) == 0:
+    return {
+        "hull_vertices": np.asarray(hull.vertices).copy(),
+        "hull_volume": hull.get_volume(),
+        "hull_area": hull.get_surface_area(),
+    }
+
+
+def extend_pointcloud_features(state, points, mode="exact"):
+    """
+    extract_pointcloud_features of a cloud whose encoded state is `state`
+    after adding `points`; only the new points are processed.
+    """
+    merged = merge_feature_states(
+        decode_feature_state(state), pointcloud_feature_state(points, mode)
+    )
+    feats = features_from_state(merged)
+    feats["state"] = encode_feature_state(merged)
+    return feats
+
+
+def merge_feature_states(a, b):
+    """
+    State of the union of two point clouds, in time proportional to their
+    hull sizes. Normals and curvature are per-point statistics of each part,
+    so only points whose neighbourhoods span both parts differ from a
+    full recompute. The result has the coarser of the two modes and is
+    flagged "merged", so it is never reused as the extraction of its
+    content hash (database.find_features_by_hash).
+    """
+    modes = list(FEATURE_MODES)
+    hull_pts = np.concatenate([a["hull_vertices"], b["hull_vertices"]])
+    pcd = o3d.geometry.PointCloud()
+    pcd.points = o3d.utility.Vector3dVector(hull_pts)
+    return {
+        "num_points": a["num_points"] + b["num_points"],
+        "sum": a["sum"] + b["sum"],
+        "min": np.minimum(a["min"], b["min"]),
+        "max": np.maximum(a["max"], b["max"]),
+        **convex_hull(pcd),
+        "normal_sum": a["normal_sum"] + b["normal_sum"],
+        "normal_count": a["normal_count"] + b["normal_count"],
+        "curvature_count": a["curvature_count"] + b["curvature_count"],
+        "curvature_sum": a["curvature_sum"] + b["curvature_sum"],
+        "curvature_sumsq": a["curvature_sumsq"] + b["curvature_sumsq"],
+        "mode": max(a["mode"], b["mode"], key=modes.index),
+        "merged": True,
+    }
+
+
+def features_from_state(state):
+    """The extract_pointcloud_features dict (without "state") of a feature state."""
+    n = state["curvature_count"]
+    if n == 0:
         curv_mean, curv_std = 0.0, 0.0
     else:
-        curv_mean = float(np.mean(curvatures))
-        curv_std = float(np.std(curvatures))
+        curv_mean = state["curvature_sum"] / n
+        curv_std = float(np.sqrt(max(state["curvature_sumsq"] / n - curv_mean ** 2, 0.0)))
 
     return {
-        "num_points": num_pts,
-        "centroid": centroid,
-        "bbox": bbox,
-        "hull_volume": hull_volume,
-        "hull_area": hull_area,
-        "avg_normal": avg_normal,
+        "num_points": state["num_points"],
+        "centroid": state["sum"] / state["num_points"],
+        "bbox": state["max"] - state["min"],
+        "hull_volume": state["hull_volume"],
+        "hull_area": state["hull_area"],
+        "avg_normal": state["normal_sum"] / max(state["normal_count"], 1),
         "curvature_mean": curv_mean,
         "curvature_std": curv_std,
+        "mode": state["mode"],
+        "merged": state["merged"],
+        "effective_points": state["normal_count"],
+    }
+
+
+# Feature states are stored as a small JSON header followed by the hull
+# vertices as little-endian float64
+def encode_feature_state(state):
+    header = {
+        k: (v.tolist() if isinstance(v, np.ndarray) else v)
+        for k, v in state.items()
+        if k != "hull_vertices"
     }
+    header["hull_count"] = len(state["hull_vertices"])
+    return (
+        json.dumps(header, separators=(",", ":")).encode("utf-8")
+        + b"\n"
+        + np.ascontiguousarray(state["hull_vertices"], dtype="<f8").tobytes()
+    )
+
+
+def decode_feature_state(data):
+    header, _, body = bytes(data).partition(b"\n")
+    state = json.loads(header)
+    count = state.pop("hull_count")
+    for key in ("sum", "min", "max", "normal_sum"):
+        state[key] = np.array(state[key], dtype=float)
+    state["hull_vertices"] = np.frombuffer(body, dtype="<f8", count=count * 3).reshape(count, 3).copy()
+    return state
+
+
+# Voxel-downsample to at most `budget` points (voxel size found by bisection)
+def downsample_pointcloud(pcd, budget, iterations=10):
+    n = len(pcd.points)
+    if budget is None or n <= budget:
+        return pcd
+    lo, hi = 0.0, float(np.linalg.norm(pcd.get_axis_aligned_bounding_box().get_extent()))
+    best = pcd.voxel_down_sample(hi)
+    for _ in range(iterations):
+        mid = (lo + hi) / 2
+        down = pcd.voxel_down_sample(mid)
+        if len(down.points) <= budget:
+            hi, best = mid, down
+        else:
+            lo = mid
+    return best
+
+
+# Upper-triangle (row, column) indices of a 3x3 matrix
+UPPER = np.triu_indices(3)
+
+
+# Per-point surface variation (smallest covariance eigenvalue / trace)
+def estimate_curvatures(pts, radius=0.01, queries=None, chunk_size=2048):
+    """
+    Batched equivalent of a per-point loop of
+    KDTreeFlann.search_radius_vector_3d + np.cov + np.linalg.eigvalsh.
+    Points with fewer than 3 neighbours (or invalid eigenvalues) are skipped.
+    `queries` (indices into pts) restricts the loop to those points, still
+    using their full neighbourhoods in pts.
+
+    Neighbourhoods are queried `chunk_size` points at a time (on every
+    core), so memory stays bounded by one chunk's neighbour pairs.
+    """
+    pts = np.asarray(pts, dtype=float)
+    if pts.shape[0] == 0:
+        return np.empty(0)
+    queries = np.arange(pts.shape[0]) if queries is None else np.asarray(queries, dtype=np.intp)
+    n = len(queries)
+    # Open3D's radius search is strict (< r); cKDTree includes d == r
+    r = np.nextafter(radius, 0)
+    tree = cKDTree(pts)
+
+    # Moments of the neighbour offsets relative to each query point keep the
+    # sums small; every point is its own neighbour with offset 0
+    count = np.zeros(n)
+    s1 = np.zeros((n, 3))
+    s2 = np.zeros((n, 3, 3))
+    for start in range(0, n, chunk_size):
+        chunk = queries[start:start + chunk_size]
+        m = len(chunk)
+        neighbours = tree.query_ball_point(pts[chunk], r, workers=-1, return_sorted=False)
+        lengths = np.fromiter(map(len, neighbours), dtype=np.intp, count=m)
+        j = np.fromiter(itertools.chain.from_iterable(neighbours), dtype=np.intp, count=lengths.sum())
+        d = pts[j] - np.repeat(pts[chunk], lengths, axis=0)
+        # Neighbours arrive grouped by query point and every group holds at
+        # least the point itself, so segment sums need no scatter
+        starts = np.concatenate(([0], np.cumsum(lengths[:-1])))
+        rows = slice(start, start + m)
+        count[rows] = lengths
+        s1[rows] = np.add.reduceat(d, starts, axis=0)
+        s2[rows][:, UPPER[0], UPPER[1]] = np.add.reduceat(d[:, UPPER[0]] * d[:, UPPER[1]], starts, axis=0)
+    s2 += np.triu(s2, 1).transpose(0, 2, 1)
+
+    valid = count >= 3
+    count, s1, s2 = count[valid], s1[valid], s2[valid]
+    # np.cov (ddof=1) from the first and second moments
+    mean = s1 / count[:, None]
+    cov = (s2 - count[:, None, None] * mean[:, :, None] * mean[:, None, :]) / (
+        count - 1
+    )[:, None, None]
+    cov += np.eye(3) * 1e-6
+    eigs = np.linalg.eigvalsh(cov)
+    ok = ~np.isnan(eigs).any(axis=1) & ~(eigs < 0).any(axis=1)
+    return eigs[ok, 0] / eigs[ok].sum(axis=1)
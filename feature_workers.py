@@ -0,0 +1,125 @@
+"""
+FeatureWorkers:
+  Worker processes that extract point-cloud features after an upload has
+  been written to disk, storing the result (or the error) in the
+  pointclouds table and retrying failed extractions with backoff.
+"""
+
+import atexit
+import threading
+import traceback
+from concurrent.futures.process import BrokenProcessPool
+
+import database
+import worker_processes
+
+
+def _extract(file_path, mode, merge=None):
+    import feature_utils
+
+    if merge is not None:
+        state, points = merge
+        return feature_utils.extend_pointcloud_features(state, points, mode)
+    return feature_utils.extract_pointcloud_features(file_path, mode=mode)
+
+
+class FeatureWorkers:
+    """
+    Args:
+        write: write(fn, *args) runs fn(conn, *args) in a transaction
+        on_done: optional on_done(arr_id, feats) called after features are saved
+        workers: number of worker processes
+        max_attempts: extractions tried per upload before it stays "failed"
+        retry_delay: seconds before the first retry, doubled on each retry
+    """
+
+    def __init__(self, write, on_done=None, workers=2, max_attempts=3, retry_delay=1.0):
+        self.write = write
+        self.on_done = on_done
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.submitted = 0
+        self.done = 0
+        self.failed = 0
+        self.retried = 0
+        self._lock = threading.Lock()
+        self._closed = False
+        self._executor = self._new_executor()
+        atexit.register(self.close)
+
+    def _new_executor(self):
+        return worker_processes.new_executor(self.workers, preload=["open3d"])
+
+    def start(self):
+        """
+        Fork every worker process now, before other threads (e.g. the
+        prewarm thread) can hold locks a forked child would inherit. The
+        workers import open3d in the background.
+        """
+        worker_processes.warm(self._executor, self.workers)
+        return self
+
+    def submit(self, arr_id, file_path, mode="exact", attempt=1, merge=None):
+        """
+        Queue feature extraction for an upload whose row is already "pending".
+
+        merge=(state, points) instead extends the encoded feature state of
+        the cloud without `points` by those points only
+        (feature_utils.extend_pointcloud_features).
+        """
+        with self._lock:
+            if self._closed:
+                return
+            self.submitted += 1
+            try:
+                future = self._executor.submit(_extract, file_path, mode, merge)
+            except BrokenProcessPool:
+                # A worker died (e.g. crashed inside open3d); start a fresh pool
+                self._executor.shutdown(wait=False)
+                self._executor = self._new_executor()
+                future = self._executor.submit(_extract, file_path, mode, merge)
+        future.add_done_callback(
+            lambda f: self._finished(f, arr_id, file_path, mode, attempt, merge)
+        )
+
+    def _finished(self, future, arr_id, file_path, mode, attempt, merge=None):
+        try:
+            feats = future.result()
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            print(f"[WARN] extract failed for arr_id={arr_id} (attempt {attempt}): {error}")
+            self.failed += 1
+            self.write(database.write_pointcloud_error, arr_id, error)
+            if attempt < self.max_attempts:
+                self.retried += 1
+                timer = threading.Timer(
+                    self.retry_delay * 2 ** (attempt - 1),
+                    self.submit,
+                    (arr_id, file_path, mode, attempt + 1, merge),
+                )
+                timer.daemon = True
+                timer.start()
+            return
+        try:
+            self.write(database.write_pointcloud, arr_id, file_path, feats)
+            self.done += 1
+            if self.on_done is not None:
+                self.on_done(arr_id, feats)
+        except Exception:
+            traceback.print_exc()
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            executor = self._executor
+        executor.shutdown(wait=True, cancel_futures=True)
+
+    def stats(self):
+        return {
+            "workers": self.workers,
+            "submitted": self.submitted,
+            "done": self.done,
+            "failed": self.failed,
+            "retried": self.retried,
+        }
@@ -0,0 +1,237 @@
+"""
+Minimal binary glTF (.glb) reading and writing.
+
+  read_glb      - (json, bin chunk) of a .glb file
+  read_accessor - an accessor as a NumPy array (dequantized when normalized)
+  mesh_geometry - per-primitive positions / normals / uvs / triangles
+  mesh_instances - (mesh index, 4x4 world matrix) for every mesh node
+  GlbWriter     - assemble a new binary chunk and write a .glb file
+"""
+
+import json
+import struct
+
+import numpy as np
+
+GLB_MAGIC = 0x46546C67
+CHUNK_JSON = 0x4E4F534A
+CHUNK_BIN = 0x004E4942
+
+# accessor.componentType -> NumPy dtype
+COMPONENT_TYPES = {
+    5120: np.int8,
+    5121: np.uint8,
+    5122: np.int16,
+    5123: np.uint16,
+    5125: np.uint32,
+    5126: np.float32,
+}
+COMPONENT_CODES = {np.dtype(t): code for code, t in COMPONENT_TYPES.items()}
+TYPE_SIZES = {"SCALAR": 1, "VEC2": 2, "VEC3": 3, "VEC4": 4, "MAT4": 16}
+
+ARRAY_BUFFER = 34962
+ELEMENT_ARRAY_BUFFER = 34963
+
+
+class GlbError(ValueError):
+    """Raised for .glb files this reader cannot handle."""
+
+
+def read_glb(path):
+    """(glTF JSON dict, binary chunk bytes) of a .glb file."""
+    with open(path, "rb") as f:
+        data = f.read()
+    if len(data) < 20:
+        raise GlbError("truncated GLB file")
+    magic, version, length = struct.unpack_from("<III", data, 0)
+    if magic != GLB_MAGIC or version != 2:
+        raise GlbError("not a glTF 2.0 binary file")
+    gltf, bin_chunk = None, b""
+    offset = 12
+    while offset < min(length, len(data)):
+        chunk_length, chunk_type = struct.unpack_from("<II", data, offset)
+        chunk = data[offset + 8:offset + 8 + chunk_length]
+        if chunk_type == CHUNK_JSON:
+            gltf = json.loads(chunk)
+        elif chunk_type == CHUNK_BIN:
+            bin_chunk = chunk
+        offset += 8 + chunk_length
+    if gltf is None:
+        raise GlbError("GLB file has no JSON chunk")
+    return gltf, bin_chunk
+
+
+def buffer_view_bytes(gltf, bin_chunk, index):
+    view = gltf["bufferViews"][index]
+    start = view.get("byteOffset", 0)
+    return bin_chunk[start:start + view["byteLength"]]
+
+
+def read_accessor(gltf, bin_chunk, index):
+    """Accessor `index` as an (count, n) array (count,) for scalars."""
+    accessor = gltf["accessors"][index]
+    dtype = np.dtype(COMPONENT_TYPES[accessor["componentType"]])
+    n = TYPE_SIZES[accessor["type"]]
+    count = accessor["count"]
+    if "bufferView" not in accessor:
+        values = np.zeros((count, n), dtype=dtype)
+    else:
+        view = gltf["bufferViews"][accessor["bufferView"]]
+        start = view.get("byteOffset", 0) + accessor.get("byteOffset", 0)
+        stride = view.get("byteStride") or dtype.itemsize * n
+        values = np.ndarray(
+            (count, n), dtype=dtype.newbyteorder("<"), buffer=bin_chunk,
+            offset=start, strides=(stride, dtype.itemsize),
+        )
+    if accessor.get("normalized"):
+        info = np.iinfo(dtype)
+        if info.min < 0:
+            values = np.maximum(values / info.max, -1.0)
+        else:
+            values = values / info.max
+    values = np.array(values)
+    return values[:, 0] if accessor["type"] == "SCALAR" else values
+
+
+def mesh_geometry(gltf, bin_chunk, mesh_index):
+    """
+    [{positions, normals, uvs, triangles, primitive}] for the triangle
+    primitives of a mesh; normals/uvs are None when absent.
+    """
+    result = []
+    for primitive in gltf["meshes"][mesh_index]["primitives"]:
+        if primitive.get("mode", 4) != 4:
+            continue
+        attributes = primitive["attributes"]
+        positions = read_accessor(gltf, bin_chunk, attributes["POSITION"]).astype(float)
+        if "indices" in primitive:
+            indices = read_accessor(gltf, bin_chunk, primitive["indices"]).astype(np.int64)
+        else:
+            indices = np.arange(len(positions))
+        result.append({
+            "positions": positions,
+            "normals": (
+                read_accessor(gltf, bin_chunk, attributes["NORMAL"]).astype(float)
+                if "NORMAL" in attributes else None
+            ),
+            "uvs": (
+                read_accessor(gltf, bin_chunk, attributes["TEXCOORD_0"]).astype(float)
+                if "TEXCOORD_0" in attributes else None
+            ),
+            "triangles": indices.reshape(-1, 3),
+            "primitive": primitive,
+        })
+    return result
+
+
+def node_matrix(node):
+    """Local 4x4 transform of a glTF node (matrix or translation/rotation/scale)."""
+    if "matrix" in node:
+        return np.array(node["matrix"], dtype=float).reshape(4, 4).T  # column-major
+    x, y, z, w = node.get("rotation", (0.0, 0.0, 0.0, 1.0))
+    rotation = np.array([
+        [1 - 2 * (y * y + z * z), 2 * (x * y - z * w), 2 * (x * z + y * w)],
+        [2 * (x * y + z * w), 1 - 2 * (x * x + z * z), 2 * (y * z - x * w)],
+        [2 * (x * z - y * w), 2 * (y * z + x * w), 1 - 2 * (x * x + y * y)],
+    ])
+    matrix = np.eye(4)
+    matrix[:3, :3] = rotation * np.asarray(node.get("scale", (1.0, 1.0, 1.0)), dtype=float)
+    matrix[:3, 3] = node.get("translation", (0.0, 0.0, 0.0))
+    return matrix
+
+
+def mesh_instances(gltf):
+    """[(mesh index, 4x4 world matrix)] for the mesh nodes of the default scene."""
+    nodes = gltf.get("nodes", [])
+    scenes = gltf.get("scenes", [])
+    if scenes:
+        roots = scenes[gltf.get("scene", 0)].get("nodes", [])
+    else:
+        children = {c for node in nodes for c in node.get("children", [])}
+        roots = [i for i in range(len(nodes)) if i not in children]
+    result = []
+    stack = [(i, np.eye(4)) for i in roots]
+    while stack:
+        i, parent = stack.pop()
+        matrix = parent @ node_matrix(nodes[i])
+        if "mesh" in nodes[i]:
+            result.append((nodes[i]["mesh"], matrix))
+        stack.extend((c, matrix) for c in nodes[i].get("children", []))
+    return result
+
+
+class GlbWriter:
+    """Collects buffer views and accessors for a new single-buffer .glb."""
+
+    def __init__(self, gltf):
+        self.gltf = gltf
+        self.gltf["bufferViews"] = []
+        self.gltf["accessors"] = []
+        self._chunks = []
+        self._length = 0
+
+    def add_view(self, data, target=None, stride=None):
+        """Append bytes as a 4-byte aligned buffer view; returns its index."""
+        view = {"buffer": 0, "byteOffset": self._length, "byteLength": len(data)}
+        if target is not None:
+            view["target"] = target
+        if stride is not None:
+            view["byteStride"] = stride
+        self._chunks.append(data)
+        self._length += len(data)
+        pad = -self._length % 4
+        if pad:
+            self._chunks.append(b"\0" * pad)
+            self._length += pad
+        self.gltf["bufferViews"].append(view)
+        return len(self.gltf["bufferViews"]) - 1
+
+    def add_accessor(self, values, type_, normalized=False, target=ARRAY_BUFFER,
+                     bounds=False, pad_to=None):
+        """
+        Append an (count, n) array as an accessor; returns its index.
+
+        pad_to widens each element with zero components so vertex
+        attributes keep the 4-byte stride alignment glTF requires.
+        """
+        values = np.ascontiguousarray(values)
+        dtype = values.dtype.newbyteorder("<")
+        n = TYPE_SIZES[type_]
+        rows = values.reshape(len(values), -1)
+        stride = None
+        if pad_to is not None and pad_to > n:
+            padded = np.zeros((len(values), pad_to), dtype=dtype)
+            padded[:, :n] = rows
+            rows = padded
+            stride = pad_to * dtype.itemsize
+        view = self.add_view(rows.astype(dtype).tobytes(), target=target, stride=stride)
+        accessor = {
+            "bufferView": view,
+            "componentType": COMPONENT_CODES[np.dtype(values.dtype)],
+            "count": len(values),
+            "type": type_,
+        }
+        if normalized:
+            accessor["normalized"] = True
+        if bounds:
+            flat = values.reshape(len(values), -1)
+            cast = float if dtype.kind == "f" else int
+            accessor["min"] = [cast(v) for v in flat.min(axis=0)]
+            accessor["max"] = [cast(v) for v in flat.max(axis=0)]
+        self.gltf["accessors"].append(accessor)
+        return len(self.gltf["accessors"]) - 1
+
+    def write(self, path):
+        """Write the .glb file; returns its size in bytes."""
+        self.gltf["buffers"] = [{"byteLength": self._length}]
+        text = json.dumps(self.gltf, separators=(",", ":")).encode("utf-8")
+        text += b" " * (-len(text) % 4)
+        body = b"".join(self._chunks)
+        total = 12 + 8 + len(text) + 8 + len(body)
+        with open(path, "wb") as f:
+            f.write(struct.pack("<III", GLB_MAGIC, 2, total))
+            f.write(struct.pack("<II", len(text), CHUNK_JSON))
+            f.write(text)
+            f.write(struct.pack("<II", len(body), CHUNK_BIN))
+            f.write(body)
+        return total
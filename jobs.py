@@ -0,0 +1,153 @@
+"""
+JobManager:
+  Background optimization jobs with status polling and an event log that
+  can be streamed to clients as server-sent events.
+"""
+
+import json
+import threading
+import traceback
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+
+class JobsBusy(Exception):
+    """Raised when every job slot (running or queued) is taken."""
+
+
+class Job:
+    def __init__(self):
+        self.id = uuid.uuid4().hex
+        self.status = "queued"
+        self.result = None
+        self.error = None
+        self.events = []
+        self._cond = threading.Condition()
+
+    def publish(self, event, data):
+        with self._cond:
+            self.events.append((event, data))
+            self._cond.notify_all()
+
+    def start(self):
+        with self._cond:
+            self.status = "running"
+            self.events.append(("status", {"status": "running"}))
+            self._cond.notify_all()
+
+    def finish(self, status, result=None, error=None):
+        with self._cond:
+            self.status = status
+            self.result = result
+            self.error = error
+            if status == "done":
+                self.events.append(("done", result))
+            else:
+                self.events.append(("error", {"error": error}))
+            self._cond.notify_all()
+
+    @property
+    def finished(self):
+        return self.status in ("done", "error")
+
+    def to_dict(self):
+        with self._cond:
+            return {
+                "id": self.id,
+                "status": self.status,
+                "result": self.result,
+                "error": self.error,
+            }
+
+    def stream(self, keepalive=15.0):
+        """Yield the job's events in SSE wire format until it finishes."""
+        sent = 0
+        while True:
+            with self._cond:
+                if sent == len(self.events) and not self.finished:
+                    self._cond.wait(timeout=keepalive)
+                pending = self.events[sent:]
+                sent = len(self.events)
+                finished = self.finished
+            if not pending and not finished:
+                # Comment line keeps proxies from closing an idle stream
+                yield ": keepalive\n\n"
+            for event, data in pending:
+                yield f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+            if finished and sent == len(self.events):
+                return
+
+
+class JobManager:
+    """
+    Args:
+        workers: threads running jobs concurrently
+        max_queue: jobs allowed to wait beyond the ones running
+        max_jobs: finished jobs kept for polling before the oldest are dropped
+    """
+
+    def __init__(self, workers=4, max_queue=16, max_jobs=1000):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.max_jobs = max_jobs
+        self.submitted = 0
+        self.rejected = 0
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(workers + max_queue)
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+
+    def submit(self, fn, *args):
+        """
+        Run fn(job, *args) in the background; its return value is the result.
+        Raises JobsBusy when workers + max_queue jobs are already unfinished.
+        """
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise JobsBusy("job queue is full")
+        job = Job()
+        with self._lock:
+            self._jobs[job.id] = job
+            self.submitted += 1
+            self._evict()
+        try:
+            self._executor.submit(self._run, job, fn, args)
+        except Exception:
+            self._slots.release()
+            raise
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _run(self, job, fn, args):
+        job.start()
+        try:
+            job.finish("done", result=fn(job, *args))
+        except Exception as e:
+            traceback.print_exc()
+            job.finish("error", error=str(e))
+        finally:
+            self._slots.release()
+
+    def _evict(self):
+        # Called with the lock held; only finished jobs are dropped
+        excess = len(self._jobs) - self.max_jobs
+        if excess <= 0:
+            return
+        for job_id in [j for j, job in self._jobs.items() if job.finished][:excess]:
+            del self._jobs[job_id]
+
+    def stats(self):
+        with self._lock:
+            unfinished = sum(not job.finished for job in self._jobs.values())
+            return {
+                "workers": self.workers,
+                "max_queue": self.max_queue,
+                "unfinished": unfinished,
+                "submitted": self.submitted,
+                "rejected": self.rejected,
+            }
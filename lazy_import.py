@@ -0,0 +1,61 @@
+"""
+Lazy loading of heavy third-party modules (openjij, open3d, cv2).
+
+`lazy_module(name)` returns a stand-in that imports the real module on
+first attribute access. The time each import took is recorded so the
+server can report where its startup and first-request cost goes.
+"""
+
+import importlib
+import sys
+import threading
+import time
+import types
+
+import_times = {}
+_lock = threading.RLock()
+
+
+def load(name):
+    """Import `name` (once) and record how long it took."""
+    with _lock:
+        if name in import_times:
+            return sys.modules[name]
+        t0 = time.perf_counter()
+        module = importlib.import_module(name)
+        import_times[name] = time.perf_counter() - t0
+        return module
+
+
+class LazyModule(types.ModuleType):
+    def __init__(self, name):
+        super().__init__(name)
+        self.__dict__["_lazy_name"] = name
+
+    def __getattr__(self, attr):
+        return getattr(load(self._lazy_name), attr)
+
+
+def lazy_module(name):
+    return LazyModule(name)
+
+
+def prewarm(names):
+    """Import `names` one after another in a background thread."""
+
+    def run():
+        for name in names:
+            try:
+                load(name)
+            except ImportError as e:
+                print(f"[WARN] prewarm of {name} failed: {e}", flush=True)
+
+    thread = threading.Thread(target=run, name="prewarm", daemon=True)
+    thread.start()
+    return thread
+
+
+def report():
+    """Seconds spent importing each lazily loaded module so far."""
+    with _lock:
+        return {name: round(t, 4) for name, t in import_times.items()}
@@ -0,0 +1,60 @@
+"""
+ModelCache:
+  Bounded LRU cache of compiled QUBO models with hit/miss counters.
+"""
+
+import threading
+from collections import OrderedDict
+
+
+class ModelCache:
+    def __init__(self, maxsize=64):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_build(self, key, build):
+        """
+        Return the value cached under `key`, calling `build()` on a miss.
+        The build runs outside the lock so a slow build never blocks hits.
+        """
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+
+        value = build()
+
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+def catalog_key(flower_lengths, candidate_lengths):
+    """Hashable, order-preserving key for a flower/candidate-length catalog."""
+    return (
+        tuple(flower_lengths.items()),
+        tuple((f, tuple(lengths)) for f, lengths in candidate_lengths.items()),
+    )
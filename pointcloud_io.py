@@ -0,0 +1,430 @@
+"""
+Point-cloud upload and PLY parsing helpers.
+
+  read_body    - a whole request body as bytes, enforcing a size limit
+  receive_ply  - parse a PLY request body as it streams in and store its
+                 vertices as a content-addressed .pcb file in one pass
+  read_ply_points - parse the vertex positions of an ASCII or binary PLY
+                 file into an (N, 3) array; binary files are memory-mapped
+  write_points / read_points - the compact point format (.pcb): a 64-byte
+                 header and a raw float32 or int16-quantized vertex array,
+                 optionally gzip/zstd compressed; uncompressed files are
+                 memory-mapped with no parse step
+  load_points  - vertex positions of a stored cloud in either format
+  points_hash  - content address (BLAKE2b) of a vertex buffer
+  store_points - write a cloud to its content-addressed path, deduplicating
+"""
+
+import gzip
+import hashlib
+import io
+import itertools
+import os
+import struct
+import tempfile
+import zlib
+
+import numpy as np
+
+try:
+    import zstandard
+except ImportError:  # optional: zstd-compressed point files
+    zstandard = None
+
+_ZSTD_ERRORS = (zstandard.ZstdError,) if zstandard is not None else ()
+
+CHUNK_SIZE = 1 << 20
+
+# .pcb header: magic, version, dtype code, compression code, reserved,
+# point count, per-axis scale and offset (point = stored * scale + offset)
+POINTS_EXT = ".pcb"
+POINTS_MAGIC = b"IKPC"
+POINTS_VERSION = 1
+POINTS_HEADER = struct.Struct("<4sBBBBQ3d3d")
+POINT_DTYPES = {"float32": (1, "<f4"), "int16": (2, "<i2")}
+POINT_COMPRESSIONS = {None: 0, "gzip": 1, "zstd": 2}
+
+# Format of clouds stored by the server: uncompressed float32 is
+# memory-mapped on read and holds what the viewer exports exactly
+DEFAULT_POINT_FORMAT = {"dtype": "float32", "compression": None}
+
+# PLY property types -> NumPy scalar types
+PLY_TYPES = {
+    "char": "i1", "int8": "i1",
+    "uchar": "u1", "uint8": "u1",
+    "short": "i2", "int16": "i2",
+    "ushort": "u2", "uint16": "u2",
+    "int": "i4", "int32": "i4",
+    "uint": "u4", "uint32": "u4",
+    "float": "f4", "float32": "f4",
+    "double": "f8", "float64": "f8",
+}
+
+
+class UploadTooLarge(Exception):
+    """Raised when an upload exceeds the size limit."""
+
+
+class PlyError(ValueError):
+    """Raised for PLY files this parser cannot read."""
+
+
+class _BodyReader(io.RawIOBase):
+    """
+    Raw binary reader over a request body stream. With gzipped=True the
+    body is inflated on the fly, never more than chunk_size at a time. The
+    limit applies to the bytes produced, so a small compressed body cannot
+    expand past it.
+    """
+
+    def __init__(self, stream, max_bytes, gzipped=False, chunk_size=CHUNK_SIZE):
+        self.stream = stream
+        self.max_bytes = max_bytes
+        self.chunk_size = chunk_size
+        self.inflate = zlib.decompressobj(16 + zlib.MAX_WBITS) if gzipped else None
+        self.bytes_read = 0
+        self._pending = memoryview(b"")
+        self._eof = False
+
+    def readable(self):
+        return True
+
+    def tell(self):
+        return self.bytes_read - len(self._pending)
+
+    def readinto(self, b):
+        while not self._pending:
+            if self._eof:
+                return 0
+            self._fill()
+        n = min(len(b), len(self._pending))
+        b[:n] = self._pending[:n]
+        self._pending = self._pending[n:]
+        return n
+
+    def _fill(self):
+        if self.inflate is not None and self.inflate.unconsumed_tail:
+            data = self.inflate.decompress(self.inflate.unconsumed_tail, self.chunk_size)
+        else:
+            chunk = self.stream.read(self.chunk_size)
+            if chunk and self.inflate is not None:
+                data = self.inflate.decompress(chunk, self.chunk_size)
+            elif chunk:
+                data = chunk
+            else:
+                self._eof = True
+                data = b""
+                if self.inflate is not None:
+                    data = self.inflate.flush()
+                    if not self.inflate.eof:
+                        raise zlib.error("truncated gzip stream")
+        self.bytes_read += len(data)
+        if self.bytes_read > self.max_bytes:
+            raise UploadTooLarge(f"upload exceeds {self.max_bytes} bytes")
+        self._pending = memoryview(data)
+
+
+def read_body(stream, max_bytes, chunk_size=CHUNK_SIZE):
+    """
+    The whole of `stream` as bytes, read chunk by chunk; raises
+    UploadTooLarge as soon as more than max_bytes have arrived, so a
+    chunked body without Content-Length is never buffered past the limit.
+    """
+    return _BodyReader(stream, max_bytes, chunk_size=chunk_size).readall()
+
+
+def _read_header(f):
+    """Parse a PLY header; returns (format, elements, header_bytes)."""
+    if f.readline().strip() != b"ply":
+        raise PlyError("not a PLY file")
+    fmt = None
+    elements = []  # [(name, count, [(prop, type)])]
+    while True:
+        line = f.readline()
+        if not line:
+            raise PlyError("unterminated PLY header")
+        words = line.decode("ascii", "replace").split()
+        if not words or words[0] in ("comment", "obj_info"):
+            continue
+        if words[0] == "format":
+            if len(words) != 3:
+                raise PlyError("malformed PLY format line")
+            fmt = words[1]
+        elif words[0] == "element":
+            if len(words) != 3:
+                raise PlyError("malformed PLY element line")
+            try:
+                count = int(words[2])
+            except ValueError:
+                raise PlyError(f"bad PLY element count: {words[2]}")
+            if count < 0:
+                raise PlyError(f"bad PLY element count: {words[2]}")
+            elements.append((words[1], count, []))
+        elif words[0] == "property":
+            if not elements:
+                raise PlyError("property before element")
+            if len(words) < 3 or (words[1] == "list" and len(words) != 5):
+                raise PlyError("malformed PLY property line")
+            if words[1] == "list":
+                elements[-1][2].append((words[-1], None))
+            else:
+                elements[-1][2].append((words[2], words[1]))
+        elif words[0] == "end_header":
+            if fmt is None:
+                raise PlyError("PLY header has no format line")
+            return fmt, elements, f.tell()
+
+
+def _vertex_layout(fmt, elements):
+    """(count, property names, record dtype or None for ASCII) of the vertex element."""
+    if not elements or elements[0][0] != "vertex":
+        raise PlyError("first PLY element must be 'vertex'")
+    _, count, props = elements[0]
+    names = [name for name, _ in props]
+    if not {"x", "y", "z"} <= set(names):
+        raise PlyError("vertex element has no x/y/z properties")
+    if fmt == "ascii":
+        return count, names, None
+    if fmt == "binary_little_endian":
+        order = "<"
+    elif fmt == "binary_big_endian":
+        order = ">"
+    else:
+        raise PlyError(f"unsupported PLY format: {fmt}")
+    if any(t is None for _, t in props):
+        raise PlyError("list properties on vertices are not supported")
+    try:
+        dtype = np.dtype([(name, order + PLY_TYPES[t]) for name, t in props])
+    except KeyError as e:
+        raise PlyError(f"unknown PLY property type: {e.args[0]}")
+    return count, names, dtype
+
+
+def _xyz(vertices):
+    return np.stack([vertices[a] for a in ("x", "y", "z")], axis=1)
+
+
+def read_ply_points(path):
+    """
+    Vertex positions of a PLY file as a float64 (N, 3) array.
+
+    Binary files are memory-mapped and only the x/y/z columns are copied
+    out; ASCII files are parsed row by row without loading the text whole.
+    Only vertex data is read, so faces or other trailing elements are
+    ignored.
+    """
+    with open(path, "rb") as f:
+        fmt, elements, offset = _read_header(f)
+        count, names, dtype = _vertex_layout(fmt, elements)
+        if dtype is None:
+            cols = [names.index(a) for a in ("x", "y", "z")]
+            pts = np.loadtxt(f, dtype=float, usecols=cols, max_rows=count, ndmin=2)
+            if pts.shape[0] != count:
+                raise PlyError("PLY file has fewer vertices than its header")
+            return pts
+
+    if os.path.getsize(path) < offset + count * dtype.itemsize:
+        raise PlyError("PLY file has fewer vertices than its header")
+    if count == 0:
+        return np.empty((0, 3))
+    vertices = np.memmap(path, dtype=dtype, mode="r", offset=offset, shape=(count,))
+    pts = np.empty((count, 3))
+    for k, a in enumerate(("x", "y", "z")):
+        pts[:, k] = vertices[a]
+    del vertices
+    return pts
+
+
+def _vertex_blocks(f, count, names, dtype, chunk_size):
+    """Yield the vertex positions that follow a PLY header in `f` as (m, 3) blocks."""
+    if dtype is None:
+        cols = [names.index(a) for a in ("x", "y", "z")]
+        rows = max(1, chunk_size // 64)
+        left = count
+        while left:
+            lines = list(itertools.islice(f, min(rows, left)))
+            if not lines:
+                break
+            block = np.loadtxt(io.BytesIO(b"".join(lines)), dtype=float, usecols=cols, ndmin=2)
+            if block.shape[0] != len(lines):
+                raise PlyError("blank or malformed PLY vertex line")
+            left -= len(lines)
+            yield block
+    else:
+        rows = max(1, chunk_size // dtype.itemsize)
+        left = count
+        while left:
+            m = min(rows, left)
+            data = f.read(m * dtype.itemsize)
+            if len(data) < m * dtype.itemsize:
+                break
+            left -= m
+            yield _xyz(np.frombuffer(data, dtype=dtype))
+    if left:
+        raise PlyError("PLY file has fewer vertices than its header")
+
+
+def receive_ply(stream, directory, max_bytes, gzipped=False, chunk_size=CHUNK_SIZE):
+    """
+    Parse a PLY request body as it streams in and store its vertices as
+    directory/<content_hash>.pcb (float32, uncompressed); returns
+    (file_path, content_hash, count).
+
+    The body is read once: each block of vertices is converted to float32,
+    hashed (points_hash of the stored values) and appended to a uniquely
+    named temporary file, which is renamed once the hash is known. Memory
+    stays at one block whatever the size of the scan, and concurrent
+    uploads never share a file. Only vertex data is read; anything after
+    it in the body is ignored.
+    """
+    body = io.BufferedReader(_BodyReader(stream, max_bytes, gzipped, chunk_size), chunk_size)
+    fmt, elements, _ = _read_header(body)
+    count, names, dtype = _vertex_layout(fmt, elements)
+    digest = hashlib.blake2b(digest_size=20)
+    fd, tmp_path = tempfile.mkstemp(suffix=".part", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(_points_header(count, POINT_DTYPES["float32"][0], None, np.ones(3), np.zeros(3)))
+            for block in _vertex_blocks(body, count, names, dtype, chunk_size):
+                block = block.astype("<f4")
+                digest.update(block.astype("<f8").tobytes())
+                f.write(block.tobytes())
+        content_hash = digest.hexdigest()
+        path = os.path.join(directory, f"{content_hash}{POINTS_EXT}")
+        if os.path.exists(path):
+            os.remove(tmp_path)
+        else:
+            os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return path, content_hash, count
+
+
+def _points_header(count, dtype_code, compression, scale, offset):
+    return POINTS_HEADER.pack(
+        POINTS_MAGIC, POINTS_VERSION, dtype_code, POINT_COMPRESSIONS[compression], 0,
+        count, *scale, *offset,
+    )
+
+
+def write_points(path, points, dtype="float32", compression=None):
+    """
+    Write an (N, 3) array in the compact point format and return the file
+    size. dtype "int16" quantizes each axis over its range (65535 steps);
+    compression is None, "gzip" or "zstd" (needs the zstandard package).
+    Written under a unique temporary name and renamed into place.
+    """
+    if dtype not in POINT_DTYPES:
+        raise ValueError(f"unknown point dtype: {dtype}")
+    if compression not in POINT_COMPRESSIONS:
+        raise ValueError(f"unknown point compression: {compression}")
+    if compression == "zstd" and zstandard is None:
+        raise ValueError("zstd compression needs the zstandard package")
+    pts = np.asarray(points, dtype=float).reshape(-1, 3)
+    code, np_dtype = POINT_DTYPES[dtype]
+    if dtype == "int16":
+        lo = pts.min(axis=0) if len(pts) else np.zeros(3)
+        hi = pts.max(axis=0) if len(pts) else np.zeros(3)
+        offset = (lo + hi) / 2
+        scale = np.maximum((hi - lo) / 2 / 32767, np.finfo(float).tiny)
+        data = np.round((pts - offset) / scale).astype(np_dtype)
+    else:
+        offset, scale = np.zeros(3), np.ones(3)
+        data = pts.astype(np_dtype)
+
+    payload = data.tobytes()
+    if compression == "gzip":
+        payload = gzip.compress(payload, compresslevel=6, mtime=0)
+    elif compression == "zstd":
+        payload = zstandard.ZstdCompressor(level=3).compress(payload)
+    header = _points_header(len(pts), code, compression, scale, offset)
+    # A unique temporary name: concurrent writers of the same
+    # content-addressed path must not share (and tear) one file
+    fd, tmp_path = tempfile.mkstemp(suffix=".part", dir=os.path.dirname(path) or ".")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(header)
+            f.write(payload)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return len(header) + len(payload)
+
+
+def read_points(path):
+    """
+    Vertex positions of a compact point file as an (N, 3) array: the
+    memory-mapped float32 data itself for uncompressed float32 files,
+    otherwise a decompressed / dequantized copy.
+    """
+    with open(path, "rb") as f:
+        header = f.read(POINTS_HEADER.size)
+        if len(header) < POINTS_HEADER.size:
+            raise PlyError("truncated point file")
+        magic, version, dtype_code, compression_code, _, count, *rest = POINTS_HEADER.unpack(header)
+        if magic != POINTS_MAGIC or version != POINTS_VERSION:
+            raise PlyError("not a point file")
+        dtypes = {code: np_dtype for code, np_dtype in POINT_DTYPES.values()}
+        compressions = {code: name for name, code in POINT_COMPRESSIONS.items()}
+        if dtype_code not in dtypes or compression_code not in compressions:
+            raise PlyError("unknown point file encoding")
+        dtype = np.dtype(dtypes[dtype_code])
+        compression = compressions[compression_code]
+        if compression is not None:
+            payload = f.read()
+    scale, offset = np.array(rest[:3]), np.array(rest[3:])
+
+    if compression is None:
+        if os.path.getsize(path) < POINTS_HEADER.size + count * 3 * dtype.itemsize:
+            raise PlyError("point file has fewer points than its header")
+        if count == 0:
+            return np.empty((0, 3), dtype=dtype)
+        data = np.memmap(path, dtype=dtype, mode="r", offset=POINTS_HEADER.size, shape=(count, 3))
+    else:
+        if compression == "zstd" and zstandard is None:
+            raise PlyError("zstd point file needs the zstandard package")
+        try:
+            if compression == "gzip":
+                payload = gzip.decompress(payload)
+            else:
+                payload = zstandard.ZstdDecompressor().decompress(payload)
+        except (EOFError, OSError, zlib.error) + _ZSTD_ERRORS as e:
+            raise PlyError(f"corrupt point file: {e}")
+        if len(payload) != count * 3 * dtype.itemsize:
+            raise PlyError("point file has fewer points than its header")
+        data = np.frombuffer(payload, dtype=dtype).reshape(count, 3)
+    if dtype_code == POINT_DTYPES["int16"][0]:
+        return data * scale + offset
+    return data
+
+
+def load_points(path):
+    """Vertex positions of a stored cloud (.pcb or .ply) as a float64 (N, 3) array."""
+    if path.endswith(POINTS_EXT):
+        return np.asarray(read_points(path), dtype=float)
+    return read_ply_points(path)
+
+
+def points_hash(points):
+    """
+    BLAKE2b digest (hex) of the vertex positions as little-endian float64,
+    so ASCII and binary exports of the same vertices hash the same.
+    """
+    buf = np.ascontiguousarray(points, dtype="<f8")
+    return hashlib.blake2b(buf.tobytes(), digest_size=20).hexdigest()
+
+
+def store_points(points, directory, content_hash, **point_format):
+    """
+    Write `points` to `directory/<content_hash>.pcb` (DEFAULT_POINT_FORMAT
+    unless overridden) and return that path. A cloud with the same hash
+    already stored is kept as is, so each distinct cloud is on disk once.
+    """
+    path = os.path.join(directory, f"{content_hash}{POINTS_EXT}")
+    if not os.path.exists(path):
+        write_points(path, points, **{**DEFAULT_POINT_FORMAT, **point_format})
+    return path
@@ -0,0 +1,184 @@
+"""
+Server-side point clouds of arrangements, built from the stored branches
+(role, length, azimuth, elevation, flower) instead of a browser upload.
+
+Each flower's GLB model is sampled once (area-weighted points on its
+surface) and cached in memory and under asset_build/samples/. A branch
+then places those samples the way the viewer places the model
+(static/main.js loadModelPromise):
+
+    model.scale = length
+    model.position = (offset_x, -min_y * length, offset_z)  # base on y = 0
+    pivot.rotation = Euler(0, azimuth, elevation, "XYZ")
+
+All branches of an arrangement are transformed in one batched matrix
+product.
+"""
+
+import os
+import threading
+
+import numpy as np
+
+import glb_io
+import pointcloud_io
+from assets import file_hash
+
+SOURCE_DIR = os.path.join("static", "3d")
+SAMPLE_DIR = os.path.join("asset_build", "samples")
+SAMPLES_PER_BRANCH = 10000
+
+# Flower -> model file; mirrors flowerModelMapping in static/main.js
+FLOWER_ASSETS = {
+    "桜": "keisakura.glb",
+    "リアトリス": "ria.glb",
+    "ディル": "digu.glb",
+    "モルセラ": "morusera.glb",
+    "バラ": "rose.glb",
+    "牡丹": "hasu.glb",
+    "ユリ": "yuri.glb",
+    "紅梅": "morusera.glb",
+    "啓扇桜": "morusera.glb",
+}
+# Role -> (offset_x, offset_z) the viewer adds before rotating the pivot
+BRANCH_OFFSETS = {
+    "main": (0.1, 0.0),
+    "guest": (0.0, 0.0),
+    "middle1": (0.1, 0.0),
+    "middle2": (0.0, 0.1),
+    "middle3": (0.0, 0.0),
+    "middle4": (0.0, 0.0),
+}
+
+
+class SynthError(ValueError):
+    """Raised when an arrangement's point cloud cannot be synthesized."""
+
+
+_samples = {}  # (path, n) -> (points, min_y)
+_lock = threading.Lock()
+
+
+def sample_surface(positions, triangles, n, rng):
+    """n points spread uniformly (by area) over a triangle mesh."""
+    a, b, c = (positions[triangles[:, i]] for i in range(3))
+    areas = np.linalg.norm(np.cross(b - a, c - a), axis=1)
+    if areas.sum() <= 0:
+        raise SynthError("model has no surface area")
+    tri = rng.choice(len(triangles), size=n, p=areas / areas.sum())
+    u, v = rng.random(n), rng.random(n)
+    # Reflect samples outside the triangle back into it
+    outside = u + v > 1
+    u[outside], v[outside] = 1 - u[outside], 1 - v[outside]
+    return a[tri] + u[:, None] * (b[tri] - a[tri]) + v[:, None] * (c[tri] - a[tri])
+
+
+def _model_surface(path, n, digest):
+    gltf, bin_chunk = glb_io.read_glb(path)
+    positions, triangles, min_y = [], [], np.inf
+    offset = 0
+    for mesh_index, matrix in glb_io.mesh_instances(gltf):
+        for g in glb_io.mesh_geometry(gltf, bin_chunk, mesh_index):
+            local = g["positions"]
+            world = local @ matrix[:3, :3].T + matrix[:3, 3]
+            # three.js Box3.setFromObject: the transformed corners of each
+            # geometry's own bounding box
+            lo, hi = local.min(axis=0), local.max(axis=0)
+            corners = np.array([[x, y, z] for x in (lo[0], hi[0]) for y in (lo[1], hi[1]) for z in (lo[2], hi[2])])
+            min_y = min(min_y, float((corners @ matrix[:3, :3].T + matrix[:3, 3])[:, 1].min()))
+            positions.append(world)
+            triangles.append(g["triangles"] + offset)
+            offset += len(world)
+    if not positions:
+        raise SynthError(f"{path} has no triangle meshes")
+    rng = np.random.default_rng(int(digest, 16))
+    points = sample_surface(np.concatenate(positions), np.concatenate(triangles), n, rng)
+    return points, min_y
+
+
+def model_samples(path, n=SAMPLES_PER_BRANCH):
+    """(points (n, 3) in model space, min_y) for a GLB model, sampled once."""
+    key = (path, n)
+    with _lock:
+        cached = _samples.get(key)
+    if cached is not None:
+        return cached
+    digest = file_hash(path)
+    stem = os.path.splitext(os.path.basename(path))[0]
+    cache_path = os.path.join(SAMPLE_DIR, f"{stem}.{digest}.{n}.npz")
+    if os.path.exists(cache_path):
+        with np.load(cache_path) as data:
+            cached = data["points"], float(data["min_y"])
+    else:
+        cached = _model_surface(path, n, digest)
+        os.makedirs(SAMPLE_DIR, exist_ok=True)
+        tmp_path = f"{cache_path}.part.npz"
+        np.savez(tmp_path, points=cached[0], min_y=cached[1])
+        os.replace(tmp_path, cache_path)
+    with _lock:
+        _samples[key] = cached
+    return cached
+
+
+def euler_xyz(azimuth, elevation):
+    """(B, 3, 3) rotations of three.js Euler(0, azimuth, elevation, "XYZ") in degrees."""
+    ay, az = np.radians(azimuth), np.radians(elevation)
+    cy, sy, cz, sz = np.cos(ay), np.sin(ay), np.cos(az), np.sin(az)
+    zero = np.zeros_like(ay)
+    # R = Ry(azimuth) @ Rz(elevation)
+    return np.stack([
+        np.stack([cy * cz, -cy * sz, sy], axis=-1),
+        np.stack([sz, cz, zero], axis=-1),
+        np.stack([-sy * cz, sy * sz, cy], axis=-1),
+    ], axis=-2)
+
+
+def arrangement_points(branches, n=SAMPLES_PER_BRANCH, source_dir=SOURCE_DIR):
+    """
+    Point cloud of an arrangement as an (n * branches, 3) array.
+
+    branches: {role: (length, azimuth, elevation, flower)}
+    """
+    if not branches:
+        raise SynthError("arrangement has no branches")
+    samples, lengths, angles, offsets = [], [], [], []
+    for role, (length, azimuth, elevation, flower) in sorted(branches.items()):
+        if flower not in FLOWER_ASSETS:
+            raise SynthError(f"no model for flower {flower!r} ({role})")
+        path = os.path.join(source_dir, FLOWER_ASSETS[flower])
+        if not os.path.exists(path):
+            raise SynthError(f"model {path} for {flower} is missing")
+        points, min_y = model_samples(path, n)
+        offset_x, offset_z = BRANCH_OFFSETS.get(role, (0.0, 0.0))
+        samples.append(points)
+        lengths.append(length)
+        angles.append((azimuth, elevation))
+        offsets.append((offset_x, -min_y * length, offset_z))
+
+    P = np.stack(samples)  # (B, n, 3)
+    s = np.asarray(lengths, dtype=float)[:, None, None]
+    t = np.asarray(offsets, dtype=float)[:, None, :]
+    angles = np.asarray(angles, dtype=float)
+    R = euler_xyz(angles[:, 0], angles[:, 1])
+    world = np.einsum("bij,bnj->bni", R, s * P + t)
+    return world.reshape(-1, 3)
+
+
+def arrangement_cloud(branches, n=SAMPLES_PER_BRANCH):
+    """
+    (float32 points, content_hash) of an arrangement's cloud, hashed as it
+    reads back from its stored float32 file, like an uploaded cloud.
+    """
+    points = arrangement_points(branches, n).astype(np.float32)
+    return points, pointcloud_io.points_hash(points)
+
+
+def write_cloud(arr_id, branches, directory="pcds", n=SAMPLES_PER_BRANCH):
+    """
+    Synthesize an arrangement's cloud and store it like an upload, under
+    directory/<content_hash>.pcb; returns (file_path, content_hash, points).
+    """
+    points, content_hash = arrangement_cloud(branches, n)
+    os.makedirs(directory, exist_ok=True)
+    file_path = pointcloud_io.store_points(points, directory, content_hash)
+    return file_path, content_hash, points.astype(float)
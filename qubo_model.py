@@ -0,0 +1,212 @@
+"""
+QuboModel:
+  Sparse upper-triangular QUBO assembled from NumPy blocks over named
+  one-hot variable groups.
+"""
+
+import numpy as np
+from scipy import sparse
+
+
+class QuboModel:
+    """
+    Collects penalty terms as dense NumPy blocks and assembles them into
+    a single upper-triangular sparse matrix.
+
+    Variables are organised in named groups (e.g. "main_az"), each holding
+    the list of candidate values it chooses between.
+    """
+
+    def __init__(self):
+        self.groups = {}
+        self.n = 0
+        self._rows = []
+        self._cols = []
+        self._vals = []
+        self._Q = None
+        self._dense = None
+        self._dict = None
+        self._tables = None
+
+    def add_group(self, name, candidates):
+        """Register a one-hot group and return its variable offset."""
+        offset = self.n
+        self.groups[name] = (offset, list(candidates))
+        self.n += len(candidates)
+        return offset
+
+    def copy(self):
+        """Independent model with the same groups and terms."""
+        other = QuboModel()
+        other.groups = dict(self.groups)
+        other.n = self.n
+        other._rows = list(self._rows)
+        other._cols = list(self._cols)
+        other._vals = list(self._vals)
+        return other
+
+    def offset(self, name):
+        return self.groups[name][0]
+
+    def size(self, name):
+        return len(self.groups[name][1])
+
+    def candidates(self, name):
+        return self.groups[name][1]
+
+    def _add_block(self, rows, cols, vals):
+        self._rows.append(rows.ravel())
+        self._cols.append(cols.ravel())
+        self._vals.append(vals.ravel())
+        self._Q = None
+        self._dense = None
+        self._dict = None
+        self._tables = None
+
+    def add_linear(self, name, costs):
+        """Add costs[i] to the diagonal entry of candidate i in group `name`."""
+        costs = np.asarray(costs, dtype=float)
+        idx = self.offset(name) + np.arange(costs.shape[0])
+        self._add_block(idx, idx, costs)
+
+    def add_quadratic(self, name1, name2, costs):
+        """
+        Add costs[i, j] to the coupling between candidate i of `name1`
+        and candidate j of `name2`. Zero entries are skipped.
+        """
+        costs = np.asarray(costs, dtype=float)
+        i, j = np.nonzero(costs)
+        rows = self.offset(name1) + i
+        cols = self.offset(name2) + j
+        # Keep the matrix upper-triangular
+        lo = np.minimum(rows, cols)
+        hi = np.maximum(rows, cols)
+        self._add_block(lo, hi, costs[i, j])
+
+    def add_one_hot(self, name, A):
+        """Penalty A * (sum_i x_i - 1)^2 without the constant term."""
+        n = self.size(name)
+        self.add_linear(name, np.full(n, -A))
+        self.add_quadratic(name, name, np.triu(np.full((n, n), 2.0 * A), k=1))
+
+    @property
+    def Q(self):
+        """Upper-triangular CSR matrix with duplicate entries summed."""
+        if self._Q is None:
+            if self._rows:
+                rows = np.concatenate(self._rows)
+                cols = np.concatenate(self._cols)
+                vals = np.concatenate(self._vals)
+            else:
+                rows = cols = np.zeros(0, dtype=int)
+                vals = np.zeros(0)
+            self._Q = sparse.coo_matrix(
+                (vals, (rows, cols)), shape=(self.n, self.n)
+            ).tocsr()
+        return self._Q
+
+    def dense(self):
+        """Dense view of Q in the format accepted by openjij's sample_qubo."""
+        if self._dense is None:
+            self._dense = self.Q.toarray()
+        return self._dense
+
+    def __getstate__(self):
+        # Ship only the compiled matrix; the raw blocks and derived caches
+        # are rebuilt on demand (keeps pickles small for worker processes)
+        return {"groups": self.groups, "n": self.n, "Q": self.Q}
+
+    def __setstate__(self, state):
+        self.__init__()
+        self.groups = state["groups"]
+        self.n = state["n"]
+        coo = state["Q"].tocoo()
+        self._add_block(coo.row, coo.col, coo.data)
+        self._Q = state["Q"]
+
+    def categorical_tables(self):
+        """
+        Cost tables of the problem restricted to one-hot assignments.
+
+        Returns (unary, pairwise) where unary[g][i] is the cost of picking
+        candidate i in group g and pairwise[(g, h)][i, j] the extra cost of
+        picking i in g together with j in h (g before h, only non-zero blocks).
+        The constant -A of each one-hot penalty is not included.
+        """
+        if self._tables is None:
+            Q = self.dense()
+            names = list(self.groups)
+            spans = {
+                name: slice(self.offset(name), self.offset(name) + self.size(name))
+                for name in names
+            }
+            unary = {name: np.diag(Q)[spans[name]].copy() for name in names}
+            pairwise = {}
+            for a, g in enumerate(names):
+                for h in names[a + 1 :]:
+                    block = Q[spans[g], spans[h]] + Q[spans[h], spans[g]].T
+                    if np.any(block):
+                        pairwise[(g, h)] = block
+            self._tables = (unary, pairwise)
+        return self._tables
+
+    def assignment_vector(self, choices):
+        """0/1 vector selecting candidate choices[name] in every group."""
+        x = np.zeros(self.n, dtype=int)
+        for name, i in choices.items():
+            x[self.offset(name) + i] = 1
+        return x
+
+    def energy(self, x):
+        """QUBO energy of a 0/1 vector."""
+        x = np.asarray(x, dtype=float)
+        return float(x @ (self.Q @ x))
+
+    def choice(self, sample, name):
+        """Index of the selected candidate, or None if one-hot is violated."""
+        off = self.offset(name)
+        block = np.asarray(sample[off : off + self.size(name)])
+        hits = np.flatnonzero(block == 1)
+        return int(hits[0]) if hits.size else None
+
+    def decode_samples(self, samples):
+        """
+        Decode a whole (R, n) sample matrix at once.
+
+        Returns (choices, feasible): choices[r, g] is the argmax of group g
+        in read r (groups in registration order) and feasible[r] is True
+        when every group of read r has exactly one bit set.
+        """
+        samples = np.asarray(samples)
+        choices = np.empty((samples.shape[0], len(self.groups)), dtype=int)
+        feasible = np.ones(samples.shape[0], dtype=bool)
+        for g, (off, cands) in enumerate(self.groups.values()):
+            block = samples[:, off : off + len(cands)]
+            feasible &= block.sum(axis=1) == 1
+            choices[:, g] = block.argmax(axis=1)
+        return choices, feasible
+
+    def distinct_solutions(self, samples, energies):
+        """
+        Indices of the feasible reads with distinct choices, keeping the
+        lowest-energy read of each, in ascending energy order.
+        """
+        energies = np.asarray(energies)
+        choices, feasible = self.decode_samples(samples)
+        rows = np.flatnonzero(feasible)
+        rows = rows[np.argsort(energies[rows], kind="stable")]
+        if rows.size == 0:
+            return rows
+        # np.unique returns the first occurrence, i.e. the lowest energy
+        _, first = np.unique(choices[rows], axis=0, return_index=True)
+        return rows[np.sort(first)]
+
+    def to_dict(self):
+        """Q as {"(i, j)": value} for JSON responses."""
+        if self._dict is None:
+            coo = self.Q.tocoo()
+            self._dict = {
+                str((int(i), int(j))): float(v)
+                for i, j, v in zip(coo.row, coo.col, coo.data)
+            }
+        return self._dict
@@ -0,0 +1,41 @@
+"""
+Nightly job: recompute point-cloud features in "exact" mode for every
+upload whose features were computed in a faster, approximate mode or
+merged incrementally from a previous state, and retry uploads whose
+extraction failed.
+
+    python recompute_features.py
+"""
+
+import time
+
+import database
+import feature_utils
+
+
+def main():
+    rows = database.list_pointclouds_to_recompute(database.get_conn())
+    print(f"[recompute] {len(rows)} point clouds to recompute")
+    t0 = time.perf_counter()
+    done = 0
+    # Rows sharing a vertex buffer (content_hash) are computed once
+    computed = {}
+    for arr_id, file_path, content_hash in rows:
+        try:
+            feats = computed.get(content_hash) if content_hash else None
+            if feats is None:
+                feats = feature_utils.extract_pointcloud_features(file_path)
+                if content_hash:
+                    computed[content_hash] = feats
+        except Exception as e:
+            print(f"[WARN] recompute failed for arr_id={arr_id}: {e}")
+            with database.transaction() as conn:
+                database.write_pointcloud_error(conn, arr_id, f"{type(e).__name__}: {e}")
+            continue
+        database.save_pointcloud(arr_id, file_path, feats)
+        done += 1
+    print(f"[recompute] {done}/{len(rows)} done in {time.perf_counter() - t0:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,148 @@
-from flask import Flask, jsonify, send_from_directory, request
+import time
+
+STARTUP_T0 = time.perf_counter()
+
+from flask import Flask, Response, jsonify, send_file, send_from_directory, request
+import json
+import math
 import os
 import traceback
+import zlib
+import app as qa_app
 from app import run_ikebana_qa_3d
-from app_extend import run_ikebana_extend_optimization
+from app_extend import run_ikebana_extend_optimization, run_ikebana_full_optimization
+from assets import AssetManifest
 import database
 import feature_utils
+import lazy_import
+import pointcloud_io
+import pointcloud_synth
+from feature_workers import FeatureWorkers
+from jobs import JobManager, JobsBusy
+from similarity_index import SimilarityIndex, branch_values, pointcloud_values
+import solvers
+from solution_pool import SolutionPools
+from solver_pool import SolverBusy, SolverPool, SolverTimeout
+from write_behind import WriteBehindWriter
 
 app = Flask(__name__, static_folder="static")
 database.init_db()
 
+# Vase sizes (W, H) and the fixed flower catalog
+VASE_SIZES = {
+    "筒型花器": (10, 20),
+    "皿型花器": (10, 15),
+}
+DEFAULT_VASE_SIZE = (10, 15)
+
+FLOWER_LENGTHS = {
+    "桜": 0.4,
+    "リアトリス": 0.4,
+    "ディル": 0.4,
+    "モルセラ": 0.25,
+    "バラ": 0.25,
+    "牡丹": 0.25,
+    "ユリ": 0.25,
+}
+CANDIDATE_LENGTHS = {
+    "桜": [60, 50, 30],
+    "リアトリス": [60, 50, 30],
+    "ディル": [60, 50, 30],
+    "モルセラ": [60, 50, 30],
+    "バラ": [23, 20, 15],
+    "牡丹": [23, 17, 15],
+    "ユリ": [23, 17, 15],
+}
+
+# Optional write-behind mode (IKEBANA_WRITE_BEHIND=1): rows are written by
+# one background thread and responses only wait for the arr_id
+write_behind = None
+if os.environ.get("IKEBANA_WRITE_BEHIND") == "1":
+    write_behind = WriteBehindWriter()
+
+
+def write(fn, *args):
+    """Run fn(conn, *args) in its own transaction, or queue it in write-behind mode."""
+    if write_behind is not None:
+        write_behind.submit(fn, *args)
+        return
+    with database.transaction() as conn:
+        fn(conn, *args)
+
+
+# Content-hashed model URLs; compressed variants are built in the background
+# when `python assets.py` has not been run ahead of time
+assets = AssetManifest().scan()
+ASSET_MAX_AGE = 365 * 24 * 3600
+# Level of detail (build_lods.py) for the start page's small model previews
+START_PAGE_LOD = 2
+
+
+# Nearest-neighbour index over arrangement features, kept in step with
+# inserts. It starts empty: database.init_db() above recreates every table
+# at startup, so there is nothing to load (SimilarityIndex.from_db would
+# once the database persists across restarts)
+similarity = SimilarityIndex()
+
+
+# Point-cloud feature extraction runs in worker processes, off the request path
+feature_workers = FeatureWorkers(
+    write,
+    on_done=lambda arr_id, feats: similarity.update(arr_id, pointcloud_values(feats)),
+    workers=int(os.environ.get("IKEBANA_FEATURE_WORKERS", 2)),
+    max_attempts=int(os.environ.get("IKEBANA_FEATURE_ATTEMPTS", 3)),
+).start()
+
+
+# Optional worker processes for the samplers (IKEBANA_SOLVER_WORKERS=N)
+solver_pool = None
+if int(os.environ.get("IKEBANA_SOLVER_WORKERS", 0)) > 0:
+    solver_pool = SolverPool(
+        workers=int(os.environ["IKEBANA_SOLVER_WORKERS"]),
+        max_queue=int(os.environ.get("IKEBANA_SOLVER_QUEUE", 8)),
+        timeout=float(os.environ.get("IKEBANA_SOLVER_TIMEOUT", 30)),
+    ).start()
+
+
+def make_solver(name=None, **kwargs):
+    """Solver backend by name, run in the worker pool when one is configured."""
+    solver = solvers.get_solver(name, **kwargs)
+    if solver_pool is not None:
+        solver = solver_pool.wrap(solver)
+    return solver
+
+
+def solver_error_response(e):
+    """JSON error for a rejected (503) or timed-out (504) solver job."""
+    if isinstance(e, SolverBusy):
+        return jsonify({"error": str(e)}), 503, {"Retry-After": "1"}
+    return jsonify({"error": str(e)}), 504
+
+
+# Optional serving mode: precomputed solution pools (IKEBANA_SOLUTION_POOL=1)
+solution_pools = None
+if os.environ.get("IKEBANA_SOLUTION_POOL") == "1":
+    solution_pools = SolutionPools(
+        lambda *inputs: qa_app.sample_ikebana_solutions(
+            *inputs, solver=make_solver("sqa")
+        ),
+        capacity=int(os.environ.get("IKEBANA_SOLUTION_POOL_SIZE", 32)),
+    )
+    for W, H in set(VASE_SIZES.values()) | {DEFAULT_VASE_SIZE}:
+        for forced in ["", *FLOWER_LENGTHS]:
+            solution_pools.warm(
+                (W, H, forced),
+                (W, H, FLOWER_LENGTHS, CANDIDATE_LENGTHS, forced, 0, 0),
+            )
+
 
 # Return the start page
 @app.route("/")
 def start():
-    return send_from_directory(app.static_folder, "start.html")
+    # Model URLs in the page are rewritten to their hashed, cacheable form
+    lod = request.args.get("lod", START_PAGE_LOD, type=int)
+    with open(os.path.join(app.static_folder, "start.html"), encoding="utf-8") as f:
+        return Response(assets.rewrite(f.read(), max(lod, 0)), mimetype="text/html")
 
 
 # Return the 3D viewer
@@ -22,6 +151,54 @@ def viewer():
     return send_from_directory(app.static_folder, "index.html")
 
 
+def base_branches(result):
+    """{role: (length, azimuth, elevation, flower)} for the four base branches."""
+    return {
+        role: (
+            result[f"{role}Len"],
+            result[f"{role}Azimuth"],
+            result[f"{role}Elevation"],
+            result["assignments"].get(role),
+        )
+        for role in ("main", "guest", "middle1", "middle2")
+    }
+
+
+def extend_branches(ext):
+    """{role: (length, azimuth, elevation, flower)} for middle3/middle4."""
+    return {
+        role: (
+            ext["lengths"][role],
+            ext["angles"][f"{role}Azimuth"],
+            ext["angles"][f"{role}Elevation"],
+            ext["assignments"].get(role),
+        )
+        for role in ("middle3", "middle4")
+    }
+
+
+def save_result(W, H, branches):
+    """Save an arrangement and its branches in one transaction; return the arr_id."""
+    arr = {"artist": "unknown", "comment": "", "vase_width": W, "vase_height": H}
+    if write_behind is not None:
+        arr_id = write_behind.allocate_arr_id()
+        write_behind.submit(database.write_arrangement, arr_id, arr, branches)
+    else:
+        arr_id = database.save_arrangement(arr, branches)
+    similarity.update(arr_id, branch_values(branches))
+    return arr_id
+
+
+def save_base_result(W, H, result):
+    """Save an arrangement and its four base branches; return the arr_id."""
+    return save_result(W, H, base_branches(result))
+
+
+# /optimize?k=N returns up to N distinct arrangements from one sampler run
+MAX_TOP_K = 50
+TOP_K_READS = 4
+
+
 # Run optimization & save metadata
 @app.route("/optimize")
 def optimize():
@@ -30,86 +207,255 @@ def optimize():
     try:
         # 1) Get vase type from request → set W, H
         vase = request.args.get("vase", default="", type=str)
-        if vase == "筒型花器":
-            W, H = 10, 20
-        elif vase == "皿型花器":
-            W, H = 10, 15
-        else:
-            W, H = 10, 15
-
-        # 2) Define fixed data (candidate flower lengths)
-        flower_lengths = {
-            "桜": 0.4,
-            "リアトリス": 0.4,
-            "ディル": 0.4,
-            "モルセラ": 0.25,
-            "バラ": 0.25,
-            "牡丹": 0.25,
-            "ユリ": 0.25,
-        }
-        candidate_lengths = {
-            "桜": [60, 50, 30],
-            "リアトリス": [60, 50, 30],
-            "ディル": [60, 50, 30],
-            "モルセラ": [60, 50, 30],
-            "バラ": [23, 20, 15],
-            "牡丹": [23, 17, 15],
-            "ユリ": [23, 17, 15],
-        }
-
-        # 3) Run optimization
+        W, H = VASE_SIZES.get(vase, DEFAULT_VASE_SIZE)
+
+        # 2) Run optimization (served from the solution pool when enabled)
+        forced = request.args.get("forced_flower", default="", type=str)
+        inputs = (W, H, FLOWER_LENGTHS, CANDIDATE_LENGTHS, forced, 0, 0)
+        k = request.args.get("k", type=int)
+        if k is not None and not 1 <= k <= MAX_TOP_K:
+            return jsonify({"error": f"k must be in 1..{MAX_TOP_K}"}), 400
+        try:
+            if k is None:
+                solver = make_solver(request.args.get("solver"))
+            else:
+                # Oversample so enough distinct arrangements survive
+                solver = make_solver(
+                    request.args.get("solver"), num_reads=max(20, TOP_K_READS * k)
+                )
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        if k is not None:
+            solutions = qa_app.run_ikebana_qa_3d_top_k(
+                W,
+                H,
+                FLOWER_LENGTHS,
+                CANDIDATE_LENGTHS,
+                forced_flower=forced,
+                front_azimuth=0,
+                front_elevation=0,
+                k=k,
+                solver=solver,
+            )
+            Q = solutions[0]["Q"] if solutions else {}
+            for solution in solutions:
+                del solution["Q"]
+                solution["arr_id"] = save_base_result(W, H, solution)
+            return jsonify({"k": k, "solutions": solutions, "Q": Q})
+
+        result = None
+        if solution_pools is not None and solver.name == "sqa":
+            result = solution_pools.get((W, H, forced), inputs)
+        if result is None:
+            result = run_ikebana_qa_3d(
+                W,
+                H,
+                FLOWER_LENGTHS,
+                CANDIDATE_LENGTHS,
+                forced_flower=forced,
+                front_azimuth=0,
+                front_elevation=0,
+                solver=solver,
+            )
+
+        # 3) Save arrangements and branches to the database
+        arr_id = save_base_result(W, H, result)
+        # 4) Attach arr_id to the result and return it
+        result["arr_id"] = arr_id
+        return jsonify(result)
+
+    except (SolverBusy, SolverTimeout) as e:
+        return solver_error_response(e)
+    except Exception as e:
+        traceback.print_exc()
+        return jsonify({"error": str(e)}), 500
+
+
+# Run base + extension optimization as one pipeline and save all six branches
+@app.route("/optimize_full")
+def optimize_full():
+    try:
+        vase = request.args.get("vase", default="", type=str)
+        W, H = VASE_SIZES.get(vase, DEFAULT_VASE_SIZE)
         forced = request.args.get("forced_flower", default="", type=str)
+        try:
+            solver = make_solver(request.args.get("solver"))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        # The joint model is too hard for 20 SQA reads to stay feasible, so
+        # it is solved with the exact backend only (the default there)
+        joint = request.args.get("joint", default="1" if solver.name == "exact" else "0")
+        joint = joint == "1"
+        if joint and solver.name != "exact":
+            return jsonify({"error": "joint=1 requires solver=exact"}), 400
 
-        result = run_ikebana_qa_3d(
+        result = run_ikebana_full_optimization(
             W,
             H,
-            flower_lengths,
-            candidate_lengths,
+            FLOWER_LENGTHS,
+            CANDIDATE_LENGTHS,
             forced_flower=forced,
             front_azimuth=0,
             front_elevation=0,
+            joint=joint,
+            solver=solver,
         )
-
-        # 4) Save arrangements and branches to the database
-        conn = database.get_conn()
-        arr_id = database.save_arrangement_metadata(
-            conn, artist="unknown", comment="", vase_width=W, vase_height=H
-        )
-        branch_map = {
-            "main": (
-                result["mainLen"],
-                result["mainAzimuth"],
-                result["mainElevation"],
-            ),
-            "guest": (
-                result["guestLen"],
-                result["guestAzimuth"],
-                result["guestElevation"],
-            ),
-            "middle1": (
-                result["middle1Len"],
-                result["middle1Azimuth"],
-                result["middle1Elevation"],
-            ),
-            "middle2": (
-                result["middle2Len"],
-                result["middle2Azimuth"],
-                result["middle2Elevation"],
-            ),
-        }
-        for role, params in branch_map.items():
-            database.save_branch(conn, arr_id, role, *params)
-        conn.commit()
-        conn.close()
-        # 5) Attach arr_id to the result and return it
-        result["arr_id"] = arr_id
+        branches = {**base_branches(result), **extend_branches(result["extension"])}
+        result["arr_id"] = save_result(W, H, branches)
         return jsonify(result)
 
+    except (SolverBusy, SolverTimeout) as e:
+        return solver_error_response(e)
     except Exception as e:
         traceback.print_exc()
         return jsonify({"error": str(e)}), 500
 
 
+# Background optimization jobs; POST /jobs/optimize answers 503 once
+# IKEBANA_JOB_QUEUE jobs are waiting behind the running ones
+jobs = JobManager(
+    workers=int(os.environ.get("IKEBANA_JOB_WORKERS", 4)),
+    max_queue=int(os.environ.get("IKEBANA_JOB_QUEUE", 16)),
+)
+
+# Reads per SQA batch; progress is reported after each batch
+JOB_BATCH_READS = 20
+JOB_MAX_READS = 2000
+
+
+def optimize_job(job, W, H, forced, solver_name, num_reads):
+    solver = make_solver(solver_name)
+    batches = math.ceil(num_reads / JOB_BATCH_READS) if solver.name == "sqa" else 1
+
+    def progress(batch, best_energy):
+        job.publish(
+            "progress",
+            {"batch": batch, "batches": batches, "best_energy": best_energy},
+        )
+
+    result = run_ikebana_qa_3d(
+        W,
+        H,
+        FLOWER_LENGTHS,
+        CANDIDATE_LENGTHS,
+        forced_flower=forced,
+        front_azimuth=0,
+        front_elevation=0,
+        solver=solvers.ProgressSolver(solver, batches, progress),
+    )
+    result["arr_id"] = save_base_result(W, H, result)
+    return result
+
+
+# Start an optimization job and return its id immediately
+@app.route("/jobs/optimize", methods=["POST"])
+def create_optimize_job():
+    params = {**request.args, **(request.get_json(silent=True) or {})}
+    W, H = VASE_SIZES.get(params.get("vase", ""), DEFAULT_VASE_SIZE)
+    forced = params.get("forced_flower", "")
+    solver_name = params.get("solver")
+    if solver_name is not None and solver_name not in solvers.SOLVERS:
+        return jsonify({"error": f"unknown solver: {solver_name}"}), 400
+    try:
+        num_reads = int(params.get("num_reads", JOB_BATCH_READS))
+    except ValueError:
+        return jsonify({"error": "num_reads must be an integer"}), 400
+    if not 1 <= num_reads <= JOB_MAX_READS:
+        return jsonify({"error": f"num_reads must be in 1..{JOB_MAX_READS}"}), 400
+
+    try:
+        job = jobs.submit(optimize_job, W, H, forced, solver_name, num_reads)
+    except JobsBusy as e:
+        return jsonify({"error": str(e)}), 503, {"Retry-After": "1"}
+    return (
+        jsonify({"id": job.id, "status": job.status, "url": f"/jobs/{job.id}"}),
+        202,
+        {"Location": f"/jobs/{job.id}"},
+    )
+
+
+# Poll a job's status and result
+@app.route("/jobs/<job_id>")
+def get_job(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "unknown job"}), 404
+    return jsonify(job.to_dict())
+
+
+# Stream a job's progress and final result as server-sent events
+@app.route("/jobs/<job_id>/events")
+def job_events(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "unknown job"}), 404
+    return Response(
+        job.stream(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+# URL mapping from /static/3d/<name>.glb to the hashed asset URLs of
+# level of detail ?lod= (0 = authoring resolution)
+@app.route("/assets/manifest.json")
+def asset_manifest():
+    lod = request.args.get("lod", 0, type=int)
+    if lod < 0:
+        return jsonify({"error": "lod must be >= 0"}), 400
+    # Revalidated on every load; only the models themselves are immutable
+    response = jsonify(assets.manifest(lod))
+    response.cache_control.no_cache = True
+    response.add_etag()
+    return response.make_conditional(request)
+
+
+# Serve a hashed model, precompressed when the client accepts it
+@app.route("/assets/<name>")
+def asset(name):
+    # Byte ranges are served from the uncompressed file
+    accept = "" if request.range else request.headers.get("Accept-Encoding", "")
+    resolved = assets.resolve(name, accept)
+    if resolved is None:
+        return jsonify({"error": "unknown asset"}), 404
+    path, encoding, etag = resolved
+    response = send_file(
+        path,
+        mimetype="model/gltf-binary",
+        download_name=name,
+        etag=etag,
+        conditional=True,
+        max_age=ASSET_MAX_AGE,
+    )
+    if encoding is not None:
+        response.headers["Content-Encoding"] = encoding
+    response.vary.add("Accept-Encoding")
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
+# Report cache statistics
+@app.route("/stats")
+def stats():
+    stats = {
+        "model_cache": qa_app.model_cache.stats(),
+        "startup": {"seconds": STARTUP_SECONDS, "imports": lazy_import.report()},
+    }
+    if solution_pools is not None:
+        stats["solution_pools"] = solution_pools.stats()
+    if solver_pool is not None:
+        stats["solver_pool"] = solver_pool.stats()
+    if write_behind is not None:
+        stats["write_behind"] = write_behind.stats()
+    stats["feature_workers"] = feature_workers.stats()
+    stats["jobs"] = jobs.stats()
+    stats["similarity"] = similarity.stats()
+    stats["assets"] = assets.stats()
+    return jsonify(stats)
+
+
 # Optimize and save additional branches
 @app.route("/optimize_extend", methods=["POST"])
 def optimize_extend():
@@ -117,79 +463,293 @@ def optimize_extend():
     base_assignments = data["base_assignments"]
     base_lengths = data["base_lengths"]
     base_angles = data["base_angles"]
-    ext = run_ikebana_extend_optimization(
-        base_assignments,
-        base_lengths,
-        base_angles)
-    conn = database.get_conn()
-    for role in ("middle3", "middle4"):
-        database.save_branch(
-            conn,
-            data["arr_id"],
-            role,
-            ext["lengths"][role],
-            ext["angles"][f"{role}Azimuth"],
-            ext["angles"][f"{role}Elevation"],
-        )
-    conn.commit()
-    conn.close()
+    try:
+        solver = make_solver(data.get("solver"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    try:
+        ext = run_ikebana_extend_optimization(
+            base_assignments,
+            base_lengths,
+            base_angles,
+            solver=solver)
+    except (SolverBusy, SolverTimeout) as e:
+        return solver_error_response(e)
+    branches = extend_branches(ext)
+    write(database.save_branches, data["arr_id"], branches)
+    similarity.update(data["arr_id"], branch_values(branches))
+    # Point-cloud features are extended with the new branches only
+    pointcloud = extend_pointcloud(data["arr_id"], branches)
+    if pointcloud is not None:
+        ext["pointcloud"] = pointcloud
     return jsonify(ext)
 
 
-# Receive point cloud data & extract/save features
+# /arrangements?after=<id>&limit=N: keyset-paginated history, streamed as JSON
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 1000
+
+
+@app.route("/arrangements")
+def list_arrangements():
+    # Converted by hand: args.get(type=...) would turn a malformed value
+    # into the default (or no filter) instead of an error
+    args = request.args
+    try:
+        after = int(args.get("after", 0))
+        limit = int(args.get("limit", DEFAULT_PAGE_SIZE))
+        vase_width = float(args["vase_width"]) if "vase_width" in args else None
+        vase_height = float(args["vase_height"]) if "vase_height" in args else None
+    except ValueError:
+        return jsonify({"error": "after/limit must be integers, vase_width/vase_height numbers"}), 400
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        return jsonify({"error": f"limit must be between 1 and {MAX_PAGE_SIZE}"}), 400
+    vase = request.args.get("vase")
+    if vase is not None:
+        if vase not in VASE_SIZES:
+            return jsonify({"error": f"unknown vase: {vase}"}), 400
+        vase_width, vase_height = VASE_SIZES[vase]
+    rows = database.iter_arrangements(
+        database.get_conn(),
+        after_id=after,
+        limit=limit,
+        vase_width=vase_width,
+        vase_height=vase_height,
+        artist=request.args.get("artist"),
+        created_from=request.args.get("created_from"),
+        created_to=request.args.get("created_to"),
+    )
+
+    def generate():
+        # Rows are written out as the cursor yields them; the cursor for the
+        # next page is only known once the last row has been sent
+        yield '{"items": ['
+        count, last = 0, None
+        for row in rows:
+            yield ("," if count else "") + json.dumps(row, ensure_ascii=False)
+            count, last = count + 1, row["id"]
+        next_after = last if count == limit else None
+        yield f'], "next_after": {json.dumps(next_after)}}}'
+
+    return Response(generate(), mimetype="application/json")
+
+
+# Arrangement with its branches and stored features
+@app.route("/arrangements/<int:arr_id>")
+def get_arrangement(arr_id):
+    detail = database.get_arrangement_detail(database.get_conn(), arr_id)
+    if detail is None:
+        return jsonify({"error": "unknown arrangement"}), 404
+    return jsonify(detail)
+
+
+# /arrangements/<id>/similar?k=N: nearest stored arrangements by feature vector
+MAX_SIMILAR = 100
+
+
+@app.route("/arrangements/<int:arr_id>/similar")
+def similar_arrangements(arr_id):
+    k = request.args.get("k", 10, type=int)
+    if k is None or not 1 <= k <= MAX_SIMILAR:
+        return jsonify({"error": f"k must be between 1 and {MAX_SIMILAR}"}), 400
+    try:
+        neighbours = similarity.similar(arr_id, k)
+    except KeyError:
+        return jsonify({"error": "unknown arrangement"}), 404
+    return jsonify({
+        "arr_id": arr_id,
+        "similar": [{"arr_id": other, "distance": d} for other, d in neighbours],
+    })
+
+
+# Upper bound on the (decompressed) size of an uploaded point cloud
+MAX_UPLOAD_BYTES = int(os.environ.get("IKEBANA_MAX_UPLOAD_BYTES", 256 * 1024 * 1024))
+
+
+# Receive point cloud data; features are extracted in the background
 @app.route("/upload_pointcloud", methods=["POST"])
 def upload_pointcloud():
     arr_id = request.args.get("arr_id", type=int)
     if not arr_id:
         return jsonify({"error": "missing arr_id"}), 400
 
+    if request.content_length and request.content_length > MAX_UPLOAD_BYTES:
+        return jsonify({"error": "point cloud too large"}), 413
+    # Interactive uploads default to the fast tier; recompute_features.py
+    # recomputes them in exact mode later
+    mode = request.args.get("mode", "fast")
+    if mode not in feature_utils.FEATURE_MODES:
+        return jsonify({"error": f"unknown mode: {mode}"}), 400
+    encoding = request.headers.get("Content-Encoding", "identity").lower()
+    if encoding not in ("identity", "gzip"):
+        return jsonify({"error": f"unsupported Content-Encoding: {encoding}"}), 415
+
     os.makedirs("pcds", exist_ok=True)
-    file_path = f"pcds/{arr_id}.ply"
-    data = request.get_data()
-    with open(file_path, "wb") as f:
-        f.write(data)
-    print(f"[DEBUG] Saved PLY for arr_id={arr_id}, bytes={len(data)}")
+    # The body is parsed as it streams in (never buffered or re-read) and
+    # stored once per distinct vertex buffer under pcds/<hash>.pcb, as the
+    # float32 positions the viewer exports (hashed as stored)
+    try:
+        file_path, content_hash, count = pointcloud_io.receive_ply(
+            request.stream, "pcds", MAX_UPLOAD_BYTES, gzipped=encoding == "gzip"
+        )
+    except pointcloud_io.UploadTooLarge:
+        return jsonify({"error": "point cloud too large"}), 413
+    except zlib.error as e:
+        return jsonify({"error": f"invalid gzip body: {e}"}), 400
+    except ValueError as e:
+        return jsonify({"error": f"invalid PLY: {e}"}), 400
+    app.logger.debug("Saved point cloud for arr_id=%s, points=%s", arr_id, count)
+    body, code = attach_pointcloud(arr_id, file_path, content_hash, mode)
+    return jsonify(body), code, {"Location": body["status_url"]}
+
+
+# Synthesize the point cloud of a saved arrangement from its branches and
+# the flower models, then extract its features like an upload
+@app.route("/arrangements/<int:arr_id>/pointcloud", methods=["POST"])
+def synthesize_pointcloud(arr_id):
+    mode = request.args.get("mode", "fast")
+    if mode not in feature_utils.FEATURE_MODES:
+        return jsonify({"error": f"unknown mode: {mode}"}), 400
+    branches = database.get_branches(database.get_conn(), arr_id)
+    if not branches:
+        return jsonify({"error": "unknown arrangement"}), 404
+    try:
+        file_path, content_hash, points = pointcloud_synth.write_cloud(arr_id, branches)
+    except pointcloud_synth.SynthError as e:
+        return jsonify({"error": str(e)}), 422
+    app.logger.debug("Synthesized point cloud for arr_id=%s, points=%s", arr_id, len(points))
+    body, code = attach_pointcloud(arr_id, file_path, content_hash, mode)
+    return jsonify(body), code, {"Location": body["status_url"]}
+
+
+def attach_pointcloud(arr_id, file_path, content_hash, mode, merge=None):
+    """
+    Attach a stored point cloud to arr_id; features are reused or queued.
+    Returns (status body, HTTP status). merge is passed on to
+    FeatureWorkers.submit.
+    """
+    status_url = f"/pointclouds/{arr_id}"
+
+    # Same vertices seen before: reuse their features (an exact result also
+    # serves fast/preview requests)
+    modes = list(feature_utils.FEATURE_MODES)
+    feats = database.find_features_by_hash(
+        database.get_conn(), content_hash, modes[: modes.index(mode) + 1]
+    )
+    if feats is not None:
+        write(database.write_pointcloud, arr_id, file_path, feats, content_hash)
+        similarity.update(arr_id, pointcloud_values(feats))
+        return {
+            "status": "done",
+            "mode": feats["mode"],
+            "content_hash": content_hash,
+            "status_url": status_url,
+        }, 200
+
+    # Features are extracted in the background; poll the status URL for them
+    write(database.write_pointcloud, arr_id, file_path, None, content_hash)
+    feature_workers.submit(arr_id, file_path, mode, merge=merge)
+
+    return {
+        "status": "pending",
+        "mode": mode,
+        "content_hash": content_hash,
+        "status_url": status_url,
+    }, 202
+
 
+def extend_pointcloud(arr_id, new_branches):
+    """
+    Bring the point cloud of arr_id up to date after `new_branches` were
+    added. When the stored cloud is the synthesized cloud of the other
+    branches and has a feature state, only the new branches' points are
+    processed; otherwise the whole cloud is extracted again. Returns the
+    status body, or None if the arrangement has no point cloud yet.
+    """
     conn = database.get_conn()
+    row = database.get_pointcloud_state(conn, arr_id)
+    if row is None:
+        return None
+    status, mode, old_hash, state = row
+    # In write-behind mode the new branches may not be in the table yet
+    base = {
+        role: params for role, params in database.get_branches(conn, arr_id).items()
+        if role not in new_branches
+    }
     try:
-        feats = feature_utils.extract_pointcloud_features(file_path)
-        conn.execute(
-            """
-          INSERT OR REPLACE INTO pointclouds (
-            arr_id, file_path, num_points,
-            centroid_x, centroid_y, centroid_z,
-            bbox_x, bbox_y, bbox_z,
-            hull_volume, hull_area,
-            avg_normal_x, avg_normal_y, avg_normal_z,
-            curvature_mean, curvature_std
-          ) VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)
-        """,
-            (
-                arr_id,
-                file_path,
-                feats["num_points"],
-                *feats["centroid"],
-                *feats["bbox"],
-                feats["hull_volume"],
-                feats["hull_area"],
-                *feats["avg_normal"],
-                feats["curvature_mean"],
-                feats["curvature_std"],
-            ),
+        file_path, content_hash, _ = pointcloud_synth.write_cloud(
+            arr_id, {**base, **new_branches}
         )
+        merge = None
+        if status == "done" and state is not None and base:
+            if pointcloud_synth.arrangement_cloud(base)[1] == old_hash:
+                new_points, _ = pointcloud_synth.arrangement_cloud(new_branches)
+                merge = (state, new_points.astype(float))
+    except pointcloud_synth.SynthError as e:
+        print(f"[WARN] point cloud of arr_id={arr_id} not updated: {e}")
+        return None
+    body, _ = attach_pointcloud(
+        arr_id, file_path, content_hash, mode if merge is not None else "fast", merge
+    )
+    body["incremental"] = merge is not None
+    return body
+
+
+# Extraction status and features of an uploaded point cloud
+@app.route("/pointclouds/<int:arr_id>")
+def pointcloud_status(arr_id):
+    row = database.get_pointcloud(database.get_conn(), arr_id)
+    if row is None:
+        return jsonify({"error": "unknown point cloud"}), 404
+    if row["status"] == "done":
+        row["error_bounds"] = feature_utils.FEATURE_MODE_ERRORS.get(row["feature_mode"], {})
+    return jsonify(row)
+
+
+# Image uploads: stored as images/<arr_id><ext> (the layout backfill.py reads)
+IMAGE_TYPES = {"image/png": ".png", "image/jpeg": ".jpg", "image/bmp": ".bmp"}
+MAX_IMAGE_BYTES = int(os.environ.get("IKEBANA_MAX_IMAGE_BYTES", 32 * 1024 * 1024))
+
+
+# Receive an arrangement photo & extract/save its spatial and color features
+@app.route("/upload_image", methods=["POST"])
+def upload_image():
+    arr_id = request.args.get("arr_id", type=int)
+    if not arr_id:
+        return jsonify({"error": "missing arr_id"}), 400
+    ext = IMAGE_TYPES.get(request.mimetype)
+    if ext is None:
+        return jsonify({"error": f"unsupported Content-Type: {request.mimetype}"}), 415
+    if request.content_length and request.content_length > MAX_IMAGE_BYTES:
+        return jsonify({"error": "image too large"}), 413
+    reduce = request.args.get("reduce", 1, type=int)
+    if reduce not in feature_utils.IMREAD_REDUCED:
+        return jsonify({"error": "reduce must be 1, 2, 4 or 8"}), 400
+
+    # Bounded read: chunked bodies carry no Content-Length to check above
+    try:
+        data = pointcloud_io.read_body(request.stream, MAX_IMAGE_BYTES)
+    except pointcloud_io.UploadTooLarge:
+        return jsonify({"error": "image too large"}), 413
+    try:
+        feats = feature_utils.extract_image_features(data=data, reduce=reduce)
     except Exception as e:
-        print(f"[WARN] extract failed for arr_id={arr_id}: {e}")
-        conn.execute(
-            "INSERT OR REPLACE INTO pointclouds(arr_id, file_path) VALUES (?,?)",
-            (arr_id, file_path),
-        )
-    finally:
-        conn.commit()
-        count = conn.execute("SELECT count(*) FROM pointclouds").fetchone()[0]
-        print(f"[DEBUG] pointclouds rows after commit: {count}")
-        conn.close()
+        return jsonify({"error": f"invalid image: {e}"}), 400
+
+    os.makedirs("images", exist_ok=True)
+    with open(f"images/{arr_id}{ext}", "wb") as f:
+        f.write(data)
+    write(database.write_image_features, arr_id, feats)
+    return jsonify({"status": "ok", **feats}), 200
+
 
-    return jsonify({"status": "ok"}), 200
+# Heavy libraries are imported on first use; unless IKEBANA_PREWARM=0
+# (fast-startup mode) they are also loaded in the background right away
+STARTUP_SECONDS = round(time.perf_counter() - STARTUP_T0, 4)
+print(f"[startup] server ready in {STARTUP_SECONDS}s", flush=True)
+if os.environ.get("IKEBANA_PREWARM", "1") == "1":
+    lazy_import.prewarm(["openjij", "cv2", "open3d"])
+assets.build_in_background()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,129 @@
+"""
+SolutionPools:
+  In-memory pools of precomputed, distinct optimization results per input
+  combination, refilled by a background worker as they are consumed.
+"""
+
+import atexit
+import queue
+import random
+import threading
+import traceback
+
+
+class SolutionPools:
+    """
+    Args:
+        produce: callable(*inputs) -> list of results sorted by energy
+        capacity: maximum number of results kept per pool
+        low_water: a pool is queued for refill when it drops below this size
+    """
+
+    def __init__(self, produce, capacity=32, low_water=16):
+        self.produce = produce
+        self.capacity = capacity
+        self.low_water = low_water
+        self.hits = 0
+        self.misses = 0
+        self._pools = {}
+        self._inputs = {}
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._stop = threading.Event()
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+        atexit.register(self.close)
+        # Process-pool executors (SolverPool) shut themselves down as soon as
+        # the interpreter starts exiting, before any atexit handler runs;
+        # stop at that point too so a refill in flight ends quietly
+        threading._register_atexit(self._stop.set)
+
+    def get(self, key, inputs):
+        """
+        Pop a random result from the pool for `key`, or return None if the
+        pool is still empty. Either way a refill is scheduled when needed.
+        """
+        with self._lock:
+            self._inputs[key] = inputs
+            pool = self._pools.get(key)
+            result = None
+            if pool:
+                result = pool.pop(random.randrange(len(pool)))
+                self.hits += 1
+            else:
+                self.misses += 1
+            if len(self._pools.get(key, ())) < self.low_water:
+                self._schedule(key)
+        return result
+
+    def warm(self, key, inputs):
+        """Queue a pool for filling before its first request."""
+        with self._lock:
+            self._inputs[key] = inputs
+            self._schedule(key)
+
+    def _schedule(self, key):
+        # Called with the lock held
+        if key not in self._pending:
+            self._pending.add(key)
+            self._queue.put(key)
+
+    def close(self, timeout=5.0):
+        """
+        Stop the refill worker after its current batch. Waits at most
+        `timeout` seconds: a refill still sampling is abandoned (the worker
+        is a daemon thread) rather than holding up interpreter exit.
+        """
+        self._stop.set()
+        self._queue.put(None)
+        self._worker.join(timeout)
+
+    def _run(self):
+        while True:
+            key = self._queue.get()
+            if key is None or self._stop.is_set():
+                break
+            with self._lock:
+                inputs = self._inputs[key]
+            try:
+                fresh = self.produce(*inputs)
+            except Exception:
+                # A refill that outlives close() fails once the sampling
+                # backend (e.g. the SolverPool executor) has shut down
+                if self._stop.is_set():
+                    break
+                traceback.print_exc()
+                fresh = []
+            with self._lock:
+                self._pending.discard(key)
+                self._merge(key, fresh)
+
+    def _merge(self, key, fresh):
+        # Re-rank old and new results together, dropping duplicates
+        merged = {}
+        for result in self._pools.get(key, []) + fresh:
+            sig = arrangement_key(result)
+            if sig not in merged or result["energy"] < merged[sig]["energy"]:
+                merged[sig] = result
+        ranked = sorted(merged.values(), key=lambda r: r["energy"])
+        self._pools[key] = ranked[: self.capacity]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "pools": len(self._pools),
+                "sizes": {str(k): len(v) for k, v in self._pools.items()},
+                "pending": len(self._pending),
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+def arrangement_key(result):
+    """Identity of an arrangement: flowers, lengths and angles of every branch."""
+    return tuple(
+        (result["assignments"][role], result[f"{role}Len"])
+        + (result[f"{role}Azimuth"], result[f"{role}Elevation"])
+        for role in ("main", "guest", "middle1", "middle2")
+    )
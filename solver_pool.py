@@ -0,0 +1,94 @@
+"""
+SolverPool:
+  Pre-warmed worker processes that run solver backends on compiled
+  QuboModels, with a bounded queue and per-job timeouts.
+"""
+
+import atexit
+import threading
+from concurrent.futures import TimeoutError as FutureTimeout
+
+import worker_processes
+
+
+class SolverBusy(Exception):
+    """Raised when the job queue is full."""
+
+
+class SolverTimeout(Exception):
+    """Raised when a job does not finish within the timeout."""
+
+
+def _run(solver, model):
+    return solver.sample(model)
+
+
+class SolverPool:
+    """
+    Args:
+        workers: number of worker processes
+        max_queue: jobs allowed to wait beyond the ones being solved
+        timeout: seconds a caller waits for a job before giving up
+    """
+
+    def __init__(self, workers=2, max_queue=8, timeout=30.0):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.submitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self._slots = threading.BoundedSemaphore(workers + max_queue)
+        self._executor = worker_processes.new_executor(workers, preload=["openjij"])
+        atexit.register(self.close)
+
+    def start(self):
+        """Start every worker process and wait until each has imported openjij."""
+        for f in worker_processes.warm(self._executor, self.workers):
+            f.result()
+        return self
+
+    def run(self, solver, model):
+        """Solve `model` with `solver` in a worker and return its (samples, energies)."""
+        if not self._slots.acquire(blocking=False):
+            self.rejected += 1
+            raise SolverBusy("solver queue is full")
+        try:
+            future = self._executor.submit(_run, solver, model)
+        except Exception:
+            self._slots.release()
+            raise
+        self.submitted += 1
+        # The slot is held until the job really finishes, even after a timeout
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            self.timed_out += 1
+            raise SolverTimeout(f"solver did not finish within {self.timeout}s")
+
+    def wrap(self, solver):
+        """Solver-compatible object that runs `solver` in this pool."""
+        return PooledSolver(self, solver)
+
+    def close(self):
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+    def stats(self):
+        return {
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "submitted": self.submitted,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+        }
+
+
+class PooledSolver:
+    def __init__(self, pool, solver):
+        self.pool = pool
+        self.solver = solver
+        self.name = solver.name
+
+    def sample(self, model):
+        return self.pool.run(self.solver, model)
@@ -0,0 +1,144 @@
+"""
+Solver backends for QuboModel.
+
+Every solver exposes `sample(model)` returning `(samples, energies)`:
+an (R, n) 0/1 matrix with one row per read, sorted by ascending energy,
+and the matching QUBO energies.
+
+  SQASolver   - simulated quantum annealing via OpenJij (stochastic)
+  ExactSolver - exact minimum over the one-hot categorical choices
+
+ProgressSolver wraps either one to run several batches and report the
+best energy found after each.
+"""
+
+import os
+
+import numpy as np
+
+from lazy_import import lazy_module
+
+oj = lazy_module("openjij")
+
+
+class SQASolver:
+    name = "sqa"
+
+    def __init__(self, num_reads=20):
+        self.num_reads = num_reads
+
+    def sample(self, model):
+        result = oj.SQASampler().sample_qubo(model.dense(), num_reads=self.num_reads)
+        # Columns of record.sample follow result.variables
+        order = np.argsort(np.asarray(list(result.variables)))
+        samples = result.record.sample[:, order]
+        energies = np.asarray(result.record.energy, dtype=float)
+        rank = np.argsort(energies, kind="stable")
+        return samples[rank], energies[rank]
+
+
+class ExactSolver:
+    """
+    Minimise the QUBO over assignments that pick exactly one candidate per
+    group, by min-sum variable elimination over the groups' unary and
+    pairwise cost tables. Groups are eliminated greedily in the order that
+    keeps the intermediate tables smallest, so the optimum is found
+    deterministically and always satisfies one-hot.
+    """
+
+    name = "exact"
+
+    def __init__(self, num_reads=1, max_states=4_000_000):
+        # num_reads is accepted for interface compatibility; the exact
+        # optimum is always returned as a single read
+        self.max_states = max_states
+
+    def sample(self, model):
+        unary, pairwise = model.categorical_tables()
+        sizes = {name: table.shape[0] for name, table in unary.items()}
+        factors = [((name,), table) for name, table in unary.items()]
+        factors += [(pair, table) for pair, table in pairwise.items()]
+
+        # Forward pass: eliminate groups, remembering the best choice of
+        # each as a function of the groups it was still connected to
+        trace = []
+        remaining = list(unary)
+        while remaining:
+            name = min(remaining, key=lambda g: _scope_states(g, factors, sizes))
+            related = [f for f in factors if name in f[0]]
+            factors = [f for f in factors if name not in f[0]]
+            rest = []
+            for axes, _ in related:
+                rest += [a for a in axes if a != name and a not in rest]
+            scope = rest + [name]
+            if int(np.prod([sizes[a] for a in scope], dtype=np.int64)) > self.max_states:
+                raise ValueError(f"eliminating {name} needs too many states")
+            total = sum(_expand(table, axes, scope, sizes) for axes, table in related)
+            trace.append((name, rest, total.argmin(axis=-1)))
+            factors.append((tuple(rest), total.min(axis=-1)))
+            remaining.remove(name)
+
+        # Backward pass: fix groups in reverse elimination order
+        choices = {}
+        for name, rest, argmin in reversed(trace):
+            choices[name] = int(argmin[tuple(choices[a] for a in rest)])
+        x = model.assignment_vector(choices)
+        return x[None, :], np.array([model.energy(x)])
+
+
+def _scope_states(name, factors, sizes):
+    """Size of the table created by eliminating `name` next."""
+    scope = {name}
+    for axes, _ in factors:
+        if name in axes:
+            scope.update(axes)
+    return int(np.prod([sizes[a] for a in scope], dtype=np.int64))
+
+
+def _expand(table, axes, scope, sizes):
+    """Broadcast a table over `axes` to the axis order of `scope`."""
+    order = sorted(range(len(axes)), key=lambda k: scope.index(axes[k]))
+    table = np.transpose(table, order)
+    view = [sizes[a] if a in axes else 1 for a in scope]
+    return table.reshape(view)
+
+
+class ProgressSolver:
+    """
+    Run `solver` `batches` times on the same model, calling
+    progress(batch, best_energy) after each batch, and merge the reads.
+    """
+
+    def __init__(self, solver, batches, progress):
+        self.solver = solver
+        self.batches = batches
+        self.progress = progress
+        self.name = solver.name
+
+    def sample(self, model):
+        all_samples, all_energies = [], []
+        best = np.inf
+        for batch in range(1, self.batches + 1):
+            samples, energies = self.solver.sample(model)
+            all_samples.append(samples)
+            all_energies.append(energies)
+            best = min(best, float(energies[0]))
+            self.progress(batch, best)
+        samples = np.concatenate(all_samples)
+        energies = np.concatenate(all_energies)
+        rank = np.argsort(energies, kind="stable")
+        return samples[rank], energies[rank]
+
+
+SOLVERS = {
+    SQASolver.name: SQASolver,
+    ExactSolver.name: ExactSolver,
+}
+
+
+def get_solver(name=None, **kwargs):
+    """Instantiate a solver by name (default: $IKEBANA_SOLVER or "sqa")."""
+    name = name or os.environ.get("IKEBANA_SOLVER", "sqa")
+    if name not in SOLVERS:
+        raise ValueError(f"unknown solver: {name}")
+    return SOLVERS[name](**kwargs)
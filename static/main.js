@@ -1,9 +1,17 @@
 import * as THREE from 'https://unpkg.com/three@0.158.0/build/three.module.js';
 import { GLTFLoader } from 'https://unpkg.com/three@0.158.0/examples/jsm/loaders/GLTFLoader.js';
 import { OrbitControls } from 'https://unpkg.com/three@0.158.0/examples/jsm/controls/OrbitControls.js';
-import { PLYExporter } from 'three/examples/jsm/exporters/PLYExporter.js';
 import { GUI } from 'https://unpkg.com/dat.gui@0.7.9/build/dat.gui.module.js';
 
+// Hashed, immutably cached model URLs (/assets/manifest.json) at the level of
+// detail given by ?lod= (0 = full resolution); models missing from the
+// manifest keep their /static path
+const assetLod = new URLSearchParams(window.location.search).get('lod') ?? '1';
+const assetManifest = await fetch(`/assets/manifest.json?lod=${encodeURIComponent(assetLod)}`)
+  .then(res => (res.ok ? res.json() : {}))
+  .catch(() => ({}));
+const assetUrl = path => assetManifest[path]?.url ?? path;
+
 const flowerMeshes = {
   main: [],
   guest: [],
@@ -157,7 +165,7 @@ function loadVase(name) {
     },
   }[name];
   if (!vaseConfig) return;
-  new GLTFLoader().load(vaseConfig.path, gltf => {
+  new GLTFLoader().load(assetUrl(vaseConfig.path), gltf => {
     if (currentVase) scene.remove(currentVase);
     currentVase = gltf.scene;
     currentVase.scale.set(...vaseConfig.scale);
@@ -172,7 +180,7 @@ const degToRad = d => d * Math.PI / 180;
 function loadModelPromise(path, scaleVal, elevDeg, azimDeg, offsetX = 0, offsetZ = 0, branchKey) {
   return new Promise((resolve, reject) => {
     new GLTFLoader().load(
-      path,
+      assetUrl(path),
       gltf => {
         const model = gltf.scene;
         model.traverse(child => {
@@ -281,41 +289,27 @@ function clearScene() {
 
 }
 
-function exportPointCloud(arr_id) {
-  exportGroup.updateMatrixWorld(true);
-  const exporter = new PLYExporter();
-  exporter.parse(
-    exportGroup,
-    plyText => {
-      console.log('PLY length:', plyText.length);
-      fetch(`/upload_pointcloud?arr_id=${arr_id}`, {
-        method: 'POST',
-        headers: { 'Content-Type': 'application/octet-stream' },
-        body: plyText
-      })
-        .then(res => { if (!res.ok) throw new Error(res.status); return res.json(); })
-        .then(data => console.log('upload ok', data))
-        .catch(console.error);
-    },
-    { binary: false, excludeAttributes: ['normal', 'uv', 'color'], excludeIndices: true }
-  );
+//Have the server build the arrangement's point cloud from its saved branches
+function synthesizePointCloud(arr_id) {
+  fetch(`/arrangements/${arr_id}/pointcloud`, { method: 'POST' })
+    .then(res => { if (!res.ok) throw new Error(res.status); return res.json(); })
+    .then(data => console.log('point cloud', data))
+    .catch(console.error);
 }
 
-//Fetch optimization results from the server and update the scene
+//Fetch the full arrangement (base + extension branches) and update the scene
 async function runOptimization(forced) {
   try {
     const res = await fetch(
-      `/optimize?forced_flower=${encodeURIComponent(forced)}&vase=${encodeURIComponent(vaseName)}`);
+      `/optimize_full?forced_flower=${encodeURIComponent(forced)}&vase=${encodeURIComponent(vaseName)}`);
     const result = await res.json();
     if (result.error) throw new Error(result.error);
 
     clearScene();
     await updateSceneWithOptimization(result);
 
-    const ext = await runExtendOptimization(result);
-    if (result.arr_id) exportPointCloud(result.arr_id);
-    rebuildColorController('middle3', ext.assignments.middle3);
-    rebuildColorController('middle4', ext.assignments.middle4);
+    await loadExtensionModels(result.extension);
+    if (result.arr_id) synthesizePointCloud(result.arr_id);
   } catch (err) {
     console.error(err);
   } finally {
@@ -439,33 +433,8 @@ angleFolder
 angleFolder.open();
 
 
-async function runExtendOptimization(baseResult) {
-  const res = await fetch('/optimize_extend', {
-    method: 'POST',
-    headers: { 'Content-Type': 'application/json' },
-    body: JSON.stringify({
-      arr_id: baseResult.arr_id,
-      base_assignments: baseResult.assignments,
-      base_lengths: {
-        main: baseResult.mainLen,
-        guest: baseResult.guestLen,
-        middle1: baseResult.middle1Len,
-        middle2: baseResult.middle2Len
-      },
-      base_angles: {
-        mainAzimuth: baseResult.mainAzimuth,
-        mainElevation: baseResult.mainElevation,
-        guestAzimuth: baseResult.guestAzimuth,
-        guestElevation: baseResult.guestElevation,
-        middle1Azimuth: baseResult.middle1Azimuth,
-        middle1Elevation: baseResult.middle1Elevation,
-        middle2Azimuth: baseResult.middle2Azimuth,
-        middle2Elevation: baseResult.middle2Elevation
-      }
-    })
-  });
-  const ext = await res.json();
-
+//Add the middle3/middle4 branches returned with the base arrangement
+async function loadExtensionModels(ext) {
   await loadModelPromise(
     flowerModelMapping[ext.assignments.middle3],
     ext.lengths.middle3,
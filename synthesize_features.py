@@ -0,0 +1,127 @@
+"""
+Batch job: point-cloud features for saved arrangements that have none,
+synthesized on the server from their branches (pointcloud_synth) instead
+of waiting for a browser upload.
+
+    python synthesize_features.py --workers 4
+
+Clouds are built in this process and stored under pcds/<content_hash>.pcb
+like uploads. Identical designs share one cloud, and its features are
+extracted once over a process pool, or reused from an earlier run.
+Arrangements whose flowers have no model are skipped.
+"""
+
+import argparse
+import os
+import time
+
+import database
+import feature_utils
+import pointcloud_synth
+import worker_processes
+
+
+def _extract_task(task):
+    path, mode = task
+    try:
+        return feature_utils.extract_pointcloud_features(path, mode=mode), None
+    except Exception as e:
+        return None, f"{type(e).__name__}: {e}"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--db", default=database.DB_PATH, help="SQLite database")
+    parser.add_argument("--pcds", default="pcds", help="point-cloud directory")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunksize", type=int, default=4, help="clouds sent to a worker at once")
+    parser.add_argument("--batch", type=int, default=200, help="arrangements per transaction")
+    parser.add_argument("--mode", default="exact", help="point-cloud feature mode")
+    parser.add_argument("--samples", type=int, default=pointcloud_synth.SAMPLES_PER_BRANCH,
+                        help="points per branch")
+    args = parser.parse_args(argv)
+    if args.mode not in feature_utils.FEATURE_MODES:
+        parser.error(f"unknown mode: {args.mode}")
+
+    database.DB_PATH = args.db
+    conn = database.get_conn()
+    todo = database.list_branches_without_pointcloud(conn)
+    print(f"[synth] {len(todo)} arrangements without a point cloud")
+    t0 = time.perf_counter()
+
+    # content_hash -> (file_path, [arr_id])
+    clouds = {}
+    skipped = 0
+    for arr_id, branches in todo.items():
+        try:
+            file_path, content_hash, _ = pointcloud_synth.write_cloud(
+                arr_id, branches, args.pcds, args.samples
+            )
+        except pointcloud_synth.SynthError as e:
+            print(f"[WARN] arr_id={arr_id}: {e}")
+            skipped += 1
+            continue
+        clouds.setdefault(content_hash, (file_path, []))[1].append(arr_id)
+    print(
+        f"[synth] {len(todo) - skipped} clouds ({len(clouds)} distinct) built"
+        f" in {time.perf_counter() - t0:.1f}s, {skipped} skipped"
+    )
+
+    # Rows go in as "pending" first so failures can be recorded and retried
+    # by recompute_features.py
+    with conn:
+        for content_hash, (file_path, arr_ids) in clouds.items():
+            for arr_id in arr_ids:
+                database.write_pointcloud(conn, arr_id, file_path, None, content_hash)
+
+    modes = list(feature_utils.FEATURE_MODES)
+    usable = modes[: modes.index(args.mode) + 1]
+    tasks, done, failed = [], 0, 0
+    with conn:
+        for content_hash, (file_path, arr_ids) in clouds.items():
+            feats = database.find_features_by_hash(conn, content_hash, usable)
+            if feats is None:
+                tasks.append(content_hash)
+                continue
+            for arr_id in arr_ids:
+                database.write_pointcloud(conn, arr_id, file_path, feats)
+            done += len(arr_ids)
+    print(f"[synth] {done} arrangements reuse known features, {len(tasks)} clouds to extract")
+
+    pending = []
+
+    def commit():
+        with conn:
+            for content_hash, feats, error in pending:
+                file_path, arr_ids = clouds[content_hash]
+                for arr_id in arr_ids:
+                    if error is None:
+                        database.write_pointcloud(conn, arr_id, file_path, feats)
+                    else:
+                        database.write_pointcloud_error(conn, arr_id, error)
+        pending.clear()
+
+    with worker_processes.new_executor(args.workers, preload=["open3d"]) as executor:
+        results = executor.map(
+            _extract_task, [(clouds[h][0], args.mode) for h in tasks], chunksize=args.chunksize
+        )
+        for content_hash, (feats, error) in zip(tasks, results):
+            if error is not None:
+                print(f"[WARN] extract failed for {clouds[content_hash][0]}: {error}")
+                failed += len(clouds[content_hash][1])
+            else:
+                done += len(clouds[content_hash][1])
+            pending.append((content_hash, feats, error))
+            if sum(len(clouds[h][1]) for h, _, _ in pending) >= args.batch:
+                commit()
+    if pending:
+        commit()
+    elapsed = time.perf_counter() - t0
+    print(
+        f"[synth] {done} done, {failed} failed, {skipped} skipped in {elapsed:.1f}s"
+        f" ({(done + failed) / max(elapsed, 1e-9):.1f} arrangements/s)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+import os
+import sys
+
+import pytest
+
+# The modules live at the top level of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database  # noqa: E402
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """A fresh database under tmp_path; returns this thread's connection."""
+    monkeypatch.setattr(database, "DB_PATH", str(tmp_path / "test.db"))
+    database.init_db()
+    return database.get_conn()
+
+
+@pytest.fixture(scope="session")
+def server(tmp_path_factory):
+    """The server module, imported once with its startup files under a temp dir."""
+    tmp = tmp_path_factory.mktemp("server")
+    mp = pytest.MonkeyPatch()
+    mp.setenv("IKEBANA_PREWARM", "0")
+    mp.setenv("IKEBANA_ASSET_DIR", str(tmp / "assets"))
+    mp.setattr(database, "DB_PATH", str(tmp / "startup.db"))
+    import server
+
+    yield server
+    mp.undo()
+
+
+@pytest.fixture
+def client(server, db):
+    """Flask test client of the server, on a fresh database."""
+    return server.app.test_client()
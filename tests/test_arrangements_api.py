@@ -0,0 +1,118 @@
+import itertools
+
+import pytest
+
+import database
+
+BRANCHES = {"main": (60, 0, 10, "桜"), "guest": (20, 0, 45, "バラ")}
+
+
+@pytest.fixture
+def arrangements(db):
+    """24 arrangements over two artists and two vases, with created_at ties."""
+    rows = []
+    combos = itertools.cycle(itertools.product(["a", "b"], [(10, 20), (10, 15)]))
+    with db:
+        for k, (artist, (w, h)) in zip(range(24), combos):
+            arr = {"artist": artist, "comment": f"c{k}", "vase_width": w, "vase_height": h}
+            arr_id = database.write_arrangement(db, None, arr, BRANCHES)
+            # Three rows per timestamp, and ids out of created_at order
+            created_at = f"2026-01-{(7 - k // 3):02d} 12:00:00"
+            db.execute("UPDATE arrangements SET created_at = ? WHERE id = ?", (created_at, arr_id))
+            rows.append({"id": arr_id, "artist": artist, "comment": f"c{k}",
+                         "vase_width": w, "vase_height": h, "created_at": created_at})
+    return rows
+
+
+def walk(conn, limit, **filters):
+    """Every page of iter_arrangements, following the cursor."""
+    pages, after = [], 0
+    while True:
+        page = list(database.iter_arrangements(conn, after_id=after, limit=limit, **filters))
+        pages.append(page)
+        if len(page) < limit:
+            return pages
+        after = page[-1]["id"]
+
+
+@pytest.mark.parametrize("limit", [1, 5, 24, 100])
+def test_cursor_walk_returns_every_row_once(db, arrangements, limit):
+    pages = walk(db, limit)
+    assert all(len(page) <= limit for page in pages)
+    assert [row for page in pages for row in page] == arrangements
+
+
+FILTERS = [
+    ({"vase_width": 10, "vase_height": 15}, lambda r: r["vase_height"] == 15),
+    ({"vase_height": 20}, lambda r: r["vase_height"] == 20),
+    ({"artist": "b"}, lambda r: r["artist"] == "b"),
+    ({"created_from": "2026-01-05 12:00:00"}, lambda r: r["created_at"] >= "2026-01-05 12:00:00"),
+    ({"created_to": "2026-01-03 12:00:00"}, lambda r: r["created_at"] <= "2026-01-03 12:00:00"),
+    (
+        {"artist": "a", "created_from": "2026-01-02 12:00:00", "created_to": "2026-01-04 12:00:00"},
+        lambda r: r["artist"] == "a" and "2026-01-02 12:00:00" <= r["created_at"] <= "2026-01-04 12:00:00",
+    ),
+]
+
+
+@pytest.mark.parametrize("filters,keep", FILTERS)
+def test_filters(db, arrangements, filters, keep):
+    expected = [row for row in arrangements if keep(row)]
+    assert expected and len(expected) < len(arrangements)
+    assert [row for page in walk(db, 2, **filters) for row in page] == expected
+
+
+def get_all(client, limit, **params):
+    """Every page of GET /arrangements, following next_after."""
+    items, after, pages = [], 0, 0
+    while after is not None:
+        body = client.get("/arrangements", query_string={**params, "after": after, "limit": limit}).get_json()
+        items += body["items"]
+        after = body["next_after"]
+        pages += 1
+    return items, pages
+
+
+def test_list_route_pages_and_filters(client, arrangements):
+    items, pages = get_all(client, 5)
+    assert items == arrangements
+    assert pages == 5
+    items, _ = get_all(client, 3, vase="筒型花器", artist="a")
+    assert items == [r for r in arrangements if r["vase_height"] == 20 and r["artist"] == "a"]
+
+
+@pytest.mark.parametrize(
+    "query", ["limit=0", "limit=1001", "limit=x", "after=x", "vase_width=x", "vase=none"]
+)
+def test_list_route_rejects_bad_arguments(client, query):
+    assert client.get(f"/arrangements?{query}").status_code == 400
+
+
+def test_detail(client, db, arrangements):
+    arr_id = arrangements[0]["id"]
+    with db:
+        database.write_image_features(db, arr_id, {
+            "centroid_x": 0.5, "centroid_y": 0.25, "balance_score": 0.9,
+            "avg_r": 1.0, "avg_g": 2.0, "avg_b": 3.0,
+        })
+        database.write_pointcloud(db, arr_id, "pcds/x.pcb", None, "h")
+
+    detail = client.get(f"/arrangements/{arr_id}").get_json()
+    assert {k: detail[k] for k in database.ARRANGEMENT_COLUMNS} == arrangements[0]
+    assert detail["branches"] == {
+        role: {"length": l, "azimuth": az, "elevation": el, "flower": f}
+        for role, (l, az, el, f) in BRANCHES.items()
+    }
+    assert detail["features"]["spatial"] == {"centroid_x": 0.5, "centroid_y": 0.25, "balance_score": 0.9}
+    assert detail["features"]["color"] == {"avg_r": 1.0, "avg_g": 2.0, "avg_b": 3.0}
+    assert detail["features"]["pointcloud"]["file_path"] == "pcds/x.pcb"
+    assert detail["features"]["pointcloud"]["status"] == "pending"
+
+    bare = client.get(f"/arrangements/{arrangements[1]['id']}").get_json()
+    assert bare["features"] == {"spatial": None, "color": None, "pointcloud": None}
+
+
+def test_detail_unknown_id_is_404(client, arrangements):
+    response = client.get("/arrangements/999")
+    assert response.status_code == 404
+    assert response.get_json() == {"error": "unknown arrangement"}
@@ -0,0 +1,53 @@
+import os
+
+import numpy as np
+import pytest
+
+import backfill
+import convert_pointclouds
+import database
+import pointcloud_io
+from test_pointcloud_io import ply_bytes
+
+
+@pytest.mark.parametrize("dtype", ["float32", "int16"])
+def test_converts_files_and_rows(tmp_path, db, dtype):
+    pcds = tmp_path / "pcds"
+    pcds.mkdir()
+    clouds = {
+        name: np.random.default_rng(k).normal(size=(1000, 3)).astype(np.float32)
+        for k, name in enumerate(["a", "b", "orphan"])
+    }
+    (pcds / "a.ply").write_bytes(ply_bytes(clouds["a"], "ascii"))
+    (pcds / "b.ply").write_bytes(ply_bytes(clouds["b"]))
+    (pcds / "orphan.ply").write_bytes(ply_bytes(clouds["orphan"]))
+    (pcds / "broken.ply").write_bytes(b"ply\nformat ascii 1.0\n")
+    with db:
+        database.write_pointcloud(db, 1, f"{pcds}/a.ply", None, "ha")
+        database.write_pointcloud(db, 2, f"{pcds}/b.ply", None, "hb")
+        database.write_pointcloud(db, 3, f"{pcds}/b.ply", None, "hb")
+
+    convert_pointclouds.main(
+        ["--db", database.DB_PATH, "--pcds", str(pcds), "--dtype", dtype, "--repeat", "1"]
+    )
+
+    assert sorted(os.listdir(pcds)) == ["a.pcb", "b.pcb", "broken.ply", "orphan.pcb"]
+    assert database.list_pointcloud_paths(db) == {f"{pcds}/a.pcb", f"{pcds}/b.pcb"}
+    assert [path for path, _ in backfill.pointcloud_tasks(str(pcds), db)] == [
+        str(pcds / "a.pcb"),
+        str(pcds / "b.pcb"),
+    ]
+    for name, points in clouds.items():
+        back = pointcloud_io.load_points(str(pcds / f"{name}.pcb"))
+        if dtype == "float32":
+            np.testing.assert_array_equal(back, points)
+        else:
+            assert np.all(np.abs(back - points) <= np.ptp(points, axis=0) / 65534)
+
+
+def test_keep_leaves_ply_files(tmp_path, db):
+    pcds = tmp_path / "pcds"
+    pcds.mkdir()
+    (pcds / "a.ply").write_bytes(ply_bytes(np.ones((10, 3))))
+    convert_pointclouds.main(["--db", database.DB_PATH, "--pcds", str(pcds), "--keep", "--repeat", "1"])
+    assert sorted(os.listdir(pcds)) == ["a.pcb", "a.ply"]
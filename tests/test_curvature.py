@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+
+from feature_utils import estimate_curvatures, o3d
+
+
+def reference_curvatures(pts, radius=0.01, queries=None):
+    """The original per-point loop of extract_pointcloud_features."""
+    pcd = o3d.geometry.PointCloud(o3d.utility.Vector3dVector(pts))
+    pcd_tree = o3d.geometry.KDTreeFlann(pcd)
+    curvatures = []
+    for i in range(len(pts)) if queries is None else queries:
+        _, idx, _ = pcd_tree.search_radius_vector_3d(pcd.points[i], radius)
+        neigh = pts[idx, :]
+        if neigh.shape[0] < 3:
+            continue
+        cov = np.cov(neigh.T) + np.eye(3) * 1e-6
+        eigs = np.linalg.eigvalsh(cov)
+        if np.any(np.isnan(eigs)) or np.any(eigs < 0):
+            continue
+        curvatures.append(eigs[0] / eigs.sum())
+    return np.array(curvatures)
+
+
+@pytest.fixture(scope="module")
+def cloud():
+    """A noisy wavy surface plus isolated points with fewer than 3 neighbours."""
+    rng = np.random.default_rng(0)
+    u = rng.random((3000, 2)) * 0.1
+    surface = np.c_[u, 0.005 * np.sin(u[:, 0] * 60)] + rng.normal(scale=5e-4, size=(3000, 3))
+    lonely = np.array([[1.0, 1.0, 1.0], [2.0, 2.0, 2.0], [2.004, 2.0, 2.0]])
+    return np.concatenate([surface, lonely])
+
+
+def test_all_points_match_reference(cloud):
+    expected = reference_curvatures(cloud)
+    got = estimate_curvatures(cloud)
+    assert len(got) == len(expected) == len(cloud) - 3
+    np.testing.assert_allclose(got, expected, rtol=1e-6, atol=1e-9)
+    assert got.mean() == pytest.approx(expected.mean(), rel=1e-9)
+    assert got.std() == pytest.approx(expected.std(), rel=1e-6)
+
+
+def test_queries_match_reference(cloud):
+    queries = np.random.default_rng(1).choice(len(cloud), 500, replace=False)
+    queries = np.concatenate([queries, [len(cloud) - 1, len(cloud) - 3]])
+    expected = reference_curvatures(cloud, queries=queries)
+    got = estimate_curvatures(cloud, queries=queries)
+    np.testing.assert_allclose(got, expected, rtol=1e-6, atol=1e-9)
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 1000, 10**6])
+def test_chunk_size_does_not_change_result(cloud, chunk_size):
+    np.testing.assert_allclose(
+        estimate_curvatures(cloud, chunk_size=chunk_size), estimate_curvatures(cloud), rtol=1e-12
+    )
+
+
+def test_empty():
+    assert estimate_curvatures(np.empty((0, 3))).shape == (0,)
+    assert estimate_curvatures(np.zeros((4, 3)), queries=[]).shape == (0,)
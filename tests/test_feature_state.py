@@ -0,0 +1,80 @@
+import numpy as np
+import pytest
+
+import database
+import feature_utils
+
+
+def patch(rng, n, x0):
+    """A noisy wavy surface patch starting at x = x0."""
+    u = rng.random((n, 2)) * 0.05
+    return np.c_[u[:, 0] + x0, u[:, 1], 0.004 * np.sin(u[:, 0] * 80)] + rng.normal(
+        scale=5e-4, size=(n, 3)
+    )
+
+
+@pytest.fixture(scope="module")
+def parts():
+    # The parts are further apart than the curvature radius (0.01) and far
+    # enough for the 30 normal neighbours, so per-point statistics of the
+    # union equal those of each part
+    rng = np.random.default_rng(0)
+    return patch(rng, 3000, 0.0), patch(rng, 1500, 0.1)
+
+
+def test_merge_matches_full_extraction(parts):
+    base, added = parts
+    full = feature_utils.extract_pointcloud_features(None, points=np.concatenate(parts))
+    base_feats = feature_utils.extract_pointcloud_features(None, points=base)
+    merged = feature_utils.extend_pointcloud_features(base_feats["state"], added)
+
+    assert merged["num_points"] == full["num_points"] == len(base) + len(added)
+    np.testing.assert_allclose(merged["centroid"], full["centroid"], rtol=1e-12)
+    np.testing.assert_array_equal(merged["bbox"], full["bbox"])
+    # The hull of the two hulls' vertices is the hull of the union
+    assert merged["hull_volume"] == pytest.approx(full["hull_volume"], rel=1e-9)
+    assert merged["hull_area"] == pytest.approx(full["hull_area"], rel=1e-9)
+    assert merged["curvature_mean"] == pytest.approx(full["curvature_mean"], rel=1e-9)
+    assert merged["curvature_std"] == pytest.approx(full["curvature_std"], rel=1e-6)
+    np.testing.assert_allclose(merged["avg_normal"], full["avg_normal"], atol=1e-9)
+    assert merged["effective_points"] == full["effective_points"]
+    assert merged["merged"] and not full["merged"]
+
+
+def test_merge_takes_the_coarser_mode(parts):
+    a = feature_utils.pointcloud_feature_state(parts[0], "exact")
+    b = feature_utils.pointcloud_feature_state(parts[1], "preview")
+    assert feature_utils.merge_feature_states(a, b)["mode"] == "preview"
+    assert feature_utils.merge_feature_states(b, a)["mode"] == "preview"
+
+
+def test_feature_state_round_trip(parts):
+    state = feature_utils.pointcloud_feature_state(parts[0], "fast")
+    back = feature_utils.decode_feature_state(feature_utils.encode_feature_state(state))
+    assert back.keys() == state.keys()
+    for key, value in state.items():
+        if isinstance(value, np.ndarray):
+            np.testing.assert_array_equal(back[key], value)
+        else:
+            assert back[key] == value
+    assert feature_utils.features_from_state(back).keys() == feature_utils.features_from_state(
+        state
+    ).keys()
+
+
+def test_merged_rows_are_not_reused_by_hash(db, parts):
+    conn = db
+    base_feats = feature_utils.extract_pointcloud_features(None, points=parts[0])
+    merged = feature_utils.extend_pointcloud_features(base_feats["state"], parts[1])
+    with conn:
+        database.write_pointcloud(conn, 1, "pcds/a.pcb", merged, "h")
+    assert database.find_features_by_hash(conn, "h", ["exact"]) is None
+    assert database.list_pointclouds_to_recompute(conn) == [(1, "pcds/a.pcb", "h")]
+
+    full = feature_utils.extract_pointcloud_features(None, points=np.concatenate(parts))
+    with conn:
+        database.write_pointcloud(conn, 1, "pcds/a.pcb", full, "h")
+    assert database.find_features_by_hash(conn, "h", ["exact"])["num_points"] == len(
+        np.concatenate(parts)
+    )
+    assert database.list_pointclouds_to_recompute(conn) == []
@@ -0,0 +1,83 @@
+import json
+import threading
+
+import pytest
+
+import database
+from jobs import JobManager, JobsBusy
+
+
+def parse_events(body):
+    """[(event, data)] of an SSE body, keepalive comments skipped."""
+    events = []
+    for block in body.strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines() if not line.startswith(":"))
+        if fields:
+            events.append((fields["event"], json.loads(fields["data"])))
+    return events
+
+
+def test_submit_is_bounded_by_workers_plus_queue():
+    manager = JobManager(workers=1, max_queue=1)
+    release = threading.Event()
+    blocked = [manager.submit(lambda job: release.wait(5)) for _ in range(2)]
+    with pytest.raises(JobsBusy):
+        manager.submit(lambda job: None)
+    assert manager.stats()["rejected"] == 1
+    assert manager.stats()["unfinished"] == 2
+
+    release.set()
+    for job in blocked:
+        list(job.stream())
+    job = manager.submit(lambda job: "ok")
+    list(job.stream())
+    assert job.to_dict()["result"] == "ok"
+    assert manager.stats()["submitted"] == 3
+
+
+def test_failed_job_frees_its_slot():
+    manager = JobManager(workers=1, max_queue=0)
+
+    def fail(job):
+        raise ValueError("boom")
+
+    job = manager.submit(fail)
+    assert parse_events("".join(job.stream()))[-1] == ("error", {"error": "boom"})
+    list(manager.submit(lambda job: None).stream())
+
+
+def test_optimize_job_events_and_result(client):
+    response = client.post("/jobs/optimize", json={"vase": "筒型花器", "solver": "exact"})
+    assert response.status_code == 202
+    job_id = response.get_json()["id"]
+    assert response.headers["Location"] == f"/jobs/{job_id}"
+
+    events = parse_events(client.get(f"/jobs/{job_id}/events").get_data(as_text=True))
+    names = [event for event, _ in events]
+    assert names[0] == "status" and names[-1] == "done"
+    assert "progress" in names
+    result = events[-1][1]
+
+    polled = client.get(f"/jobs/{job_id}").get_json()
+    assert polled["status"] == "done" and polled["error"] is None
+    assert polled["result"] == result
+    detail = database.get_arrangement_detail(database.get_conn(), result["arr_id"])
+    assert detail["branches"]["main"]["length"] == result["mainLen"]
+
+
+def test_unknown_job_is_404(client):
+    assert client.get("/jobs/nope").status_code == 404
+    assert client.get("/jobs/nope/events").status_code == 404
+
+
+def test_full_queue_is_503(client, server, monkeypatch):
+    release = threading.Event()
+    monkeypatch.setattr(server, "jobs", JobManager(workers=1, max_queue=0))
+    monkeypatch.setattr(server, "optimize_job", lambda job, *args: release.wait(5))
+    try:
+        assert client.post("/jobs/optimize").status_code == 202
+        response = client.post("/jobs/optimize")
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "1"
+    finally:
+        release.set()
@@ -0,0 +1,240 @@
+import gzip
+import io
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+import pointcloud_io
+
+
+def ply_bytes(points, fmt="binary_little_endian", extra=False, faces=False):
+    """A PLY file with float x/y/z (plus a uchar red when `extra`)."""
+    props = "property float x\nproperty float y\nproperty float z\n"
+    if extra:
+        props += "property uchar red\n"
+    header = f"ply\nformat {fmt} 1.0\ncomment test\nelement vertex {len(points)}\n{props}"
+    if faces:
+        header += "element face 1\nproperty list uchar int vertex_indices\n"
+    header += "end_header\n"
+    points = np.asarray(points, dtype=np.float32)
+    if fmt == "ascii":
+        rows = [" ".join(f"{v:.9g}" for v in p) + (" 7" if extra else "") for p in points]
+        body = "".join(f"{row}\n" for row in rows).encode("ascii")
+        tail = b"3 0 1 2\n"
+    else:
+        order = "<" if fmt == "binary_little_endian" else ">"
+        fields = [("x", order + "f4"), ("y", order + "f4"), ("z", order + "f4")]
+        if extra:
+            fields.append(("red", "u1"))
+        records = np.zeros(len(points), dtype=fields)
+        for k, a in enumerate("xyz"):
+            records[a] = points[:, k]
+        body = records.tobytes()
+        tail = b"\x03" + np.array([0, 1, 2], dtype=order + "i4").tobytes()
+    return header.encode("ascii") + body + (tail if faces else b"")
+
+
+@pytest.fixture
+def points():
+    return np.random.default_rng(0).normal(size=(5000, 3)).astype(np.float32)
+
+
+@pytest.mark.parametrize("fmt", ["ascii", "binary_little_endian", "binary_big_endian"])
+@pytest.mark.parametrize("extra,faces", [(False, False), (True, True)])
+def test_receive_ply_matches_read_ply_points(tmp_path, points, fmt, extra, faces):
+    data = ply_bytes(points, fmt, extra, faces)
+    (tmp_path / "in.ply").write_bytes(data)
+    expected = pointcloud_io.read_ply_points(str(tmp_path / "in.ply")).astype(np.float32)
+
+    path, content_hash, count = pointcloud_io.receive_ply(
+        io.BytesIO(data), str(tmp_path), 1 << 30, chunk_size=4096
+    )
+    assert count == len(points)
+    assert path == str(tmp_path / f"{content_hash}.pcb")
+    assert content_hash == pointcloud_io.points_hash(expected)
+    np.testing.assert_array_equal(pointcloud_io.load_points(path), expected)
+    assert not [p for p in os.listdir(tmp_path) if p.endswith(".part")]
+
+
+def test_receive_ply_gzip_and_dedupe(tmp_path, points):
+    data = ply_bytes(points)
+    first = pointcloud_io.receive_ply(io.BytesIO(data), str(tmp_path), 1 << 30)
+    second = pointcloud_io.receive_ply(
+        io.BytesIO(gzip.compress(data)), str(tmp_path), 1 << 30, gzipped=True, chunk_size=1000
+    )
+    assert first == second
+    assert sorted(os.listdir(tmp_path)) == [os.path.basename(first[0])]
+
+
+def test_receive_ply_limit_applies_to_inflated_size(tmp_path, points):
+    data = ply_bytes(points)
+    with pytest.raises(pointcloud_io.UploadTooLarge):
+        pointcloud_io.receive_ply(
+            io.BytesIO(gzip.compress(data)), str(tmp_path), len(data) - 1, gzipped=True
+        )
+    assert os.listdir(tmp_path) == []
+
+
+@pytest.mark.parametrize("fmt", ["ascii", "binary_little_endian"])
+def test_receive_ply_truncated(tmp_path, points, fmt):
+    data = ply_bytes(points, fmt)
+    with pytest.raises(pointcloud_io.PlyError):
+        pointcloud_io.receive_ply(io.BytesIO(data[:-40]), str(tmp_path), 1 << 30)
+    assert os.listdir(tmp_path) == []
+
+
+def test_receive_ply_rejects_non_ply(tmp_path):
+    with pytest.raises(pointcloud_io.PlyError):
+        pointcloud_io.receive_ply(io.BytesIO(b"junk\n"), str(tmp_path), 1 << 30)
+
+
+@pytest.mark.parametrize(
+    "header",
+    [
+        b"ply\nformat\n",
+        b"ply\nformat ascii\nend_header\n",
+        b"ply\nelement vertex 1\nproperty float x\nend_header\n",
+        b"ply\nformat ascii 1.0\nelement vertex\nend_header\n",
+        b"ply\nformat ascii 1.0\nelement vertex many\nend_header\n",
+        b"ply\nformat ascii 1.0\nelement vertex -1\nend_header\n",
+        b"ply\nformat ascii 1.0\nelement vertex 1\nproperty float\nend_header\n",
+        b"ply\nformat ascii 1.0\nelement vertex 1\nproperty list uchar\nend_header\n",
+        b"ply\nformat ascii 1.0\nproperty float x\nend_header\n",
+    ],
+)
+def test_malformed_header_is_ply_error(tmp_path, header):
+    with pytest.raises(pointcloud_io.PlyError):
+        pointcloud_io.receive_ply(io.BytesIO(header + b"0 0 0\n"), str(tmp_path), 1 << 30)
+    assert os.listdir(tmp_path) == []
+    (tmp_path / "a.ply").write_bytes(header + b"0 0 0\n")
+    with pytest.raises(pointcloud_io.PlyError):
+        pointcloud_io.read_ply_points(str(tmp_path / "a.ply"))
+
+
+def test_read_body_limit():
+    data = bytes(range(256)) * 100
+    assert pointcloud_io.read_body(io.BytesIO(data), len(data), chunk_size=1000) == data
+    with pytest.raises(pointcloud_io.UploadTooLarge):
+        pointcloud_io.read_body(io.BytesIO(data), len(data) - 1, chunk_size=1000)
+
+
+# Compact point format (.pcb)
+
+def test_points_header_layout(tmp_path, points):
+    path = str(tmp_path / "a.pcb")
+    size = pointcloud_io.write_points(path, points)
+    data = (tmp_path / "a.pcb").read_bytes()
+    assert size == len(data) == 64 + points.size * 4
+    magic, version, dtype_code, compression, _, count, *rest = pointcloud_io.POINTS_HEADER.unpack(
+        data[:64]
+    )
+    assert (magic, version, dtype_code, compression, count) == (b"IKPC", 1, 1, 0, len(points))
+    assert rest == [1.0, 1.0, 1.0, 0.0, 0.0, 0.0]
+    np.testing.assert_array_equal(np.frombuffer(data[64:], "<f4").reshape(-1, 3), points)
+
+
+@pytest.mark.parametrize("compression", [None, "gzip"])
+def test_points_float32_round_trip(tmp_path, points, compression):
+    path = str(tmp_path / "a.pcb")
+    pointcloud_io.write_points(path, points, compression=compression)
+    back = pointcloud_io.read_points(path)
+    assert isinstance(back, np.memmap) == (compression is None)
+    np.testing.assert_array_equal(back, points)
+    loaded = pointcloud_io.load_points(path)
+    assert loaded.dtype == np.float64
+    np.testing.assert_array_equal(loaded, points)
+
+
+@pytest.mark.parametrize("compression", [None, "gzip"])
+def test_points_int16_within_half_a_step(tmp_path, points, compression):
+    path = str(tmp_path / "a.pcb")
+    size = pointcloud_io.write_points(path, points, dtype="int16", compression=compression)
+    if compression is None:
+        assert size == 64 + points.size * 2
+    back = pointcloud_io.load_points(path)
+    step = np.ptp(points, axis=0) / 65534
+    assert np.all(np.abs(back - points) <= step / 2 + 1e-9)
+    np.testing.assert_allclose(back.min(axis=0), points.min(axis=0), atol=1e-9)
+    np.testing.assert_allclose(back.max(axis=0), points.max(axis=0), atol=1e-9)
+
+
+@pytest.mark.skipif(pointcloud_io.zstandard is None, reason="zstandard not installed")
+def test_points_zstd_round_trip(tmp_path, points):
+    path = str(tmp_path / "a.pcb")
+    pointcloud_io.write_points(path, points, compression="zstd")
+    np.testing.assert_array_equal(pointcloud_io.load_points(path), points)
+
+
+@pytest.mark.skipif(pointcloud_io.zstandard is not None, reason="zstandard installed")
+def test_points_zstd_needs_zstandard(tmp_path, points):
+    with pytest.raises(ValueError, match="zstandard"):
+        pointcloud_io.write_points(str(tmp_path / "a.pcb"), points, compression="zstd")
+
+
+def test_points_empty_and_constant(tmp_path):
+    path = str(tmp_path / "a.pcb")
+    pointcloud_io.write_points(path, np.empty((0, 3)))
+    assert pointcloud_io.load_points(path).shape == (0, 3)
+    flat = np.array([[1.0, 2.0, 3.0]] * 4)
+    pointcloud_io.write_points(path, flat, dtype="int16")
+    np.testing.assert_array_equal(pointcloud_io.load_points(path), flat)
+
+
+def test_points_rejects_bad_arguments(tmp_path, points):
+    with pytest.raises(ValueError):
+        pointcloud_io.write_points(str(tmp_path / "a.pcb"), points, dtype="float16")
+    with pytest.raises(ValueError):
+        pointcloud_io.write_points(str(tmp_path / "a.pcb"), points, compression="lz4")
+
+
+@pytest.mark.parametrize("compression", [None, "gzip"])
+def test_points_truncated(tmp_path, points, compression):
+    path = tmp_path / "a.pcb"
+    pointcloud_io.write_points(str(path), points, compression=compression)
+    data = path.read_bytes()
+    for cut in (10, len(data) - 7):
+        path.write_bytes(data[:cut])
+        with pytest.raises(pointcloud_io.PlyError):
+            pointcloud_io.read_points(str(path))
+
+
+def test_points_wrong_magic_version_or_encoding(tmp_path, points):
+    path = tmp_path / "a.pcb"
+    pointcloud_io.write_points(str(path), points)
+    data = bytearray(path.read_bytes())
+    for offset, value in ((0, ord("X")), (4, 2), (5, 9), (6, 9)):
+        corrupt = bytearray(data)
+        corrupt[offset] = value
+        path.write_bytes(bytes(corrupt))
+        with pytest.raises(pointcloud_io.PlyError):
+            pointcloud_io.read_points(str(path))
+
+
+def test_concurrent_writes_of_one_path(tmp_path, points):
+    path = str(tmp_path / "a.pcb")
+
+    def write(_):
+        for _ in range(20):
+            pointcloud_io.write_points(path, points)
+            np.testing.assert_array_equal(pointcloud_io.read_points(path), points)
+
+    with ThreadPoolExecutor(8) as pool:
+        list(pool.map(write, range(8)))
+    assert os.listdir(tmp_path) == ["a.pcb"]
+
+
+def test_store_points_dedupes(tmp_path, points):
+    content_hash = pointcloud_io.points_hash(points)
+    path = pointcloud_io.store_points(points, str(tmp_path), content_hash)
+    assert path == str(tmp_path / f"{content_hash}.pcb")
+    mtime = os.path.getmtime(path)
+    assert pointcloud_io.store_points(points * 2, str(tmp_path), content_hash) == path
+    assert os.path.getmtime(path) == mtime
+    np.testing.assert_array_equal(pointcloud_io.load_points(path), points)
+
+
+def test_load_points_reads_ply(tmp_path, points):
+    (tmp_path / "a.ply").write_bytes(ply_bytes(points))
+    np.testing.assert_array_equal(pointcloud_io.load_points(str(tmp_path / "a.ply")), points)
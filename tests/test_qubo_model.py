@@ -0,0 +1,282 @@
+import itertools
+
+import numpy as np
+import pytest
+
+import app
+from app import build_ikebana_qubo
+
+VASE_SIZES = [(10, 20), (10, 15)]
+FLOWER_LENGTHS = {
+    "桜": 0.4,
+    "リアトリス": 0.4,
+    "ディル": 0.4,
+    "モルセラ": 0.25,
+    "バラ": 0.25,
+    "牡丹": 0.25,
+    "ユリ": 0.25,
+}
+CANDIDATE_LENGTHS = {
+    "桜": [60, 50, 30],
+    "リアトリス": [60, 50, 30],
+    "ディル": [60, 50, 30],
+    "モルセラ": [60, 50, 30],
+    "バラ": [23, 20, 15],
+    "牡丹": [23, 17, 15],
+    "ユリ": [23, 17, 15],
+}
+
+
+def reference_qubo(
+    W,
+    H,
+    flower_lengths,
+    candidate_lengths,
+    forced_flower=None,
+    front_azimuth=0,
+    front_elevation=0,
+    sign_pref_m1=1,
+):
+    """The original dict-based builder of run_ikebana_qa_3d, with the sign fixed."""
+    LIM = 2 * (W + H)
+
+    main_azimuth_candidates = [front_azimuth + delta for delta in [-20, -10, 0, 10, 20]]
+    main_elevation_candidates = [front_elevation + delta for delta in [-10, 0, 10]]
+    guest_azimuth_candidates = [front_azimuth]
+    guest_elevation_candidates = [front_elevation + 45]
+    middle_azimuth_candidates = [front_azimuth + delta for delta in [-50, -40, 40, 50]]
+    middle_elevation_candidates = [front_elevation + delta for delta in [30, 40, 50, 60, 70]]
+
+    flower_list = list(flower_lengths.keys())
+    domain = [
+        (flower, cand_idx, length_val)
+        for flower in flower_list
+        for cand_idx, length_val in enumerate(candidate_lengths[flower])
+    ]
+
+    Q = {}
+
+    def add_q(i, j, val):
+        if i > j:
+            i, j = j, i
+        Q[(i, j)] = Q.get((i, j), 0.0) + val
+
+    sizes = [
+        len(main_azimuth_candidates),
+        len(main_elevation_candidates),
+        len(guest_azimuth_candidates),
+        len(guest_elevation_candidates),
+        len(middle_azimuth_candidates),
+        len(middle_elevation_candidates),
+        len(middle_azimuth_candidates),
+        len(middle_elevation_candidates),
+        len(domain),
+        len(domain),
+        len(domain),
+        len(domain),
+    ]
+    offsets = np.concatenate([[0], np.cumsum(sizes)[:-1]]).tolist()
+    (
+        offset_main_az,
+        offset_main_el,
+        offset_guest_az,
+        offset_guest_el,
+        offset_middle1_az,
+        offset_middle1_el,
+        offset_middle2_az,
+        offset_middle2_el,
+        offset_ext_main,
+        offset_ext_guest,
+        offset_ext_middle1,
+        offset_ext_middle2,
+    ) = offsets
+
+    def add_strict_one_hot(offset, n, A):
+        for i in range(n):
+            add_q(offset + i, offset + i, A)
+            add_q(offset + i, offset + i, -2 * A)
+            for j in range(i + 1, n):
+                add_q(offset + i, offset + j, 2 * A)
+
+    for offset, n, A in zip(offsets, sizes, [60, 60] + [50] * 10):
+        add_strict_one_hot(offset, n, A)
+
+    penalty_same_flower = 50
+    for off1, off2 in (
+        (offset_ext_main, offset_ext_guest),
+        (offset_ext_main, offset_ext_middle1),
+        (offset_ext_guest, offset_ext_middle1),
+    ):
+        for i, (f1, _, _) in enumerate(domain):
+            for j, (f2, _, _) in enumerate(domain):
+                if f1 == f2:
+                    add_q(off1 + i, off2 + j, 2 * penalty_same_flower)
+
+    if forced_flower is not None and forced_flower in flower_list:
+        for off in (offset_ext_main, offset_ext_guest, offset_ext_middle1, offset_ext_middle2):
+            for i, (f, _, _) in enumerate(domain):
+                if f == forced_flower:
+                    add_q(off + i, off + i, -50)
+
+    for i, (_, _, length_val) in enumerate(domain):
+        if length_val > LIM:
+            add_q(offset_ext_main + i, offset_ext_main + i, (length_val - LIM) ** 2 * 1.0)
+
+    for i, (_, _, length_m) in enumerate(domain):
+        for j, (_, _, length_g) in enumerate(domain):
+            add_q(offset_ext_main + i, offset_ext_guest + j, (length_g - length_m / 3.0) ** 2 * 1.0)
+
+    for i, az in enumerate(main_azimuth_candidates):
+        add_q(offset_main_az + i, offset_main_az + i, az**2 * 0.5)
+    for i, el in enumerate(main_elevation_candidates):
+        add_q(offset_main_el + i, offset_main_el + i, el**2 * 0.5)
+
+    for i, main_az in enumerate(main_azimuth_candidates):
+        for j, mid_az in enumerate(middle_azimuth_candidates):
+            diff = abs(mid_az - main_az)
+            if diff > 45.0:
+                cost = (diff - 45.0) ** 2
+                add_q(offset_main_az + i, offset_middle1_az + j, cost * 10.0)
+                add_q(offset_main_az + i, offset_middle2_az + j, cost * 10.0)
+
+    for j, middle_el in enumerate(middle_elevation_candidates):
+        if middle_el < -45:
+            cost = (-45 - middle_el) ** 2
+        elif middle_el > 45:
+            cost = (middle_el - 45) ** 2
+        else:
+            continue
+        add_q(offset_middle1_el + j, offset_middle1_el + j, cost * 10.0)
+        add_q(offset_middle2_el + j, offset_middle2_el + j, cost * 10.0)
+
+    for i, (_, _, length_m) in enumerate(domain):
+        for off in (offset_ext_middle1, offset_ext_middle2):
+            for j, (_, _, length_c) in enumerate(domain):
+                if length_c >= length_m:
+                    add_q(offset_ext_main + i, off + j, (length_c - length_m) ** 2 * 10.0)
+
+    for i, (_, _, length_val) in enumerate(domain):
+        if length_val <= LIM:
+            add_q(offset_ext_main + i, offset_ext_main + i, (LIM - length_val) ** 2 * 0.01)
+
+    sign_pref_m2 = -sign_pref_m1
+    for i, az in enumerate(middle_azimuth_candidates):
+        if sign_pref_m1 * az > 0:
+            add_q(offset_middle1_az + i, offset_middle1_az + i, -45.0)
+    for i, az in enumerate(middle_azimuth_candidates):
+        if sign_pref_m2 * az > 0:
+            add_q(offset_middle2_az + i, offset_middle2_az + i, -45.0)
+
+    branch_offsets = [offset_ext_main, offset_ext_guest, offset_ext_middle1, offset_ext_middle2]
+    for off1, off2 in itertools.combinations(branch_offsets, 2):
+        for i, cand1 in enumerate(domain):
+            for j, cand2 in enumerate(domain):
+                if cand1[2] == cand2[2]:
+                    add_q(off1 + i, off2 + j, 45)
+
+    for i, (_, _, L_middle1) in enumerate(domain):
+        for j, (_, _, L_middle2) in enumerate(domain):
+            diff = L_middle2 - 1.414 * L_middle1
+            add_q(offset_ext_middle1 + i, offset_ext_middle2 + j, 5.0 * diff**2)
+
+    n = sum(sizes)
+    dense = np.zeros((n, n))
+    for (i, j), v in Q.items():
+        dense[i, j] += v
+    return dense
+
+
+@pytest.mark.parametrize("W,H", VASE_SIZES)
+@pytest.mark.parametrize("forced_flower", [None, *FLOWER_LENGTHS])
+@pytest.mark.parametrize("sign", [-1, 1])
+def test_matches_dict_builder(W, H, forced_flower, sign):
+    model = build_ikebana_qubo(
+        W, H, FLOWER_LENGTHS, CANDIDATE_LENGTHS, forced_flower=forced_flower, sign_pref_m1=sign
+    )
+    expected = reference_qubo(
+        W, H, FLOWER_LENGTHS, CANDIDATE_LENGTHS, forced_flower=forced_flower, sign_pref_m1=sign
+    )
+    np.testing.assert_allclose(model.dense(), expected, rtol=1e-12, atol=1e-9)
+
+
+@pytest.mark.parametrize("front", [(30, 0), (-20, 15)])
+def test_matches_dict_builder_with_front_angles(front):
+    kwargs = dict(forced_flower="ディル", front_azimuth=front[0], front_elevation=front[1])
+    model = build_ikebana_qubo(10, 20, FLOWER_LENGTHS, CANDIDATE_LENGTHS, **kwargs)
+    expected = reference_qubo(10, 20, FLOWER_LENGTHS, CANDIDATE_LENGTHS, **kwargs)
+    np.testing.assert_allclose(model.dense(), expected, rtol=1e-12, atol=1e-9)
+
+
+def test_upper_triangular():
+    Q = build_ikebana_qubo(10, 15, FLOWER_LENGTHS, CANDIDATE_LENGTHS).dense()
+    assert not np.any(np.tril(Q, k=-1))
+
+
+def random_choices(model, rng):
+    return {name: int(rng.integers(model.size(name))) for name in model.groups}
+
+
+def test_decode_samples_flags_one_hot_violations():
+    model = build_ikebana_qubo(10, 15, FLOWER_LENGTHS, CANDIDATE_LENGTHS)
+    x = model.assignment_vector(random_choices(model, np.random.default_rng(0)))
+    empty, double = x.copy(), x.copy()
+    empty[model.offset("guest") : model.offset("guest") + model.size("guest")] = 0
+    double[model.offset("main_az") + (model.choice(x, "main_az") + 1) % model.size("main_az")] = 1
+    choices, feasible = model.decode_samples(np.stack([x, empty, double]))
+    assert feasible.tolist() == [True, False, False]
+    assert choices[0].tolist() == [model.choice(x, name) for name in model.groups]
+
+
+def test_distinct_solutions_drops_infeasible_and_repeated_reads():
+    model = build_ikebana_qubo(10, 15, FLOWER_LENGTHS, CANDIDATE_LENGTHS)
+    rng = np.random.default_rng(1)
+    a, b, c = (model.assignment_vector(random_choices(model, rng)) for _ in range(3))
+    infeasible = np.zeros(model.n, dtype=int)
+    samples = np.stack([c, a, infeasible, b, a, c, b])
+    energies = np.array([3.0, 5.0, -100.0, 2.0, 1.0, 4.0, 2.0])
+    # a at 1.0 (row 4), b at 2.0 (first of rows 3/6), c at 3.0 (row 0)
+    assert model.distinct_solutions(samples, energies).tolist() == [4, 3, 0]
+    assert model.distinct_solutions(samples[[2]], energies[[2]]).size == 0
+
+
+class ReplaySolver:
+    """Returns fixed reads of `choices` (plus infeasible ones) with their model energies."""
+
+    def __init__(self, choices, infeasible=2):
+        self.choices = choices
+        self.infeasible = infeasible
+
+    def sample(self, model):
+        samples = [model.assignment_vector(c) for c in self.choices]
+        energies = [model.energy(x) for x in samples]
+        samples += [np.zeros(model.n, dtype=int)] * self.infeasible
+        energies += [-1e9] * self.infeasible
+        return np.array(samples), np.array(energies)
+
+
+@pytest.mark.parametrize("k", [1, 5, 100])
+def test_top_k_returns_distinct_feasible_reads_by_energy(k):
+    model = build_ikebana_qubo(10, 20, FLOWER_LENGTHS, CANDIDATE_LENGTHS)
+    rng = np.random.default_rng(2)
+    distinct = [random_choices(model, rng) for _ in range(12)]
+    # Every read repeated, in a shuffled order
+    reads = [distinct[i] for i in rng.permutation(np.repeat(np.arange(12), 3))]
+    results = app.run_ikebana_qa_3d_top_k(
+        10, 20, FLOWER_LENGTHS, CANDIDATE_LENGTHS, k=k, solver=ReplaySolver(reads)
+    )
+
+    energies = [r["energy"] for r in results]
+    assert len(results) == min(k, 12)
+    assert energies == sorted(energies)
+    assert all(np.isfinite(energies)) and min(energies) > -1e9
+    arrangements = {
+        repr([(key, r[key]) for key in sorted(r) if key not in ("energy", "Q", "flowers")])
+        for r in results
+    }
+    assert len(arrangements) == len(results)
+    # The best k of the distinct arrangements, whichever sign model was picked
+    models = app.get_ikebana_models(10, 20, FLOWER_LENGTHS, CANDIDATE_LENGTHS)
+    expected = [
+        sorted(m.energy(m.assignment_vector(c)) for c in distinct)[:k] for m in models.values()
+    ]
+    assert any(np.allclose(energies, e) for e in expected)
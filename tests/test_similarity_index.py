@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+
+from similarity_index import COLUMNS, SimilarityIndex
+
+
+def brute_force(index, vectors, arr_id):
+    """(distance, arr_id) to every other arrangement, scaled like the index, nearest first."""
+    ids = np.array(sorted(vectors))
+    X = np.array([vectors[i] for i in ids])
+    Z = np.nan_to_num((X - index._center) / index._scale, nan=0.0)
+    d = np.sqrt(((Z - Z[ids == arr_id]) ** 2).sum(axis=1))
+    order = np.argsort(d, kind="stable")
+    return [(float(d[i]), int(ids[i])) for i in order if ids[i] != arr_id]
+
+
+def random_vectors(rng, n):
+    """Vectors on a coarse grid (many equal distances), with exact repeats and missing values."""
+    X = rng.integers(0, 3, (n, len(COLUMNS))).astype(float)
+    X[rng.random(n) < 0.3] = X[0]
+    X[rng.random(X.shape) < 0.05] = np.nan
+    return {arr_id: x for arr_id, x in enumerate(X, start=1)}
+
+
+def check(index, vectors, k, queries):
+    for arr_id in queries:
+        got = index.similar(arr_id, k)
+        expected = brute_force(index, vectors, arr_id)
+        assert [d for _, d in got] == pytest.approx([d for d, _ in expected[:k]])
+        # Ties may be broken differently; every id must be at its true distance
+        true = {other: d for d, other in expected}
+        assert len({other for other, _ in got}) == len(got)
+        assert all(true[other] == pytest.approx(d) for other, d in got)
+
+
+@pytest.mark.parametrize("n", [40, 600])
+def test_similar_matches_brute_force(n):
+    rng = np.random.default_rng(n)
+    vectors = random_vectors(rng, n)
+    index = SimilarityIndex(min_tree_rows=64)
+    for arr_id, x in vectors.items():
+        index.update(arr_id, dict(zip(COLUMNS, x)))
+    assert index.stats()["arrangements"] == n
+    assert index.stats()["distinct_vectors"] < n
+    check(index, vectors, 10, rng.choice(list(vectors), 40, replace=False))
+    check(index, vectors, n + 5, [1])
+
+
+def test_moved_vectors_stay_exact():
+    rng = np.random.default_rng(3)
+    vectors = random_vectors(rng, 400)
+    index = SimilarityIndex(min_tree_rows=64, rebuild_fraction=0.5)
+    for arr_id, x in vectors.items():
+        index.update(arr_id, dict(zip(COLUMNS, x)))
+    # Partial updates move arrangements out of tree groups (some left empty)
+    for arr_id in rng.choice(list(vectors), 60, replace=False):
+        vectors[arr_id] = vectors[arr_id].copy()
+        vectors[arr_id][:3] = rng.integers(5, 8, 3)
+        index.update(arr_id, dict(zip(COLUMNS[:3], vectors[arr_id][:3])))
+    assert index.stats()["pending"] > 0
+    check(index, vectors, 10, rng.choice(list(vectors), 40, replace=False))
+
+
+def test_empty_and_single():
+    index = SimilarityIndex()
+    assert len(index) == 0
+    with pytest.raises(KeyError):
+        index.similar(1)
+    index.update(1, {"main_length": 60.0})
+    assert index.similar(1) == []
+    with pytest.raises(KeyError):
+        index.similar(2)
@@ -0,0 +1,55 @@
+import threading
+
+from solution_pool import SolutionPools
+
+
+def result(energy, main_len):
+    return {
+        "energy": energy,
+        "assignments": {role: "桜" for role in ("main", "guest", "middle1", "middle2")},
+        **{f"{role}Len": main_len for role in ("main", "guest", "middle1", "middle2")},
+        **{f"{role}Azimuth": 0 for role in ("main", "guest", "middle1", "middle2")},
+        **{f"{role}Elevation": 0 for role in ("main", "guest", "middle1", "middle2")},
+    }
+
+
+def test_refill_keeps_the_best_distinct_results():
+    refilled = threading.Event()
+
+    def produce(n):
+        return [result(float(i % 3), i % 3) for i in range(n)]
+
+    pools = SolutionPools(produce, capacity=2, low_water=1)
+    merge = pools._merge
+    pools._merge = lambda key, fresh: (merge(key, fresh), refilled.set())
+    try:
+        assert pools.get("k", (10,)) is None
+        assert refilled.wait(5)
+        assert pools.stats()["sizes"] == {"k": 2}
+        assert pools.get("k", (10,))["energy"] in (0.0, 1.0)
+    finally:
+        pools.close()
+
+
+def test_refill_failing_after_close_is_silent(capsys):
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def produce():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        raise RuntimeError("cannot schedule new futures after shutdown")
+
+    pools = SolutionPools(produce)
+    pools.warm("a", ())
+    assert started.wait(5)
+    pools.warm("b", ())
+    pools.close(timeout=0.05)
+    assert pools._worker.is_alive()
+    release.set()
+    pools._worker.join(5)
+    assert not pools._worker.is_alive()
+    # "b" was queued before close() but is not produced after it
+    assert len(calls) == 1
+    assert "RuntimeError" not in capsys.readouterr().err
@@ -0,0 +1,106 @@
+import itertools
+
+import numpy as np
+import pytest
+
+import app
+import app_extend
+from app import build_ikebana_qubo
+from qubo_model import QuboModel
+from solvers import ExactSolver
+
+
+def random_model(rng, n_groups=5):
+    model = QuboModel()
+    names = [f"g{k}" for k in range(n_groups)]
+    for name in names:
+        model.add_group(name, range(int(rng.integers(2, 5))))
+        model.add_one_hot(name, 50)
+        model.add_linear(name, rng.normal(size=model.size(name)))
+    for g, h in itertools.combinations(names, 2):
+        if rng.random() < 0.6:
+            model.add_quadratic(g, h, rng.normal(size=(model.size(g), model.size(h))))
+    return model
+
+
+def brute_force(model):
+    """Lowest energy over every one-hot assignment."""
+    names = list(model.groups)
+    best = np.inf
+    for picks in itertools.product(*(range(model.size(g)) for g in names)):
+        x = model.assignment_vector(dict(zip(names, picks)))
+        best = min(best, model.energy(x))
+    return best
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_exact_matches_brute_force(seed):
+    model = random_model(np.random.default_rng(seed))
+    samples, energies = ExactSolver().sample(model)
+    assert samples.shape == (1, model.n)
+    choices, feasible = model.decode_samples(samples)
+    assert feasible.all()
+    assert energies[0] == pytest.approx(model.energy(samples[0]))
+    assert energies[0] == pytest.approx(brute_force(model))
+
+
+def test_exact_is_feasible_on_ikebana_model():
+    flowers = {"桜": 0.4, "ディル": 0.4, "バラ": 0.25}
+    lengths = {"桜": [60, 50, 30], "ディル": [60, 50, 30], "バラ": [23, 20, 15]}
+    model = build_ikebana_qubo(10, 20, flowers, lengths)
+    samples, _ = ExactSolver().sample(model)
+    _, feasible = model.decode_samples(samples)
+    assert feasible.all()
+
+
+def test_max_states_guard():
+    model = random_model(np.random.default_rng(0))
+    with pytest.raises(ValueError, match="too many states"):
+        ExactSolver(max_states=1).sample(model)
+
+
+FLOWERS = {"桜": 0.4, "ディル": 0.4, "バラ": 0.25}
+LENGTHS = {"桜": [60, 50, 30], "ディル": [60, 50, 30], "バラ": [23, 20, 15]}
+
+
+@pytest.mark.parametrize("sign_m1,sign_m3", [(-1, -1), (-1, 1), (1, -1), (1, 1)])
+def test_exact_joint_optimum_is_a_feasible_arrangement(sign_m1, sign_m3):
+    base = build_ikebana_qubo(10, 20, FLOWERS, LENGTHS, sign_pref_m1=sign_m1)
+    model = app_extend.build_joint_qubo(base, sign_m3)
+    samples, energies = ExactSolver().sample(model)
+    _, feasible = model.decode_samples(samples)
+    assert feasible.all()
+
+    payload = app_extend.decode_extend_solution(model, samples[0])
+    assert None not in payload["assignments"].values()
+    assert None not in payload["angles"].values()
+    # The equal-length penalty (80) outweighs every length/angle cost it
+    # could save here, so the two new branches never share a length
+    assert payload["lengths"]["middle3"] != payload["lengths"]["middle4"]
+
+    # With the base fixed at the joint optimum, the extension part is the
+    # optimum of the sequential extend model for that base
+    base_payload = app.decode_ikebana_solution(model, samples[0], energies[0], FLOWERS)
+    extend_model = app_extend.build_extend_qubo(
+        {b: base_payload[f"{b}Len"] for b in app_extend.base_keys},
+        base_payload,
+        sign_pref_m3=sign_m3,
+    )
+    ext_choices = {name: model.choice(samples[0], name) for name in extend_model.groups}
+    _, (best,) = ExactSolver().sample(extend_model)
+    assert extend_model.energy(extend_model.assignment_vector(ext_choices)) == pytest.approx(best)
+
+
+def test_sequential_and_joint_payloads_have_the_same_keys():
+    results = [
+        app_extend.run_ikebana_full_optimization(
+            10, 20, FLOWERS, LENGTHS, joint=joint, solver=ExactSolver()
+        )
+        for joint in (False, True)
+    ]
+    sequential, joint = results
+    assert sequential.keys() == joint.keys()
+    assert sequential["extension"].keys() == joint["extension"].keys()
+    for key in ("assignments", "lengths", "angles"):
+        assert sequential["extension"][key].keys() == joint["extension"][key].keys()
+    assert sequential["assignments"].keys() == joint["assignments"].keys()
@@ -0,0 +1,81 @@
+import threading
+
+import pytest
+
+import database
+from write_behind import WriteBehindWriter
+
+ARR = {"artist": "a", "comment": "", "vase_width": 10, "vase_height": 20}
+BRANCHES = {"main": (60, 0, 0), "guest": (20, 0, 45)}
+
+
+@pytest.fixture
+def writer(db):
+    writer = WriteBehindWriter(batch_size=16, id_block=8)
+    yield writer
+    writer.close()
+
+
+def arrangement_ids(conn):
+    return [row[0] for row in conn.execute("SELECT id FROM arrangements ORDER BY id")]
+
+
+def test_reserved_ids_do_not_collide_with_autoincrement(db, writer):
+    reserved = [writer.allocate_arr_id() for _ in range(20)]
+    assert reserved == list(range(1, 21))
+    direct = [database.save_arrangement(ARR, BRANCHES) for _ in range(3)]
+    assert min(direct) > max(reserved)
+    # The rest of the current block is still handed out after direct inserts
+    reserved += [writer.allocate_arr_id() for _ in range(10)]
+    assert not set(reserved) & set(direct)
+    assert len(set(reserved)) == len(reserved)
+
+    for arr_id in reserved:
+        writer.submit(database.write_arrangement, arr_id, ARR, BRANCHES)
+    writer.flush()
+    assert writer.failed == 0
+    assert arrangement_ids(db) == sorted(reserved + direct)
+    assert database.save_arrangement(ARR, BRANCHES) > max(reserved + direct)
+
+
+def test_flush_and_close_write_everything(db, writer):
+    for _ in range(100):
+        writer.submit(database.write_arrangement, writer.allocate_arr_id(), ARR, BRANCHES)
+    writer.flush()
+    assert len(arrangement_ids(db)) == 100
+    assert writer.stats()["queued"] == 0
+
+    for _ in range(50):
+        writer.submit(database.write_arrangement, writer.allocate_arr_id(), ARR, BRANCHES)
+    writer.close()
+    assert len(arrangement_ids(db)) == 150
+    assert db.execute("SELECT COUNT(*) FROM branches").fetchone()[0] == 300
+    assert writer.written == 150 and writer.failed == 0
+
+
+def test_failed_batch_is_retried_one_write_at_a_time(db, writer, capsys):
+    release = threading.Event()
+
+    def blocker(conn):
+        release.wait(5)
+
+    def bad(conn, arr_id):
+        database.write_arrangement(conn, arr_id, ARR, BRANCHES)
+        raise ValueError("bad write")
+
+    # Everything below queues up behind the blocker and is committed together
+    writer.submit(blocker)
+    ids = [writer.allocate_arr_id() for _ in range(6)]
+    for arr_id in ids[:3]:
+        writer.submit(database.write_arrangement, arr_id, ARR, BRANCHES)
+    writer.submit(bad, ids[3])
+    for arr_id in ids[4:]:
+        writer.submit(database.write_arrangement, arr_id, ARR, BRANCHES)
+    release.set()
+    writer.flush()
+
+    assert writer.failed == 1
+    assert writer.written == 1 + 5
+    # The bad write's own insert was rolled back with it
+    assert arrangement_ids(db) == ids[:3] + ids[4:]
+    assert "ValueError: bad write" in capsys.readouterr().err
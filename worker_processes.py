@@ -0,0 +1,37 @@
+"""
+Process pools for CPU-bound work: the server's SolverPool and
+FeatureWorkers, and the backfill.py / synthesize_features.py batch jobs.
+
+Workers are forked, so server.py is not re-imported (and the database
+not re-initialised) in every worker, and each worker imports its heavy
+modules once at start instead of once per job.
+"""
+
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import lazy_import
+
+
+def _init_worker(modules):
+    for name in modules:
+        lazy_import.load(name)
+
+
+def _warm():
+    return True
+
+
+def new_executor(workers, preload=()):
+    """ProcessPoolExecutor of forked workers that import `preload` on start."""
+    return ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("fork"),
+        initializer=_init_worker,
+        initargs=(tuple(preload),),
+    )
+
+
+def warm(executor, workers):
+    """Start every worker of `executor` now; returns futures done once each is ready."""
+    return [executor.submit(_warm) for _ in range(workers)]
@@ -0,0 +1,105 @@
+"""
+WriteBehindWriter:
+  Single background thread that applies database writes queued by
+  request threads, group-committing many of them per transaction.
+"""
+
+import atexit
+import queue
+import threading
+import traceback
+
+import database
+
+
+class WriteBehindWriter:
+    """
+    Args:
+        batch_size: maximum number of queued writes per transaction
+        id_block: how many arrangement ids to reserve at a time
+    """
+
+    def __init__(self, batch_size=256, id_block=64):
+        self.batch_size = batch_size
+        self.id_block = id_block
+        self.written = 0
+        self.failed = 0
+        self.batches = 0
+        self._queue = queue.Queue()
+        self._ids = iter(())
+        self._id_lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def allocate_arr_id(self):
+        """Next arrangement id from a reserved block (no write on the request path
+        except once per block)."""
+        with self._id_lock:
+            arr_id = next(self._ids, None)
+            if arr_id is None:
+                self._ids = iter(range(*database.reserve_arrangement_ids(self.id_block)))
+                arr_id = next(self._ids)
+            return arr_id
+
+    def submit(self, fn, *args):
+        """Queue fn(conn, *args) to run inside a writer transaction."""
+        self._queue.put((fn, args))
+
+    def flush(self):
+        """Block until every write queued so far is committed."""
+        self._queue.join()
+
+    def close(self):
+        """Flush outstanding writes and stop the writer thread."""
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            batch = [item]
+            # Group-commit whatever else is already waiting
+            while item is not None and len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                batch.append(item)
+            writes = [w for w in batch if w is not None]
+            if writes:
+                self._apply(writes)
+            for _ in batch:
+                self._queue.task_done()
+            if len(writes) < len(batch):
+                return
+
+    def _apply(self, writes):
+        conn = database.get_conn()
+        try:
+            with conn:
+                for fn, args in writes:
+                    fn(conn, *args)
+            self.written += len(writes)
+            self.batches += 1
+            return
+        except Exception:
+            traceback.print_exc()
+        # Retry one by one so a single bad write does not drop the batch
+        for fn, args in writes:
+            try:
+                with conn:
+                    fn(conn, *args)
+                self.written += 1
+            except Exception:
+                traceback.print_exc()
+                self.failed += 1
+
+    def stats(self):
+        return {
+            "queued": self._queue.qsize(),
+            "written": self.written,
+            "failed": self.failed,
+            "batches": self.batches,
+        }